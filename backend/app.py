@@ -3,27 +3,38 @@ Flask application for AI Helpdesk with FAISS Knowledge Base.
 """
 import os
 import threading
-from flask import Flask, jsonify, send_from_directory, send_file
+import time
+from flask import Flask, Response, g, jsonify, request, send_from_directory, send_file
 from flask_cors import CORS
+from werkzeug.middleware.proxy_fix import ProxyFix
 from dotenv import load_dotenv
 from routes.tickets import tickets_bp
 from routes.agent import agent_bp
+from routes.debug import debug_bp
+from core.metrics import metrics, HTTP_REQUEST_SECONDS
+from core import tracing, deadline
+from core.profiling import profiler, is_admin
+from core.capture import capture
+from core.jobs import job_queue
+from core.structured_log import get_logger
 
 # Load environment variables
 load_dotenv()
 
+log = get_logger('app')
+
 def initialize_knowledge_base_async():
     """Initialize knowledge base in background thread"""
     try:
         from knowledge_base import initialize_knowledge_base
-        print("🔄 Initializing FAISS knowledge base...")
+        log.info("Initializing FAISS knowledge base")
         success = initialize_knowledge_base()
         if success:
-            print("✅ Knowledge base initialized successfully!")
+            log.info("Knowledge base initialized")
         else:
-            print("❌ Failed to initialize knowledge base")
-    except Exception as e:
-        print(f"❌ Error initializing knowledge base: {e}")
+            log.error("Failed to initialize knowledge base")
+    except Exception:
+        log.exception("Error initializing knowledge base")
 
 def create_app():
     """Create and configure Flask application."""
@@ -31,6 +42,12 @@ def create_app():
     static_folder = 'static' if os.path.exists('static') else None
     app = Flask(__name__, static_folder=static_folder)
     
+    # Behind a reverse proxy (Railway adds one) remote_addr is the proxy; trust that many
+    # X-Forwarded-For / -Proto hops so per-client limits and sessions key on the real client
+    proxy_hops = int(os.getenv('TRUSTED_PROXY_HOPS', '1' if os.getenv('RAILWAY_ENVIRONMENT') else '0'))
+    if proxy_hops > 0:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=proxy_hops, x_proto=proxy_hops)
+    
     # Configure CORS
     cors_origin = os.getenv('CORS_ORIGIN', 'http://localhost:5173')
     CORS(app, origins=[cors_origin])
@@ -42,6 +59,65 @@ def create_app():
     # Register blueprints
     app.register_blueprint(tickets_bp)
     app.register_blueprint(agent_bp)
+    app.register_blueprint(debug_bp)
+    
+    # Background agent jobs; every worker accepts and reports them, the one owning the queue runs them
+    job_queue.start()
+    
+    @app.before_request
+    def start_request_timer():
+        g.request_started = time.perf_counter()
+        g.request_wall_time = time.time()
+        g.deadline_token = deadline.start(deadline.budget_from_headers(request.headers))
+        g.trace, g.trace_token = tracing.start_trace(
+            f"{request.method} {request.path}", request.headers.get('X-Trace-Id'),
+            endpoint=request.endpoint
+        )
+        # Admin requests can ask for a profile of themselves, saved under the trace id
+        mode = request.headers.get('X-Profile')
+        if mode and is_admin(request.headers):
+            g.profile = profiler.start_request(mode, g.trace.trace_id)
+    
+    @app.after_request
+    def record_request_latency(response):
+        # Streaming responses are timed until headers are sent, not until the stream ends
+        started = g.get('request_started')
+        trace = g.get('trace')
+        if started is not None:
+            elapsed = time.perf_counter() - started
+            HTTP_REQUEST_SECONDS.observe(
+                elapsed,
+                endpoint=request.endpoint or 'unmatched',
+                method=request.method,
+                status=response.status_code
+            )
+            if capture.wants(request.path):
+                capture.record(request, response, g.request_wall_time, elapsed, trace.trace_id if trace else None)
+        if trace is not None:
+            response.headers['X-Trace-Id'] = trace.trace_id
+            trace.root.set(status=response.status_code)
+        profile = g.get('profile')
+        if profile is not None:
+            response.headers['X-Profile-Id'] = profile.filename
+        return response
+    
+    @app.teardown_request
+    def finish_trace(exc):
+        if 'deadline_token' in g:
+            deadline.reset(g.pop('deadline_token'))
+        profile = g.pop('profile', None)
+        if profile is not None:
+            profiler.finish_request(profile)
+        trace = g.pop('trace', None)
+        if trace is not None:
+            if exc is not None:
+                trace.error = True
+            tracing.end_trace(trace, g.pop('trace_token', None))
+    
+    @app.route('/api/metrics', methods=['GET'])
+    def prometheus_metrics():
+        """Metrics in Prometheus text exposition format"""
+        return Response(metrics.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
     
     @app.route('/api/health', methods=['GET'])
     def health_check():
@@ -69,6 +145,15 @@ def create_app():
                 'message': f'Knowledge base error: {str(e)}'
             })
     
+    @app.route('/api/admission/status', methods=['GET'])
+    def admission_status():
+        """In-flight LLM work, queue depth, shed counts, calls saved by coalescing and hedging"""
+        from core.admission import admission
+        from core.single_flight import llm_flight
+        from core.hedging import hedger
+        return jsonify({**admission.snapshot(), 'single_flight': dict(llm_flight.stats, in_flight=llm_flight.in_flight),
+                        'hedging': hedger.status()})
+    
     # Serve frontend static files in production
     @app.route('/')
     def serve_frontend():
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Latency and throughput benchmark for the query encoder backends
+
+A backend that cannot be loaded (e.g. onnxruntime is not installed) is reported
+as unavailable instead of being timed, since the loader falls back to torch,
+and the script exits non-zero.
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import numpy as np
+
+# Add the backend directory to the path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from sentence_transformers import SentenceTransformer
+from core.encoders import ENCODER_BACKENDS, OnnxEncoder, load_query_encoder
+from test_encoder_parity import load_seed_passages
+
+QUERIES = [
+    "How do I set up SSO with SAML in Atlan?",
+    "What's the API endpoint for creating glossary terms?",
+    "How can I view data lineage for my tables?",
+    "Connecting Snowflake to Atlan fails with a permissions error",
+    "Importing lineage from Airflow jobs",
+]
+
+
+def bench_latency(encoder, rounds):
+    """Single-query latency, as seen by one request"""
+    timings = []
+    for i in range(rounds):
+        started = time.perf_counter()
+        encoder.encode([QUERIES[i % len(QUERIES)]])
+        timings.append((time.perf_counter() - started) * 1000)
+    return np.percentile(timings, [50, 95, 99])
+
+
+def bench_throughput(encoder, passages, batch_size):
+    """Batched encoding throughput in sentences per second"""
+    started = time.perf_counter()
+    encoder.encode(passages, batch_size=batch_size)
+    return len(passages) / (time.perf_counter() - started)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--backends', nargs='+', default=list(ENCODER_BACKENDS), choices=ENCODER_BACKENDS)
+    parser.add_argument('--rounds', type=int, default=200)
+    parser.add_argument('--batch-size', type=int, default=32)
+    args = parser.parse_args()
+
+    model = SentenceTransformer('all-MiniLM-L6-v2')
+    passages = load_seed_passages() * 20
+
+    unavailable = []
+    print(f"{'backend':<10} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'sent/s':>10}")
+    with tempfile.TemporaryDirectory() as cache_dir:
+        for backend in args.backends:
+            encoder = load_query_encoder(model, backend, cache_dir)
+            if backend != 'torch' and not isinstance(encoder, OnnxEncoder):
+                # The loader fell back to torch; timing it would mislabel torch numbers
+                print(f"{backend:<10} {'unavailable (see log)':>37}")
+                unavailable.append(backend)
+                continue
+            encoder.encode(QUERIES)  # Warm up
+            p50, p95, p99 = bench_latency(encoder, args.rounds)
+            throughput = bench_throughput(encoder, passages, args.batch_size)
+            print(f"{backend:<10} {p50:>8.2f} {p95:>8.2f} {p99:>8.2f} {throughput:>10.1f}")
+
+    if unavailable:
+        print(f"\n❌ Could not load: {', '.join(unavailable)}")
+        sys.exit(1)
@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+"""
+End-to-end load test: boots the app against local stand-ins and drives the API
+
+The app runs as a subprocess with its own working directory (tickets, index,
+job and trace files), talking to a stub Gemini server and a fixture docs site
+from bench_stubs.py. Each scenario is driven at each concurrency level for a
+fixed duration; throughput and p50/p95/p99 latency are printed and written as
+JSON so runs can be compared across commits:
+
+    python bench_load.py --concurrency 1 8 32 --duration 20
+    python bench_load.py --compare bench_results/load_<baseline>.json
+    python bench_load.py --url http://localhost:5001 --scenarios search tickets   # existing server
+"""
+
+import os
+import sys
+import time
+import json
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+import threading
+from datetime import datetime, timezone
+import numpy as np
+import requests
+
+# Add the backend directory to the path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from bench_stubs import StubGeminiServer, FixtureDocsServer
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+QUERIES = [
+    "How do I set up SSO with SAML in Atlan?",
+    "Snowflake connector fails with insufficient privileges",
+    "How can I view column-level lineage from Airflow?",
+    "Create glossary terms in bulk with the Python SDK",
+    "How do I mask PII columns for analysts?",
+]
+
+FOLLOW_UPS = [
+    "Can you explain that in more detail?",
+    "What permissions does that need?",
+    "Is there a way to automate it?",
+]
+
+
+def load_ticket_texts():
+    with open(os.path.join(BACKEND_DIR, 'sample_tickets.json'), 'r', encoding='utf-8') as f:
+        tickets = json.load(f)
+    return [f"{t.get('subject', '')}\n{t.get('body', '')}".strip() for t in tickets] or QUERIES
+
+
+def build_scenarios(turns_per_conversation):
+    """name -> function(rng, worker, n) returning (method, path, request kwargs)"""
+    tickets = load_ticket_texts()
+
+    def chat(rng, worker, n):
+        conversation, turn = divmod(n, turns_per_conversation)
+        message = rng.choice(QUERIES) if turn == 0 else rng.choice(FOLLOW_UPS)
+        return 'POST', '/api/agent/chat', {'json': {'message': message, 'conversation_id': f"bench-{worker}-{conversation}"}}
+
+    return {
+        'respond': lambda rng, worker, n: ('POST', '/api/agent/respond', {'json': {'text': rng.choice(tickets), 'channel': 'email'}}),
+        'chat': chat,
+        'search': lambda rng, worker, n: ('POST', '/api/agent/search', {'json': {'query': rng.choice(QUERIES), 'top_k': 5}}),
+        'tickets': lambda rng, worker, n: ('GET', '/api/tickets', {'params': {'limit': 50}} if n % 2 else {}),
+    }
+
+
+def percentile_summary(latencies_ms):
+    if not latencies_ms:
+        return {'p50': None, 'p95': None, 'p99': None, 'mean': None, 'max': None}
+    p50, p95, p99 = np.percentile(latencies_ms, [50, 95, 99])
+    return {'p50': round(float(p50), 2), 'p95': round(float(p95), 2), 'p99': round(float(p99), 2),
+            'mean': round(float(np.mean(latencies_ms)), 2), 'max': round(float(np.max(latencies_ms)), 2)}
+
+
+def summarize(samples, elapsed):
+    """Aggregate (latency_ms, status) samples; status 0 is a transport error"""
+    statuses = {}
+    for _, status in samples:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    ok = [latency for latency, status in samples if 200 <= status < 400]
+    return {
+        'requests': len(samples),
+        'ok': len(ok),
+        'shed': statuses.get('429', 0),
+        'errors': sum(count for status, count in statuses.items() if status == '0' or int(status) >= 500),
+        'statuses': statuses,
+        'elapsed_seconds': round(elapsed, 3),
+        'throughput_rps': round(len(ok) / elapsed, 2) if elapsed > 0 else 0.0,
+        'latency_ms': percentile_summary(ok),
+    }
+
+
+def run_scenario(base_url, make_request, concurrency, duration, warmup, timeout, seed=0):
+    """Closed-loop load: `concurrency` workers each send back-to-back requests for `duration` seconds"""
+    samples = []
+    lock = threading.Lock()
+    start_gate = threading.Barrier(concurrency + 1)
+    deadline = [float('inf')]  # Set once every worker has warmed up
+
+    def worker(index):
+        rng = random.Random(seed * 1000 + index)
+        session = requests.Session()
+        n = 0
+        for _ in range(warmup):
+            method, path, kwargs = make_request(rng, index, n)
+            n += 1
+            try:
+                session.request(method, base_url + path, timeout=timeout, **kwargs)
+            except requests.RequestException:
+                pass
+        start_gate.wait()
+        local = []
+        while time.perf_counter() < deadline[0]:
+            method, path, kwargs = make_request(rng, index, n)
+            n += 1
+            started = time.perf_counter()
+            try:
+                status = session.request(method, base_url + path, timeout=timeout, **kwargs).status_code
+            except requests.RequestException:
+                status = 0
+            local.append(((time.perf_counter() - started) * 1000, status))
+        with lock:
+            samples.extend(local)
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    start_gate.wait()
+    started = time.perf_counter()
+    deadline[0] = started + duration
+    for thread in threads:
+        thread.join()
+    return summarize(samples, time.perf_counter() - started)
+
+
+def start_app(workdir, port, gemini_url, docs_url, extra_env):
+    """Launch app.py in `workdir` against the stand-ins; returns the process and its log path"""
+    shutil.copy(os.path.join(BACKEND_DIR, 'sample_tickets.json'), os.path.join(workdir, 'tickets.json'))
+    env = dict(os.environ)
+    env.update({
+        'PORT': str(port),
+        'FLASK_ENV': 'production',
+        'GEMINI_API_KEY': 'stub',
+        'GEMINI_API_ENDPOINT': gemini_url,
+        'DOC_SOURCE_URLS': docs_url,
+        'TICKETS_FILE': os.path.join(workdir, 'tickets.json'),
+        # Every request comes from one client address; keep per-client limits out of the way
+        'CLIENT_RATE_PER_SECOND': '100000',
+        'CLIENT_BURST': '100000',
+        'LOG_LEVEL': 'WARNING',
+        'TRACE_SAMPLE_RATE': '0',
+    })
+    env.update(extra_env)
+    log_path = os.path.join(workdir, 'app.log')
+    log_file = open(log_path, 'w')
+    process = subprocess.Popen([sys.executable, os.path.join(BACKEND_DIR, 'app.py')], cwd=workdir, env=env,
+                               stdout=log_file, stderr=subprocess.STDOUT)
+    return process, log_path
+
+
+def wait_until_ready(base_url, process, timeout):
+    """Block until the knowledge base reports ready"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"App exited with code {process.returncode}")
+        try:
+            if requests.get(f"{base_url}/api/kb/status", timeout=2).json().get('status') == 'ready':
+                return
+        except (requests.RequestException, ValueError):
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"App not ready after {timeout}s")
+
+
+def git_revision():
+    try:
+        revision = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR, text=True).strip()
+        dirty = subprocess.call(['git', 'diff', '--quiet', 'HEAD'], cwd=BACKEND_DIR) != 0
+        return revision + ('-dirty' if dirty else '')
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def compare(baseline, current, threshold):
+    """Print per-run deltas against a baseline result; returns the runs that regressed"""
+    regressions = []
+    print(f"\nCompared with {baseline['meta']['revision']} ({baseline['meta']['timestamp']}):")
+    print(f"{'run':<18} {'p50 ms':>16} {'p95 ms':>16} {'p99 ms':>16} {'req/s':>16}")
+    for key, result in current['results'].items():
+        before = baseline['results'].get(key)
+        if before is None:
+            continue
+        cells = []
+        for metric in ('p50', 'p95', 'p99'):
+            old, new = before['latency_ms'][metric], result['latency_ms'][metric]
+            cells.append(f"{new:>8.1f} ({(new - old) / old * 100:+5.0f}%)" if old and new is not None else f"{'n/a':>16}")
+        old_rps, new_rps = before['throughput_rps'], result['throughput_rps']
+        cells.append(f"{new_rps:>8.1f} ({(new_rps - old_rps) / old_rps * 100:+5.0f}%)" if old_rps else f"{'n/a':>16}")
+        print(f"{key:<18} " + ' '.join(cells))
+
+        old_p95, new_p95 = before['latency_ms']['p95'], result['latency_ms']['p95']
+        if (old_p95 and new_p95 and new_p95 > old_p95 * (1 + threshold)) or \
+                (old_rps and new_rps < old_rps * (1 - threshold)):
+            regressions.append(key)
+    if not any(key in baseline['results'] for key in current['results']):
+        print("  (no scenario@concurrency runs in common)")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scenarios', nargs='+', default=['respond', 'chat', 'search', 'tickets'],
+                        choices=['respond', 'chat', 'search', 'tickets'])
+    parser.add_argument('--concurrency', nargs='+', type=int, default=[1, 8])
+    parser.add_argument('--duration', type=float, default=10.0, help='Seconds per scenario and concurrency level')
+    parser.add_argument('--warmup', type=int, default=2, help='Unmeasured requests per worker before each run')
+    parser.add_argument('--timeout', type=float, default=60.0, help='Per-request client timeout in seconds')
+    parser.add_argument('--chat-turns', type=int, default=4, help='Messages per chat conversation')
+    parser.add_argument('--llm-latency-ms', type=float, default=500.0, help='Median stub Gemini latency')
+    parser.add_argument('--llm-latency-sigma', type=float, default=0.5, help='Log-normal shape; 0 for constant')
+    parser.add_argument('--llm-error-rate', type=float, default=0.0, help='Fraction of stub Gemini calls that fail')
+    parser.add_argument('--llm-error-status', type=int, default=500)
+    parser.add_argument('--app-env', nargs='*', default=[], metavar='KEY=VALUE', help='Extra app environment')
+    parser.add_argument('--port', type=int, default=5091)
+    parser.add_argument('--url', help='Drive an already running app instead of booting one (no stand-ins)')
+    parser.add_argument('--ready-timeout', type=float, default=300.0)
+    parser.add_argument('--output', help='Result JSON path (default bench_results/load_<revision>_<time>.json)')
+    parser.add_argument('--compare', help='Baseline result JSON to compare against')
+    parser.add_argument('--threshold', type=float, default=0.1, help='Relative p95/throughput change counted as a regression')
+    parser.add_argument('--keep-workdir', action='store_true')
+    args = parser.parse_args()
+
+    scenarios = build_scenarios(args.chat_turns)
+    extra_env = dict(item.split('=', 1) for item in args.app_env)
+    process = gemini = docs = None
+    workdir = tempfile.mkdtemp(prefix='helpdesk-load-')
+    try:
+        if args.url:
+            base_url = args.url.rstrip('/')
+        else:
+            docs = FixtureDocsServer().start()
+            gemini = StubGeminiServer(args.llm_latency_ms, args.llm_latency_sigma, args.llm_error_rate,
+                                      args.llm_error_status, docs_url=docs.url + '/').start()
+            print(f"🔧 Stub Gemini at {gemini.url}, fixture docs at {docs.url}, app workdir {workdir}")
+            process, log_path = start_app(workdir, args.port, gemini.url, docs.url + '/', extra_env)
+            base_url = f"http://127.0.0.1:{args.port}"
+        started = time.time()
+        wait_until_ready(base_url, process, args.ready_timeout)
+        print(f"App ready in {time.time() - started:.1f}s")
+
+        results = {}
+        print(f"\n{'run':<18} {'reqs':>6} {'ok':>6} {'429':>5} {'err':>5} {'req/s':>8} "
+              f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+        for name in args.scenarios:
+            for concurrency in args.concurrency:
+                result = run_scenario(base_url, scenarios[name], concurrency, args.duration,
+                                      args.warmup, args.timeout)
+                key = f"{name}@{concurrency}"
+                results[key] = dict(result, scenario=name, concurrency=concurrency)
+                latency = result['latency_ms']
+                fmt = lambda value: f"{value:>8.1f}" if value is not None else f"{'n/a':>8}"
+                print(f"{key:<18} {result['requests']:>6} {result['ok']:>6} {result['shed']:>5} {result['errors']:>5} "
+                      f"{result['throughput_rps']:>8.1f} {fmt(latency['p50'])} {fmt(latency['p95'])} {fmt(latency['p99'])}")
+
+        report = {
+            'meta': {
+                'revision': git_revision(),
+                'timestamp': datetime.now(timezone.utc).isoformat(),
+                'python': platform.python_version(),
+                'cpu_count': os.cpu_count(),
+                'target': args.url or 'local',
+                'args': vars(args),
+                'stub_gemini': dict(gemini.stats) if gemini else None,
+            },
+            'results': results,
+        }
+        output = args.output or os.path.join(
+            BACKEND_DIR, 'bench_results',
+            f"load_{report['meta']['revision']}_{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults written to {output}")
+
+        if args.compare:
+            with open(args.compare, 'r', encoding='utf-8') as f:
+                regressions = compare(json.load(f), report, args.threshold)
+            if regressions:
+                print(f"❌ Regressed beyond {args.threshold:.0%}: {', '.join(regressions)}")
+                sys.exit(1)
+            print("✅ No regressions")
+    except RuntimeError as e:
+        print(f"❌ {e}")
+        if process is not None:
+            args.keep_workdir = True
+            with open(log_path, 'r', encoding='utf-8', errors='replace') as f:
+                print(''.join(f.readlines()[-20:]))
+        sys.exit(1)
+    finally:
+        if process is not None:
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        for server in (gemini, docs):
+            if server is not None:
+                server.stop()
+        if args.keep_workdir:
+            print(f"App workdir kept at {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
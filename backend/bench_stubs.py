@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+Local stand-ins for the services the backend calls out to, used by bench_load.py
+
+- StubGeminiServer answers the Gemini REST generateContent call with canned
+  classification / RAG JSON after a log-normal delay, failing a configurable
+  fraction of calls. Point the app at it with GEMINI_API_ENDPOINT.
+- FixtureDocsServer serves a small documentation site (sitemap plus article
+  pages) for the knowledge base crawler. Point the app at it with DOC_SOURCE_URLS.
+
+Run directly to keep both up for manual testing:
+    python bench_stubs.py --llm-latency-ms 800 --llm-error-rate 0.05
+"""
+
+import json
+import math
+import random
+import hashlib
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+TOPICS = ['How-to', 'Product', 'Connector', 'Lineage', 'API/SDK', 'SSO', 'Glossary', 'Best practices', 'Sensitive data']
+SENTIMENTS = ['Frustrated', 'Curious', 'Angry', 'Neutral']
+PRIORITIES = ['P0 (High)', 'P1 (Medium)', 'P2 (Low)']
+
+DOC_PAGES = {
+    'getting-started-guide': ('Getting started with Atlan', [
+        "Atlan is a data catalog that helps teams discover, understand and trust their data assets.",
+        "Invite your team from the admin center and assign personas to control what each group can see.",
+        "Assets are organised by connection, database and schema, and can be searched by name or description.",
+    ]),
+    'snowflake-connector-setup': ('Set up the Snowflake connector', [
+        "Create a dedicated role and user in Snowflake with USAGE on the warehouse and the databases to crawl.",
+        "Grant the role access to ACCOUNT_USAGE views if you want Atlan to mine query history for lineage.",
+        "In Atlan, choose New workflow, select Snowflake and enter the account identifier, user and key pair.",
+        "Crawler failures with insufficient privileges usually mean the role is missing REFERENCES or MONITOR grants.",
+    ]),
+    'lineage-guide': ('Understanding data lineage', [
+        "Lineage shows how data flows from sources through transformations to dashboards.",
+        "Column-level lineage is derived by parsing SQL from query history and dbt manifests.",
+        "Airflow lineage is collected through the OpenLineage integration configured on the scheduler.",
+        "If lineage is missing for a table, check that the crawler and the miner have both completed.",
+    ]),
+    'api-docs-authentication': ('API authentication', [
+        "Every API request needs a bearer token created from an API key in the admin center.",
+        "The Python SDK reads ATLAN_BASE_URL and ATLAN_API_KEY from the environment.",
+        "Use the search endpoint with an index search request to find assets by qualified name.",
+        "Glossary terms can be created in bulk with the SDK's batch helper to avoid rate limits.",
+    ]),
+    'sso-saml-setup': ('Configure SSO with SAML', [
+        "Atlan supports SAML 2.0 single sign-on with Okta, Azure AD, Google and other identity providers.",
+        "Copy the Atlan ACS URL and entity ID into your identity provider's application settings.",
+        "Map the email, first name and last name attributes so user profiles are created on first login.",
+        "Group mappings from the identity provider can be synced to Atlan groups for access control.",
+    ]),
+    'glossary-best-practices-guide': ('Glossary best practices', [
+        "Start the business glossary with a small set of certified terms owned by domain experts.",
+        "Link terms to assets so analysts can find trusted tables from business language.",
+        "Use categories to group terms by domain and keep definitions short and unambiguous.",
+    ]),
+    'sensitive-data-classification-docs': ('Classifying sensitive data', [
+        "Classifications such as PII propagate along lineage to downstream assets automatically.",
+        "Purpose policies can mask columns tagged as sensitive for users outside approved groups.",
+        "Review propagated tags regularly to avoid over-masking derived columns.",
+    ]),
+}
+
+
+def _pick(options, text, salt):
+    digest = hashlib.md5(f"{salt}:{text}".encode()).digest()
+    return options[digest[0] % len(options)]
+
+
+class _QuietHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_body(self, status, body, content_type='application/json'):
+        data = body.encode('utf-8') if isinstance(body, str) else body
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class _BackgroundServer:
+    handler = None
+
+    def __init__(self, host='127.0.0.1', port=0):
+        handler = type(self.handler.__name__, (self.handler,), {'server_state': self})
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name=type(self).__name__, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class _GeminiHandler(_QuietHandler):
+    def do_POST(self):
+        state = self.server_state
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            payload = json.loads(self.rfile.read(length) or b'{}')
+            prompt = ''.join(part.get('text', '') for content in payload.get('contents', [])
+                             for part in content.get('parts', []))
+        except ValueError:
+            self.send_body(400, json.dumps({'error': {'code': 400, 'message': 'Invalid JSON', 'status': 'INVALID_ARGUMENT'}}))
+            return
+
+        delay, fail = state.sample()
+        state.sleep(delay)
+        if fail:
+            with state.lock:
+                state.stats['failed'] += 1
+            self.send_body(state.error_status, json.dumps({
+                'error': {'code': state.error_status, 'message': 'Stub failure', 'status': 'INTERNAL'}
+            }))
+            return
+
+        with state.lock:
+            state.stats['served'] += 1
+        if 'helpdesk ticket classifier' in prompt:
+            text = json.dumps({
+                'topic': _pick(TOPICS, prompt, 'topic'),
+                'sentiment': _pick(SENTIMENTS, prompt, 'sentiment'),
+                'priority': _pick(PRIORITIES, prompt, 'priority'),
+            })
+        else:
+            text = json.dumps({
+                'response': "Here is how to resolve this:\n\n1. Check the configuration described in the documentation.\n"
+                            "2. Re-run the workflow and review the logs.\n\n(stub response)",
+                'sources': [state.docs_url] if state.docs_url else [],
+            })
+        self.send_body(200, json.dumps({
+            'candidates': [{'content': {'parts': [{'text': text}], 'role': 'model'}, 'finishReason': 'STOP', 'index': 0}],
+            'usageMetadata': {'promptTokenCount': len(prompt) // 4, 'candidatesTokenCount': len(text) // 4},
+        }))
+
+
+class StubGeminiServer(_BackgroundServer):
+    """
+    Gemini generateContent stand-in.
+
+    Latency is log-normal with the given median and shape (sigma=0 makes it
+    constant); `error_rate` of calls return `error_status` after the delay.
+    """
+    handler = _GeminiHandler
+
+    def __init__(self, latency_ms=500.0, latency_sigma=0.5, error_rate=0.0, error_status=500,
+                 docs_url=None, seed=None, **kwargs):
+        super().__init__(**kwargs)
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.docs_url = docs_url
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {'served': 0, 'failed': 0}
+
+    def sample(self):
+        with self.lock:
+            delay = self.latency_ms / 1000
+            if self.latency_sigma > 0 and delay > 0:
+                delay = self.rng.lognormvariate(math.log(delay), self.latency_sigma)
+            return delay, self.rng.random() < self.error_rate
+
+    @staticmethod
+    def sleep(seconds):
+        threading.Event().wait(seconds)
+
+
+class _DocsHandler(_QuietHandler):
+    def do_GET(self):
+        base = self.server_state.url
+        path = self.path.split('?', 1)[0]
+        if path in ('/sitemap.xml', '/sitemap_index.xml'):
+            locs = ''.join(f"<url><loc>{base}/docs/{slug}</loc></url>" for slug in DOC_PAGES)
+            self.send_body(200, f'<?xml version="1.0" encoding="UTF-8"?>'
+                                f'<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{locs}</urlset>',
+                           'application/xml')
+        elif path == '/':
+            links = ''.join(f'<a href="/docs/{slug}">{title}</a>' for slug, (title, _) in DOC_PAGES.items())
+            self.send_body(200, f"<html><body><nav>{links}</nav><article><h1>Atlan documentation</h1>"
+                                f"<p>{DOC_PAGES['getting-started-guide'][1][0]}</p></article></body></html>",
+                           'text/html')
+        elif path.startswith('/docs/') and path[len('/docs/'):] in DOC_PAGES:
+            title, paragraphs = DOC_PAGES[path[len('/docs/'):]]
+            body = ''.join(f"<p>{p}</p>" for p in paragraphs)
+            self.send_body(200, f"<html><body><nav><a href='/'>Home</a></nav>"
+                                f"<article><h1>{title}</h1>{body}</article></body></html>", 'text/html')
+        else:
+            self.send_body(404, 'Not found', 'text/plain')
+
+
+class FixtureDocsServer(_BackgroundServer):
+    """Static documentation site crawled by the knowledge base"""
+    handler = _DocsHandler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--llm-port', type=int, default=8701)
+    parser.add_argument('--docs-port', type=int, default=8702)
+    parser.add_argument('--llm-latency-ms', type=float, default=500.0)
+    parser.add_argument('--llm-latency-sigma', type=float, default=0.5)
+    parser.add_argument('--llm-error-rate', type=float, default=0.0)
+    parser.add_argument('--llm-error-status', type=int, default=500)
+    args = parser.parse_args()
+
+    docs = FixtureDocsServer(port=args.docs_port).start()
+    gemini = StubGeminiServer(args.llm_latency_ms, args.llm_latency_sigma, args.llm_error_rate,
+                              args.llm_error_status, docs_url=docs.url + '/', port=args.llm_port).start()
+    print(f"Stub Gemini:  GEMINI_API_ENDPOINT={gemini.url} GEMINI_API_KEY=stub")
+    print(f"Fixture docs: DOC_SOURCE_URLS={docs.url}/")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
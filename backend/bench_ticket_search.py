@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Latency benchmark for ticket full-text search on a large synthetic corpus
+"""
+
+import os
+import sys
+import time
+import json
+import random
+import argparse
+import numpy as np
+
+# Add the backend directory to the path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from core.ticket_search import TicketSearchIndex
+
+QUERIES = [
+    'airflow',
+    'saml',
+    'snowflake connector',
+    '"data lineage"',
+    'lin*',
+    'sso okta*',
+    '"service account" snowflake',
+]
+
+
+def synthetic_tickets(count, seed=7):
+    """Tickets built by shuffling sentences from the sample corpus with random filler"""
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sample_tickets.json')
+    with open(path, 'r', encoding='utf-8') as f:
+        samples = json.load(f)
+    sentences = [s.strip() for t in samples for s in t.get('body', '').split('.') if len(s.strip()) > 20]
+    vocabulary = list({w for s in sentences for w in s.lower().split()})
+    rng = random.Random(seed)
+    tickets = []
+    for i in range(count):
+        body = '. '.join(rng.sample(sentences, 3)) + ' ' + ' '.join(rng.choices(vocabulary, k=10))
+        tickets.append({'id': f'TICKET-{i + 1}', 'subject': rng.choice(samples).get('subject', ''), 'body': body})
+    return tickets
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--tickets', type=int, default=100000)
+    parser.add_argument('--rounds', type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"🔧 Generating {args.tickets} synthetic tickets...")
+    tickets = synthetic_tickets(args.tickets)
+
+    index = TicketSearchIndex()
+    started = time.perf_counter()
+    index.rebuild(tickets)
+    print(f"Built index over {len(index)} tickets in {time.perf_counter() - started:.2f}s")
+
+    started = time.perf_counter()
+    for ticket in synthetic_tickets(1000, seed=11):
+        ticket['id'] = 'NEW-' + ticket['id']
+        index.on_ticket_event('ticket.created', ticket)
+    print(f"Incremental add: {(time.perf_counter() - started) * 1000 / 1000:.3f} ms/ticket")
+
+    print(f"\n{'query':<32} {'matches':>8} {'p50 ms':>8} {'p95 ms':>8}")
+    for query in QUERIES:
+        timings = []
+        for _ in range(args.rounds):
+            started = time.perf_counter()
+            result = index.search(query, limit=20)
+            timings.append((time.perf_counter() - started) * 1000)
+        p50, p95 = np.percentile(timings, [50, 95])
+        print(f"{query:<32} {result['total']:>8} {p50:>8.2f} {p95:>8.2f}")
@@ -0,0 +1,173 @@
+"""
+Admission control for LLM-bound endpoints.
+
+Two gates run before a request does any Gemini work:
+
+1. A per-client token bucket caps each caller's sustained request rate.
+2. A global in-flight limit caps concurrent LLM work. Requests beyond it wait
+   in a short bounded queue; once that queue is full (or the wait times out)
+   they are shed immediately instead of piling up behind slow calls.
+
+Rejected requests get 429 with a Retry-After estimate, so admitted requests
+keep a predictable latency under bursts.
+"""
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from typing import Dict, Optional
+from flask import jsonify, request
+
+from core.metrics import metrics
+from core import deadline
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second, holding at most `burst`"""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self) -> float:
+        """Consume a token; returns 0 on success, else seconds until one is available"""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate if self.rate > 0 else float('inf')
+
+
+class Rejected(Exception):
+    """Raised when a request is not admitted"""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """Global in-flight limit with a bounded wait queue, plus per-client token buckets"""
+
+    def __init__(self, max_in_flight: int = 8, max_queue: int = 16, queue_timeout: float = 5.0,
+                 client_rate: float = 1.0, client_burst: float = 5.0, max_clients: int = 10000):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.client_rate = client_rate
+        self.client_burst = client_burst
+        self.max_clients = max_clients
+        self._buckets: 'OrderedDict[str, TokenBucket]' = OrderedDict()
+        self._cond = threading.Condition()
+        self.in_flight = 0
+        self.waiting = 0
+        self._service_seconds = 2.0  # Moving average of admitted request duration
+        self.stats = {'admitted': 0, 'rate_limited': 0, 'shed': 0, 'timed_out': 0}
+
+    def _take_client_token(self, client: str):
+        with self._cond:
+            bucket = self._buckets.get(client)
+            if bucket is None:
+                bucket = self._buckets[client] = TokenBucket(self.client_rate, self.client_burst)
+                if len(self._buckets) > self.max_clients:
+                    self._buckets.popitem(last=False)
+            self._buckets.move_to_end(client)
+            wait = bucket.take()
+            if wait > 0:
+                self.stats['rate_limited'] += 1
+        if wait > 0:
+            raise Rejected('Client rate limit exceeded', wait)
+
+    def _retry_after(self) -> float:
+        # Time for the work ahead of a new arrival to drain through the in-flight slots
+        return self._service_seconds * (self.waiting + 1) / max(self.max_in_flight, 1)
+
+    def acquire(self, client: str):
+        """Admit a request or raise Rejected"""
+        self._take_client_token(client)
+        with self._cond:
+            if self.in_flight >= self.max_in_flight:
+                if self.waiting >= self.max_queue:
+                    self.stats['shed'] += 1
+                    raise Rejected('Server is at capacity', self._retry_after())
+                self.waiting += 1
+                # Never queue past the request's own deadline
+                wait = self.queue_timeout
+                if deadline.remaining() is not None:
+                    wait = min(wait, deadline.remaining())
+                give_up_at = time.monotonic() + wait
+                try:
+                    while self.in_flight >= self.max_in_flight:
+                        remaining = give_up_at - time.monotonic()
+                        if remaining <= 0:
+                            self.stats['timed_out'] += 1
+                            raise Rejected('Timed out waiting for capacity', self._retry_after())
+                        self._cond.wait(remaining)
+                finally:
+                    self.waiting -= 1
+            self.in_flight += 1
+            self.stats['admitted'] += 1
+
+    def release(self, elapsed: float):
+        with self._cond:
+            self.in_flight -= 1
+            self._service_seconds = 0.9 * self._service_seconds + 0.1 * elapsed
+            self._cond.notify()
+
+    def snapshot(self) -> Dict:
+        with self._cond:
+            return {
+                'in_flight': self.in_flight,
+                'max_in_flight': self.max_in_flight,
+                'queue_depth': self.waiting,
+                'max_queue': self.max_queue,
+                'tracked_clients': len(self._buckets),
+                'avg_service_seconds': round(self._service_seconds, 3),
+                **self.stats
+            }
+
+
+def client_key() -> str:
+    """Identify the caller for rate limiting (the real client when app.py applies ProxyFix)"""
+    return request.remote_addr or 'unknown'
+
+
+def admission_controlled(controller: Optional['AdmissionController'] = None):
+    """Decorator for Flask views doing LLM work; sheds with 429 and Retry-After"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            ctrl = controller or admission
+            try:
+                ctrl.acquire(client_key())
+            except Rejected as e:
+                response = jsonify({'error': e.reason})
+                response.headers['Retry-After'] = str(max(1, math.ceil(e.retry_after)))
+                return response, 429
+            started = time.monotonic()
+            try:
+                return view(*args, **kwargs)
+            finally:
+                ctrl.release(time.monotonic() - started)
+        return wrapper
+    return decorator
+
+
+# Global admission controller instance
+admission = AdmissionController(
+    max_in_flight=int(os.getenv('LLM_MAX_IN_FLIGHT', '8')),
+    max_queue=int(os.getenv('LLM_MAX_QUEUE', '16')),
+    queue_timeout=float(os.getenv('LLM_QUEUE_TIMEOUT_SECONDS', '5')),
+    client_rate=float(os.getenv('CLIENT_RATE_PER_SECOND', '1')),
+    client_burst=float(os.getenv('CLIENT_BURST', '5'))
+)
+
+metrics.gauge('helpdesk_llm_in_flight', 'Admitted LLM-bound requests in progress', callback=lambda: admission.in_flight)
+metrics.gauge('helpdesk_llm_queue_depth', 'Requests waiting for LLM capacity', callback=lambda: admission.waiting)
@@ -0,0 +1,131 @@
+"""
+Traffic capture for replay.
+
+When enabled, each matching API request is recorded as one JSON line using the
+`request_id` / `title` / `body` layout of the repo's requests.jsonl, extended
+with what replay needs: method, path, query string, content type, arrival
+time, status, server-side duration and response size. Records are queued and
+written by a background thread to a size-rotated file
+(capture.jsonl, capture.jsonl.1, ...), so capturing never blocks a request.
+
+Request bodies can contain customer text; capture is off unless
+CAPTURE_TRAFFIC=1 and bodies are truncated to CAPTURE_MAX_BODY_BYTES.
+"""
+import json
+import os
+import queue
+import random
+import threading
+from typing import Dict, Optional, Sequence
+
+from core.structured_log import get_logger
+
+log = get_logger('capture')
+
+
+class TrafficCapture:
+    """Sampled request recorder with a rotating JSONL writer"""
+
+    def __init__(self, path: str, enabled: bool = False, sample_rate: float = 1.0,
+                 max_bytes: int = 50 * 1024 * 1024, backups: int = 5, max_body_bytes: int = 64 * 1024,
+                 include: Sequence[str] = ('/api/',),
+                 exclude: Sequence[str] = ('/api/metrics', '/api/debug', '/api/health'),
+                 max_queue: int = 10000):
+        self.path = path
+        self.enabled = enabled
+        self.sample_rate = sample_rate
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.max_body_bytes = max_body_bytes
+        self.include = tuple(include)
+        self.exclude = tuple(exclude)
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._lock = threading.Lock()
+        self.stats = {'captured': 0, 'written': 0, 'dropped': 0, 'rotations': 0}
+
+    def wants(self, path: str) -> bool:
+        if not self.enabled or not path.startswith(self.include) or path.startswith(self.exclude):
+            return False
+        # Long-lived streams cannot be replayed request-for-request
+        return not path.endswith('/stream') and random.random() < self.sample_rate
+
+    def record(self, request, response, started: float, duration: float, request_id: Optional[str] = None):
+        """Queue a record for a finished Flask request/response pair"""
+        raw = request.get_data(cache=True)
+        body = raw[:self.max_body_bytes].decode('utf-8', errors='replace')
+        entry = {
+            'request_id': request_id,
+            'title': f"{request.method} {request.path}",
+            'body': body,
+            'ts': round(started, 6),
+            'method': request.method,
+            'path': request.path,
+            'query': request.query_string.decode('utf-8', errors='replace'),
+            'content_type': request.content_type,
+            'status': response.status_code,
+            'duration_ms': round(duration * 1000, 3),
+            # None for streamed responses, whose size is unknown when headers are sent
+            'response_bytes': response.calculate_content_length(),
+        }
+        if len(raw) > self.max_body_bytes:
+            entry['body_truncated'] = len(raw)
+        self.stats['captured'] += 1
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            self.stats['dropped'] += 1
+
+    def _ensure_worker(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='traffic-capture', daemon=True)
+                    self._thread.start()
+
+    def _rotate(self):
+        for index in range(self.backups - 1, 0, -1):
+            source = f"{self.path}.{index}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{index + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self.stats['rotations'] += 1
+
+    def _run(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        while True:
+            entries = [self._queue.get()]
+            while True:
+                try:
+                    entries.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                lines = ''.join(json.dumps(entry, ensure_ascii=False) + '\n' for entry in entries)
+                if os.path.exists(self.path) and os.path.getsize(self.path) + len(lines) > self.max_bytes:
+                    self._rotate()
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write(lines)
+                self.stats['written'] += len(entries)
+            except Exception:
+                log.exception("Traffic capture write failed", extra={'path': self.path})
+
+    def status(self) -> Dict:
+        return {'enabled': self.enabled, 'path': os.path.abspath(self.path), 'sample_rate': self.sample_rate,
+                'queued': self._queue.qsize(), **self.stats}
+
+
+# Global traffic capture instance
+capture = TrafficCapture(
+    path=os.getenv('CAPTURE_FILE', os.path.join('captures', 'capture.jsonl')),
+    enabled=os.getenv('CAPTURE_TRAFFIC') == '1',
+    sample_rate=float(os.getenv('CAPTURE_SAMPLE_RATE', '1.0')),
+    max_bytes=int(os.getenv('CAPTURE_MAX_BYTES', str(50 * 1024 * 1024))),
+    backups=int(os.getenv('CAPTURE_BACKUPS', '5')),
+    max_body_bytes=int(os.getenv('CAPTURE_MAX_BODY_BYTES', str(64 * 1024)))
+)
@@ -0,0 +1,211 @@
+"""
+Structure-aware chunking and cross-page deduplication for the knowledge base.
+"""
+import re
+import hashlib
+import zlib
+from typing import Callable, Dict, List, Optional
+import numpy as np
+
+HEADING_RE = re.compile(r'^(#{1,6})\s+\S')
+LIST_ITEM_RE = re.compile(r'^\s*(?:[-*+•]|\d+[.)])\s+\S')
+FENCE_RE = re.compile(r'^\s*```')
+SENTENCE_END_RE = re.compile(r'(?<=[.!?])\s+')
+
+
+def _approximate_tokens(text: str) -> int:
+    return max(1, (len(text) + 3) // 4)
+
+
+class StructuredChunker:
+    """
+    Splits documents on headings, lists and paragraphs, sized by encoder tokens.
+
+    Blocks are packed greedily into chunks of at most max_tokens; a heading always
+    starts a new chunk, oversized blocks are split on sentence boundaries, and a
+    short trailing chunk is folded into its predecessor instead of being emitted alone.
+    """
+
+    def __init__(self, count_tokens: Optional[Callable[[str], int]] = None,
+                 max_tokens: int = 128, min_tokens: int = 24):
+        self.count_tokens = count_tokens or _approximate_tokens
+        self.max_tokens = max_tokens
+        self.min_tokens = min_tokens
+
+    def _blocks(self, text: str) -> List[Dict]:
+        """Group lines into structural blocks: heading, list, code or paragraph"""
+        blocks: List[Dict] = []
+        current: Optional[Dict] = None
+        in_code = False
+
+        def flush():
+            nonlocal current
+            if current and current['lines']:
+                blocks.append({'kind': current['kind'], 'text': '\n'.join(current['lines'])})
+            current = None
+
+        for line in text.split('\n'):
+            if FENCE_RE.match(line):
+                if in_code:
+                    current['lines'].append(line)
+                    flush()
+                    in_code = False
+                else:
+                    flush()
+                    current = {'kind': 'code', 'lines': [line]}
+                    in_code = True
+                continue
+            if in_code:
+                current['lines'].append(line)
+                continue
+            if not line.strip():
+                flush()
+                continue
+            if HEADING_RE.match(line):
+                flush()
+                blocks.append({'kind': 'heading', 'text': line.strip()})
+                continue
+            kind = 'list' if LIST_ITEM_RE.match(line) else 'paragraph'
+            if current is None or current['kind'] != kind:
+                flush()
+                current = {'kind': kind, 'lines': []}
+            current['lines'].append(line.rstrip())
+        flush()
+        return blocks
+
+    def _split_oversized(self, text: str) -> List[str]:
+        """Split a block that alone exceeds the budget, preferring line then sentence boundaries"""
+        separator = '\n' if '\n' in text else ' '
+        pieces = text.split('\n') if separator == '\n' else SENTENCE_END_RE.split(text)
+        if len(pieces) == 1:
+            # No natural boundary: hard split by characters, sized from the token ratio
+            width = max(1, len(text) * self.max_tokens // max(self.count_tokens(text), 1))
+            return [text[i:i + width] for i in range(0, len(text), width)]
+
+        parts, current = [], ''
+        for piece in pieces:
+            candidate = f"{current}{separator}{piece}" if current else piece
+            if current and self.count_tokens(candidate) > self.max_tokens:
+                parts.append(current)
+                current = piece
+            else:
+                current = candidate
+        if current:
+            parts.append(current)
+        result = []
+        for part in parts:
+            if self.count_tokens(part) > self.max_tokens and part != text:
+                result.extend(self._split_oversized(part))
+            else:
+                result.append(part)
+        return result
+
+    def chunk(self, text: str) -> List[str]:
+        """Split text into token-bounded chunks along structural boundaries"""
+        chunks: List[str] = []
+        current: List[str] = []
+        current_tokens = 0
+        has_body = False
+
+        def emit():
+            nonlocal current, current_tokens, has_body
+            if current:
+                chunks.append('\n'.join(current).strip())
+            current, current_tokens, has_body = [], 0, False
+
+        for block in self._blocks(text):
+            block_tokens = self.count_tokens(block['text'])
+            if block['kind'] == 'heading':
+                # Consecutive headings stay together with the body that follows them
+                if has_body:
+                    emit()
+                current.append(block['text'])
+                current_tokens += block_tokens
+                continue
+            if block_tokens > self.max_tokens:
+                if has_body:
+                    emit()
+                headings = current
+                for i, piece in enumerate(self._split_oversized(block['text'])):
+                    current = headings + [piece] if i == 0 else [piece]
+                    emit()
+                continue
+            if has_body and current_tokens + block_tokens > self.max_tokens:
+                emit()
+            current.append(block['text'])
+            current_tokens += block_tokens
+            has_body = True
+        emit()
+
+        # Fold a tiny trailing chunk back into its predecessor when it fits
+        if len(chunks) > 1 and self.count_tokens(chunks[-1]) < self.min_tokens:
+            merged = chunks[-2] + '\n' + chunks[-1]
+            if self.count_tokens(merged) <= self.max_tokens + self.min_tokens:
+                chunks[-2:] = [merged]
+        return [c for c in chunks if c]
+
+
+class ChunkDeduplicator:
+    """
+    Drops exact and near-duplicate chunks across pages.
+
+    Exact duplicates are caught by a hash of the normalized text; near-duplicates
+    by MinHash signatures over word shingles, bucketed with LSH banding and then
+    confirmed against an estimated Jaccard similarity threshold.
+    """
+
+    def __init__(self, num_perm: int = 64, bands: int = 8, threshold: float = 0.85, shingle_size: int = 3):
+        assert num_perm % bands == 0, "num_perm must be divisible by bands"
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.threshold = threshold
+        self.shingle_size = shingle_size
+        rng = np.random.RandomState(1)
+        self._prime = np.uint64((1 << 61) - 1)
+        self._a = rng.randint(1, 1 << 31, size=num_perm).astype(np.uint64)
+        self._b = rng.randint(0, 1 << 31, size=num_perm).astype(np.uint64)
+        self._hashes = set()
+        self._buckets: Dict[tuple, List[int]] = {}
+        self._signatures: List[np.ndarray] = []
+        self.exact_removed = 0
+        self.near_removed = 0
+
+    @staticmethod
+    def _normalize(text: str) -> str:
+        return re.sub(r'\s+', ' ', re.sub(r'[^\w\s]', ' ', text.lower())).strip()
+
+    def _signature(self, normalized: str) -> np.ndarray:
+        words = normalized.split()
+        n = self.shingle_size
+        shingles = {' '.join(words[i:i + n]) for i in range(max(1, len(words) - n + 1))}
+        values = np.array([zlib.crc32(s.encode()) for s in shingles], dtype=np.uint64)
+        hashed = (np.outer(values, self._a) + self._b) % self._prime
+        return hashed.min(axis=0)
+
+    def is_duplicate(self, text: str) -> bool:
+        """Return True if text duplicates a chunk seen before; otherwise remember it"""
+        normalized = self._normalize(text)
+        digest = hashlib.md5(normalized.encode()).hexdigest()
+        if digest in self._hashes:
+            self.exact_removed += 1
+            return True
+
+        signature = self._signature(normalized)
+        band_keys = [(b, signature[b * self.rows:(b + 1) * self.rows].tobytes()) for b in range(self.bands)]
+        candidates = {i for key in band_keys for i in self._buckets.get(key, [])}
+        for i in candidates:
+            if float(np.mean(self._signatures[i] == signature)) >= self.threshold:
+                self.near_removed += 1
+                return True
+
+        self._hashes.add(digest)
+        position = len(self._signatures)
+        self._signatures.append(signature)
+        for key in band_keys:
+            self._buckets.setdefault(key, []).append(position)
+        return False
+
+    @property
+    def removed(self) -> int:
+        return self.exact_removed + self.near_removed
@@ -0,0 +1,142 @@
+"""
+Token-budgeted context assembly for RAG prompts.
+"""
+from typing import Callable, Dict, List, Optional
+import numpy as np
+
+
+def approximate_token_count(text: str) -> int:
+    """Rough token estimate used when no tokenizer is available (~4 chars per token)."""
+    return max(1, (len(text) + 3) // 4)
+
+
+def _merge_overlapping(first: str, second: str, max_overlap: int = 200) -> str:
+    """Join two consecutive chunks, dropping the text they share at the seam."""
+    limit = min(max_overlap, len(first), len(second))
+    for size in range(limit, 0, -1):
+        if first.endswith(second[:size]):
+            return first + second[size:]
+    return first + "\n" + second
+
+
+class ContextBuilder:
+    """
+    Selects retrieved chunks for the prompt under a token budget.
+
+    Candidates are picked by maximal marginal relevance (MMR) over their stored
+    vectors, near-duplicates are dropped outright, and chunks that are adjacent
+    on the same page are merged back together so overlapping text is only sent once.
+    """
+
+    def __init__(self, count_tokens: Optional[Callable[[str], int]] = None,
+                 max_tokens: int = 600, mmr_lambda: float = 0.7,
+                 duplicate_threshold: float = 0.95):
+        self.count_tokens = count_tokens or approximate_token_count
+        self.max_tokens = max_tokens
+        self.mmr_lambda = mmr_lambda
+        self.duplicate_threshold = duplicate_threshold
+
+    def _select_mmr(self, results: List[Dict]) -> List[int]:
+        """Order candidates by MMR, skipping near-duplicates of already selected chunks"""
+        vectors = np.array([r['embedding'] for r in results], dtype='float32')
+        relevance = np.array([r['score'] for r in results], dtype='float32')
+        similarity = vectors @ vectors.T
+
+        selected: List[int] = []
+        remaining = list(range(len(results)))
+        while remaining:
+            if selected:
+                redundancy = similarity[np.ix_(remaining, selected)].max(axis=1)
+            else:
+                redundancy = np.zeros(len(remaining), dtype='float32')
+            mmr = self.mmr_lambda * relevance[remaining] - (1 - self.mmr_lambda) * redundancy
+            best_pos = int(np.argmax(mmr))
+            best = remaining.pop(best_pos)
+            if selected and redundancy[best_pos] >= self.duplicate_threshold:
+                continue
+            selected.append(best)
+        return selected
+
+    def _merge_adjacent(self, results: List[Dict], order: List[int]) -> List[Dict]:
+        """Group selected chunks by URL and merge runs of consecutive chunk ids"""
+        blocks: List[Dict] = []
+        by_url: Dict[str, List[Dict]] = {}
+        for idx in order:
+            result = results[idx]
+            url = result['metadata']['url']
+            chunk_id = result['metadata'].get('chunk_id')
+            block = None
+            for candidate in by_url.get(url, []):
+                if chunk_id is not None and chunk_id == candidate['last_chunk'] + 1:
+                    candidate['content'] = _merge_overlapping(candidate['content'], result['content'])
+                    candidate['last_chunk'] = chunk_id
+                    block = candidate
+                    break
+                if chunk_id is not None and chunk_id == candidate['first_chunk'] - 1:
+                    candidate['content'] = _merge_overlapping(result['content'], candidate['content'])
+                    candidate['first_chunk'] = chunk_id
+                    block = candidate
+                    break
+            if block is None:
+                block = {
+                    'url': url,
+                    'content': result['content'],
+                    'first_chunk': chunk_id if chunk_id is not None else -2,
+                    'last_chunk': chunk_id if chunk_id is not None else -2,
+                }
+                by_url.setdefault(url, []).append(block)
+                blocks.append(block)
+        return blocks
+
+    def build(self, results: List[Dict]) -> Dict:
+        """
+        Assemble prompt context from search results.
+
+        Args:
+            results: Search hits with 'content', 'metadata', 'score' and 'embedding'
+
+        Returns:
+            Dictionary with context, sources and token accounting
+        """
+        baseline_tokens = sum(self.count_tokens(f"From {r['metadata']['url']}:\n{r['content']}")
+                              for r in results)
+        if not results:
+            return {'context': '', 'sources': [], 'tokens_used': 0,
+                    'baseline_tokens': 0, 'tokens_saved': 0, 'chunks_used': 0}
+
+        if all(r.get('embedding') is not None for r in results):
+            order = self._select_mmr(results)
+        else:
+            order = list(range(len(results)))
+
+        context_parts = []
+        sources = []
+        tokens_used = 0
+        for block in self._merge_adjacent(results, order):
+            part = f"From {block['url']}:\n{block['content']}"
+            part_tokens = self.count_tokens(part)
+            if tokens_used + part_tokens > self.max_tokens:
+                remaining = self.max_tokens - tokens_used
+                if remaining < 25:  # Only add if there's meaningful space
+                    break
+                # Trim proportionally, then tighten until it fits
+                cut = int(len(part) * remaining / part_tokens)
+                while cut > 0 and self.count_tokens(part[:cut] + "...") > remaining:
+                    cut = int(cut * 0.9)
+                if cut <= 0:
+                    break
+                part = part[:cut] + "..."
+                part_tokens = self.count_tokens(part)
+            context_parts.append(part)
+            if block['url'] not in sources:
+                sources.append(block['url'])
+            tokens_used += part_tokens
+
+        return {
+            'context': "\n\n---\n\n".join(context_parts),
+            'sources': sources,
+            'tokens_used': tokens_used,
+            'baseline_tokens': baseline_tokens,
+            'tokens_saved': max(0, baseline_tokens - tokens_used),
+            'chunks_used': len(context_parts),
+        }
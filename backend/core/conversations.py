@@ -0,0 +1,169 @@
+"""
+Bounded conversation memory for the chat endpoint.
+
+Each conversation keeps its last few turns verbatim, an extractive rolling
+summary of everything older, and the classification and retrieval results of
+its current topic so on-topic follow-ups can skip classification and search.
+Sessions expire after a TTL and are evicted least-recently-used once the
+store's approximate memory footprint exceeds its budget.
+"""
+import os
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+SENTENCE_RE = re.compile(r'(?<=[.!?])\s+')
+
+
+def _first_sentence(text: str, max_chars: int) -> str:
+    sentence = SENTENCE_RE.split(' '.join(text.split()), maxsplit=1)[0]
+    return sentence if len(sentence) <= max_chars else sentence[:max_chars - 3].rstrip() + '...'
+
+
+class Conversation:
+    """State for one chat session"""
+
+    def __init__(self, conversation_id: str):
+        self.id = conversation_id
+        self.turns: List[Tuple[str, str]] = []  # (customer message, agent response), oldest first
+        self.summary_lines: List[str] = []
+        self.ticket_id: Optional[str] = None
+        self.classification: Optional[Dict] = None
+        self.context: Optional[str] = None
+        self.sources: List[str] = []
+        self.topic_vector: Optional[np.ndarray] = None
+        self.last_used = time.time()
+
+    @property
+    def summary(self) -> str:
+        return '\n'.join(self.summary_lines)
+
+    def size_bytes(self) -> int:
+        """Approximate memory held by this conversation"""
+        size = sum(len(message) + len(response) for message, response in self.turns)
+        size += sum(len(line) for line in self.summary_lines)
+        size += len(self.context or '') + sum(len(source) for source in self.sources)
+        if self.topic_vector is not None:
+            size += self.topic_vector.nbytes
+        return size + 512  # Fixed per-session overhead
+
+    def is_follow_up(self, vector: np.ndarray, threshold: float) -> bool:
+        """Whether a new message stays on the topic whose retrieval results are cached"""
+        if self.topic_vector is None or self.classification is None:
+            return False
+        denominator = float(np.linalg.norm(vector) * np.linalg.norm(self.topic_vector)) or 1.0
+        return float(np.dot(vector, self.topic_vector)) / denominator >= threshold
+
+    def set_topic(self, classification: Dict, context: Optional[str], sources: List[str], vector: Optional[np.ndarray]):
+        self.classification = classification
+        self.context = context
+        self.sources = list(sources or [])
+        self.topic_vector = vector
+
+    def absorb(self, vector: np.ndarray):
+        """Fold an on-topic follow-up into the topic centroid so gradual drift is tracked"""
+        unit = vector / (np.linalg.norm(vector) or 1.0)
+        self.topic_vector = self.topic_vector / (np.linalg.norm(self.topic_vector) or 1.0) + unit
+
+    def history(self, turn_chars: int) -> str:
+        """Prompt transcript: rolling summary plus the verbatim recent turns"""
+        parts = []
+        if self.summary_lines:
+            parts.append("EARLIER IN THIS CONVERSATION (SUMMARY):\n" + self.summary)
+        if self.turns:
+            recent = []
+            for message, response in self.turns:
+                recent.append(f"Customer: {message[:turn_chars]}")
+                recent.append(f"Agent: {response[:turn_chars]}")
+            parts.append("RECENT TURNS:\n" + '\n'.join(recent))
+        return '\n\n'.join(parts)
+
+    def add_turn(self, message: str, response: str, keep_turns: int, summary_chars: int):
+        """Record a turn, folding turns beyond keep_turns into the bounded summary"""
+        self.turns.append((message, response))
+        while len(self.turns) > keep_turns:
+            old_message, old_response = self.turns.pop(0)
+            self.summary_lines.append(
+                f"- Customer asked: {_first_sentence(old_message, 160)} "
+                f"Agent: {_first_sentence(old_response, 160)}"
+            )
+        # Drop the oldest summary lines once the summary outgrows its budget
+        while len(self.summary_lines) > 1 and sum(len(line) + 1 for line in self.summary_lines) > summary_chars:
+            self.summary_lines.pop(0)
+        self.last_used = time.time()
+
+
+class ConversationStore:
+    """TTL- and memory-bounded LRU map of conversation id to Conversation"""
+
+    def __init__(self, ttl_seconds: float = 1800, max_bytes: int = 32 * 1024 * 1024,
+                 keep_turns: int = 2, summary_chars: int = 800, turn_chars: int = 600):
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.keep_turns = keep_turns
+        self.summary_chars = summary_chars
+        self.turn_chars = turn_chars
+        self._sessions: 'OrderedDict[str, Conversation]' = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self.stats = {'created': 0, 'expired': 0, 'evicted': 0, 'follow_ups': 0}
+
+    def __len__(self):
+        return len(self._sessions)
+
+    @property
+    def total_bytes(self) -> int:
+        return self._total_bytes
+
+    def get_or_create(self, conversation_id: Optional[str]) -> Conversation:
+        """Return the live conversation for an id, or start a new one (with a fresh id when none is given)"""
+        with self._lock:
+            self._expire()
+            conversation = self._sessions.get(conversation_id) if conversation_id else None
+            if conversation is None:
+                conversation = Conversation(conversation_id or str(uuid.uuid4()))
+                self._sessions[conversation.id] = conversation
+                self._sizes[conversation.id] = 0
+                self.stats['created'] += 1
+            self._sessions.move_to_end(conversation.id)
+            conversation.last_used = time.time()
+            return conversation
+
+    def save(self, conversation: Conversation):
+        """Re-account a conversation's size after it changed and evict to stay within budget"""
+        with self._lock:
+            if conversation.id not in self._sessions:
+                return
+            size = conversation.size_bytes()
+            self._total_bytes += size - self._sizes[conversation.id]
+            self._sizes[conversation.id] = size
+            self._sessions.move_to_end(conversation.id)
+            while self._total_bytes > self.max_bytes and len(self._sessions) > 1:
+                self._remove(next(iter(self._sessions)))
+                self.stats['evicted'] += 1
+
+    def _expire(self):
+        cutoff = time.time() - self.ttl_seconds
+        # Sessions are in least-recently-used order, so expired ones are at the front
+        while self._sessions:
+            conversation_id, conversation = next(iter(self._sessions.items()))
+            if conversation.last_used >= cutoff:
+                break
+            self._remove(conversation_id)
+            self.stats['expired'] += 1
+
+    def _remove(self, conversation_id: str):
+        self._sessions.pop(conversation_id, None)
+        self._total_bytes -= self._sizes.pop(conversation_id, 0)
+
+
+# Global conversation store instance
+conversation_store = ConversationStore(
+    ttl_seconds=float(os.getenv('CHAT_SESSION_TTL_SECONDS', '1800')),
+    max_bytes=int(os.getenv('CHAT_MEMORY_MAX_BYTES', str(32 * 1024 * 1024)))
+)
@@ -0,0 +1,149 @@
+"""
+Per-request deadlines for the agent pipeline.
+
+A deadline is started when a request arrives, from the X-Request-Deadline-Ms
+header or REQUEST_DEADLINE_MS, and lives in a context variable like the
+tracing span, so classify, retrieve and generate can ask how much time is
+left without it being threaded through every signature. Work run under
+tracing.propagate keeps it; background jobs have no caller waiting and run
+without one.
+
+Before a slow step a stage calls `allows(stage, needed)`. When less than
+`needed` seconds remain the stage takes its existing fallback instead, and
+the shortcut is counted and listed on the response. Upstream calls that do
+go ahead get `call_timeout()` so they cannot outlive the request.
+"""
+import contextvars
+import os
+import time
+from contextlib import contextmanager
+from typing import List, Optional
+
+from core.metrics import metrics
+
+DEADLINE_HEADER = 'X-Request-Deadline-Ms'
+
+# Minimum time a stage needs to be worth starting, and time kept back for building the response
+CLASSIFY_MIN_SECONDS = float(os.getenv('DEADLINE_CLASSIFY_MIN_MS', '1500')) / 1000
+SCRAPE_MIN_SECONDS = float(os.getenv('DEADLINE_SCRAPE_MIN_MS', '8000')) / 1000
+GENERATE_MIN_SECONDS = float(os.getenv('DEADLINE_GENERATE_MIN_MS', '2500')) / 1000
+RESERVE_SECONDS = float(os.getenv('DEADLINE_RESERVE_MS', '250')) / 1000
+
+DEADLINE_SHORTCUTS = metrics.counter(
+    'helpdesk_deadline_shortcuts_total',
+    'Pipeline stages skipped or cut short to meet the request deadline',
+    ('stage',)
+)
+
+_current: contextvars.ContextVar = contextvars.ContextVar('request_deadline', default=None)
+
+
+class DeadlineExceeded(Exception):
+    """Raised when an upstream call would start with no time left"""
+
+
+class Deadline:
+    __slots__ = ('budget', 'expires_at', 'shortcuts')
+
+    def __init__(self, budget_seconds: float):
+        self.budget = budget_seconds
+        self.expires_at = time.monotonic() + budget_seconds
+        self.shortcuts: List[str] = []
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+
+def budget_from_headers(headers) -> Optional[float]:
+    """Deadline budget in seconds: the header if valid (capped), else the configured default; None for none"""
+    default_ms = float(os.getenv('REQUEST_DEADLINE_MS', '20000'))
+    max_ms = float(os.getenv('REQUEST_DEADLINE_MAX_MS', '60000'))
+    budget_ms = default_ms
+    value = headers.get(DEADLINE_HEADER)
+    if value:
+        try:
+            budget_ms = min(float(value), max_ms)
+        except ValueError:
+            pass
+    return budget_ms / 1000 if budget_ms > 0 else None
+
+
+def start(budget_seconds: Optional[float]):
+    """Begin a deadline in the current context and return a token for reset"""
+    return _current.set(Deadline(budget_seconds) if budget_seconds else None)
+
+
+def reset(token):
+    try:
+        _current.reset(token)
+    except ValueError:
+        _current.set(None)  # Reset from a different context (e.g. a streamed response)
+
+
+@contextmanager
+def scope(budget_seconds: Optional[float]):
+    token = start(budget_seconds)
+    try:
+        yield _current.get()
+    finally:
+        reset(token)
+
+
+def current() -> Optional[Deadline]:
+    return _current.get()
+
+
+def remaining() -> Optional[float]:
+    """Seconds left, or None when the current work has no deadline"""
+    active = _current.get()
+    return active.remaining() if active else None
+
+
+def timed_out(stage: str) -> bool:
+    """
+    After a failed upstream call: True (and a recorded shortcut) when the
+    failure was the deadline running out rather than an upstream error.
+    """
+    active = _current.get()
+    if active is None or active.remaining() > RESERVE_SECONDS:
+        return False
+    shortcut(stage)
+    return True
+
+
+def has(seconds: float) -> bool:
+    """True if there is no deadline or at least `seconds` remain"""
+    active = _current.get()
+    return active is None or active.remaining() >= seconds
+
+
+def shortcut(stage: str):
+    """Record that a stage took its fallback because of the deadline"""
+    active = _current.get()
+    if active is not None:
+        active.shortcuts.append(stage)
+    DEADLINE_SHORTCUTS.inc(stage=stage)
+
+
+def allows(stage: str, needed_seconds: float) -> bool:
+    """Whether a stage needing `needed_seconds` should start; records a shortcut when it should not"""
+    if has(needed_seconds + RESERVE_SECONDS):
+        return True
+    shortcut(stage)
+    return False
+
+
+def call_timeout() -> Optional[float]:
+    """Timeout for an upstream call made now: time left minus the reserve, None without a deadline"""
+    left = remaining()
+    if left is None:
+        return None
+    left -= RESERVE_SECONDS
+    if left <= 0:
+        raise DeadlineExceeded('Request deadline exceeded')
+    return left
+
+
+def shortcuts() -> List[str]:
+    active = _current.get()
+    return list(active.shortcuts) if active else []
@@ -0,0 +1,89 @@
+"""
+In-process micro-batching for query embeddings.
+
+Request threads submit single queries; one worker thread collects whatever
+arrives within a short window (up to a maximum batch size), encodes the batch
+in a single call and resolves each caller's future.
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, List
+import numpy as np
+
+from core import tracing
+
+
+class EmbeddingService:
+    """Coalesces concurrent encode calls into batches run on a single worker thread"""
+
+    def __init__(self, encode: Callable[[List[str]], np.ndarray],
+                 max_batch_size: int = 32, max_wait_ms: float = 2.0):
+        self.encode = encode
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self._worker = None
+        self._lock = threading.Lock()
+        self.stats = {'requests': 0, 'batches': 0, 'max_batch': 0}
+
+    def _ensure_worker(self):
+        if self._worker is None or not self._worker.is_alive():
+            with self._lock:
+                if self._worker is None or not self._worker.is_alive():
+                    self._worker = threading.Thread(target=self._run, name='embedding-service', daemon=True)
+                    self._worker.start()
+
+    def submit(self, text: str) -> Future:
+        """Queue a text for encoding; the future resolves to its 1-D embedding"""
+        future = Future()
+        self._ensure_worker()
+        # The caller's span travels with the item so the batch shows up in its trace
+        self._queue.put((text, future, tracing.current()))
+        return future
+
+    def encode_one(self, text: str, timeout: float = None) -> np.ndarray:
+        """Encode a single text through the batcher and return a (1, dim) float32 array"""
+        if self.max_batch_size <= 1:  # Batching disabled
+            return np.asarray(self.encode([text]), dtype='float32')
+        return self.submit(text).result(timeout=timeout).reshape(1, -1)
+
+    def _collect(self) -> list:
+        """Block for the first item, then gather more until the window closes or the batch is full"""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+                continue
+            except queue.Empty:
+                pass
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            batch = [item for item in batch if item[1].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            started = time.perf_counter()
+            try:
+                embeddings = np.asarray(self.encode([text for text, _, _ in batch]), dtype='float32')
+                finished = time.perf_counter()
+                for row, (_, future, parent) in zip(embeddings, batch):
+                    tracing.record_span(parent, 'embed_batch', started, finished, batch_size=len(batch))
+                    future.set_result(row)
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+            self.stats['requests'] += len(batch)
+            self.stats['batches'] += 1
+            self.stats['max_batch'] = max(self.stats['max_batch'], len(batch))
@@ -0,0 +1,125 @@
+"""
+Query encoder backends for the knowledge base.
+
+The default backend runs the SentenceTransformer model through PyTorch. The ONNX
+backend exports the same transformer once, optionally quantizes it to dynamic
+int8, and runs it with ONNX Runtime, which is considerably cheaper on CPU-only nodes.
+"""
+import os
+from typing import List
+import numpy as np
+
+try:
+    import onnxruntime as ort
+except ImportError:  # Optional dependency
+    ort = None
+
+from core.structured_log import get_logger
+
+log = get_logger('encoders')
+
+ENCODER_BACKENDS = ('torch', 'onnx', 'onnx-int8')
+
+
+class OnnxEncoder:
+    """Mean-pooled sentence embeddings from an ONNX export of a SentenceTransformer model"""
+
+    def __init__(self, model_path: str, tokenizer, max_seq_length: int = 256, threads: int = 0):
+        if ort is None:
+            raise ImportError("onnxruntime is not installed")
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(model_path, options, providers=['CPUExecutionProvider'])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.tokenizer = tokenizer
+        self.max_seq_length = max_seq_length
+        self.model_path = model_path
+
+    @classmethod
+    def from_sentence_transformer(cls, model, cache_dir: str, quantize: bool = False) -> 'OnnxEncoder':
+        """Export (once) and load an ONNX copy of a SentenceTransformer's transformer module"""
+        os.makedirs(cache_dir, exist_ok=True)
+        fp32_path = os.path.join(cache_dir, 'encoder.onnx')
+        int8_path = os.path.join(cache_dir, 'encoder.int8.onnx')
+
+        if not os.path.exists(fp32_path):
+            export_onnx(model, fp32_path)
+        model_path = fp32_path
+        if quantize:
+            if not os.path.exists(int8_path):
+                from onnxruntime.quantization import quantize_dynamic, QuantType
+                log.info("Quantizing ONNX encoder to int8", extra={'path': int8_path})
+                quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+            model_path = int8_path
+
+        threads = int(os.getenv('KB_ENCODER_THREADS', '0'))
+        return cls(model_path, model.tokenizer, model.max_seq_length, threads=threads)
+
+    def encode(self, sentences: List[str], batch_size: int = 32, **kwargs) -> np.ndarray:
+        """Encode sentences into float32 embeddings (same layout as SentenceTransformer.encode)"""
+        if isinstance(sentences, str):
+            sentences = [sentences]
+        outputs = []
+        for start in range(0, len(sentences), batch_size):
+            batch = sentences[start:start + batch_size]
+            features = self.tokenizer(batch, padding=True, truncation=True,
+                                      max_length=self.max_seq_length, return_tensors='np')
+            feed = {name: features[name].astype('int64') for name in self.input_names if name in features}
+            if 'token_type_ids' in self.input_names and 'token_type_ids' not in feed:
+                feed['token_type_ids'] = np.zeros_like(feed['input_ids'])
+            token_embeddings = self.session.run(None, feed)[0]
+
+            # Mean pooling over non-padding tokens
+            mask = features['attention_mask'][..., None].astype('float32')
+            summed = (token_embeddings * mask).sum(axis=1)
+            outputs.append(summed / np.clip(mask.sum(axis=1), 1e-9, None))
+        if not outputs:
+            return np.zeros((0, 0), dtype='float32')
+        return np.vstack(outputs).astype('float32')
+
+
+def export_onnx(model, path: str):
+    """Export the transformer module of a SentenceTransformer to ONNX with dynamic batch/sequence axes"""
+    import torch
+
+    log.info("Exporting query encoder to ONNX", extra={'path': path})
+    transformer = model[0].auto_model
+    transformer.eval()
+    sample = model.tokenizer(["export sample"], return_tensors='pt')
+    input_names = [name for name in ('input_ids', 'attention_mask', 'token_type_ids') if name in sample]
+    dynamic_axes = {name: {0: 'batch', 1: 'sequence'} for name in input_names}
+    dynamic_axes['token_embeddings'] = {0: 'batch', 1: 'sequence'}
+
+    with torch.no_grad():
+        torch.onnx.export(
+            transformer,
+            tuple(sample[name] for name in input_names),
+            path,
+            input_names=input_names,
+            output_names=['token_embeddings'],
+            dynamic_axes=dynamic_axes,
+            opset_version=17,
+        )
+
+
+def load_query_encoder(model, backend: str, cache_dir: str):
+    """
+    Return the encoder used for query embeddings.
+
+    Falls back to the SentenceTransformer itself when the backend is 'torch' or
+    the ONNX runtime is unavailable.
+    """
+    if backend not in ENCODER_BACKENDS:
+        log.warning("Unknown encoder backend, using torch", extra={'backend': backend})
+        return model
+    if backend == 'torch':
+        return model
+    try:
+        encoder = OnnxEncoder.from_sentence_transformer(model, cache_dir, quantize=backend == 'onnx-int8')
+        log.info("Using ONNX query encoder", extra={'backend': backend, 'path': encoder.model_path})
+        return encoder
+    except Exception as e:
+        log.warning("Could not load query encoder, using torch", extra={'backend': backend, 'error': str(e)})
+        return model
@@ -0,0 +1,85 @@
+"""
+In-process publish/subscribe bus for live ticket events.
+
+Publishing never blocks: each subscriber has a bounded queue, and a subscriber
+that falls behind has its backlog dropped and replaced by a single 'resync'
+event, telling the client to refetch instead of slowing down everyone else.
+"""
+import os
+import queue
+import threading
+from typing import Any, Dict, List, Optional
+
+RESYNC = 'resync'
+
+
+class Subscription:
+    """A subscriber's bounded event queue"""
+
+    def __init__(self, maxsize: int):
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.dropped = 0
+
+    def offer(self, item: Dict):
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            # Slow consumer: discard the backlog and ask it to resynchronize
+            while True:
+                try:
+                    self.queue.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    break
+            try:
+                self.queue.put_nowait({'event': RESYNC, 'seq': item.get('seq'), 'data': {}})
+            except queue.Full:
+                pass
+
+    def get(self, timeout: float) -> Optional[Dict]:
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class EventBus:
+    """Fans published events out to every current subscription"""
+
+    def __init__(self, max_subscribers: int = 100, queue_size: int = 100):
+        self.max_subscribers = max_subscribers
+        self.queue_size = queue_size
+        self._subscriptions: List[Subscription] = []
+        self._lock = threading.Lock()
+
+    def subscribe(self) -> Optional[Subscription]:
+        """Open a subscription, or return None when the subscriber limit is reached"""
+        with self._lock:
+            if len(self._subscriptions) >= self.max_subscribers:
+                return None
+            subscription = Subscription(self.queue_size)
+            self._subscriptions.append(subscription)
+            return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            if subscription in self._subscriptions:
+                self._subscriptions.remove(subscription)
+
+    def publish(self, event: str, data: Any, seq: Optional[int] = None):
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        item = {'event': event, 'seq': seq, 'data': data}
+        for subscription in subscriptions:
+            subscription.offer(item)
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscriptions)
+
+
+# Global event bus instance
+event_bus = EventBus(
+    max_subscribers=int(os.getenv('SSE_MAX_CLIENTS', '100')),
+    queue_size=int(os.getenv('SSE_QUEUE_SIZE', '100'))
+)
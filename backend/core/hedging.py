@@ -0,0 +1,218 @@
+"""
+Hedged requests for long-tailed upstream calls.
+
+A hedged call starts the request as usual and, if it has not returned by the
+moving p95 latency of recent attempts for that operation, sends a second
+identical request and takes whichever succeeds first. The loser cannot be
+cancelled once the Gemini SDK has sent it, so it is left to finish (bounded by
+the same deadline timeout) and its result is ignored; its latency still feeds
+the percentile window.
+
+Hedges are capped by a token budget: every call earns `budget_ratio` of a
+token and a hedge spends a whole one, so over time no more than that fraction
+of calls is hedged however slow the upstream gets. Hedging is opt-in per
+operation with HEDGE_OPERATIONS (e.g. "classify" or "classify,generate").
+
+Each attempt's own duration is recorded with attempt="primary"/"hedge", next
+to the duration the caller actually waited, so comparing the primary p99 with
+the call p99 shows what hedging saves.
+"""
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterable, Optional
+
+from core import deadline
+from core.metrics import metrics
+from core.tracing import propagate
+
+HEDGE_CALLS = metrics.counter(
+    'helpdesk_llm_hedge_calls_total',
+    'Calls made under a hedging policy, by how they completed',
+    ('operation', 'outcome')  # unhedged, over_budget, primary_won, hedge_won
+)
+HEDGE_ATTEMPT_SECONDS = metrics.histogram(
+    'helpdesk_llm_attempt_duration_seconds',
+    'Duration of individual upstream attempts under a hedging policy',
+    ('operation', 'attempt')
+)
+HEDGE_CALL_SECONDS = metrics.histogram(
+    'helpdesk_llm_hedged_call_duration_seconds',
+    'Time callers waited for a call under a hedging policy',
+    ('operation',)
+)
+
+
+class LatencyWindow:
+    """Most recent attempt latencies for one operation"""
+
+    def __init__(self, size: int):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def __len__(self):
+        return len(self._samples)
+
+    def percentile(self, q: float) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+class HedgeBudget:
+    """Token bucket that lets at most `ratio` of calls hedge, with a small burst allowance"""
+
+    def __init__(self, ratio: float, burst: float):
+        self.ratio = ratio
+        self.burst = burst
+        self._tokens = burst
+        self._lock = threading.Lock()
+
+    def earn(self):
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + self.ratio)
+
+    def spend(self) -> bool:
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+    @property
+    def tokens(self) -> float:
+        return self._tokens
+
+
+class Hedger:
+    """Runs calls for opted-in operations with a hedge after the moving percentile delay"""
+
+    def __init__(self, operations: Iterable[str] = (), percentile: float = 0.95, window: int = 500,
+                 min_samples: int = 50, min_delay: float = 0.05, budget_ratio: float = 0.05,
+                 budget_burst: float = 5.0, max_workers: int = 32):
+        self.operations = set(operations)
+        self.percentile = percentile
+        self.window = window
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.budget = HedgeBudget(budget_ratio, budget_burst)
+        self._windows: Dict[str, LatencyWindow] = {}
+        self._lock = threading.Lock()
+        self._pool = None
+        self.max_workers = max_workers
+        self.stats = {'calls': 0, 'hedged': 0, 'hedge_won': 0, 'over_budget': 0}
+
+    def _window(self, operation: str) -> LatencyWindow:
+        with self._lock:
+            if operation not in self._windows:
+                self._windows[operation] = LatencyWindow(self.window)
+            return self._windows[operation]
+
+    def _executor(self) -> ThreadPoolExecutor:
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='llm-hedge')
+        return self._pool
+
+    def delay(self, operation: str) -> Optional[float]:
+        """Seconds to wait before hedging, or None until enough attempts have been seen"""
+        window = self._window(operation)
+        if len(window) < self.min_samples:
+            return None
+        return max(self.min_delay, window.percentile(self.percentile))
+
+    def _submit(self, operation: str, attempt: str, fn: Callable[[], Any]):
+        window = self._window(operation)
+
+        def timed():
+            started = time.perf_counter()
+            try:
+                return fn()
+            finally:
+                elapsed = time.perf_counter() - started
+                window.add(elapsed)
+                HEDGE_ATTEMPT_SECONDS.observe(elapsed, operation=operation, attempt=attempt)
+        return self._executor().submit(propagate(timed))
+
+    def run(self, operation: str, fn: Callable[[], Any], timeout: Optional[float] = None) -> Any:
+        """
+        Call fn, hedging it if the operation is opted in. fn is called once per
+        attempt and must be safe to run twice. Gives up after `timeout` seconds.
+        """
+        if operation not in self.operations:
+            return fn()
+        self.stats['calls'] += 1
+        self.budget.earn()
+        started = time.perf_counter()
+        give_up_at = None if timeout is None else started + timeout
+
+        def left():
+            return None if give_up_at is None else max(0.0, give_up_at - time.perf_counter())
+
+        primary = self._submit(operation, 'primary', fn)
+        pending = {primary}
+        outcome = 'unhedged'
+        delay = self.delay(operation)
+        if delay is not None and (give_up_at is None or delay < left()):
+            done, _ = wait(pending, timeout=delay)
+            if not done:
+                # A hedge that cannot finish before the deadline is not worth sending
+                if not deadline.has(delay) or not self.budget.spend():
+                    outcome = 'over_budget'
+                    self.stats['over_budget'] += 1
+                else:
+                    pending.add(self._submit(operation, 'hedge', fn))
+                    outcome = 'primary_won'
+                    self.stats['hedged'] += 1
+
+        try:
+            error = None
+            while pending:
+                done, pending = wait(pending, timeout=left(), return_when=FIRST_COMPLETED)
+                if not done:
+                    raise TimeoutError(f"{operation} call timed out")
+                for future in done:
+                    if future.exception() is None:
+                        if future is not primary:
+                            outcome = 'hedge_won'
+                            self.stats['hedge_won'] += 1
+                        return future.result()
+                    error = future.exception()
+            # Every attempt failed; surface the last error as an unhedged call would
+            raise error
+        finally:
+            HEDGE_CALLS.inc(operation=operation, outcome=outcome)
+            HEDGE_CALL_SECONDS.observe(time.perf_counter() - started, operation=operation)
+
+    def status(self) -> Dict:
+        return {
+            'operations': sorted(self.operations),
+            'percentile': self.percentile,
+            'delay_seconds': {op: self.delay(op) for op in sorted(self._windows)},
+            'budget_ratio': self.budget.ratio,
+            'budget_tokens': round(self.budget.tokens, 3),
+            'hedge_rate': round(self.stats['hedged'] / self.stats['calls'], 4) if self.stats['calls'] else 0.0,
+            **self.stats
+        }
+
+
+# Global hedging policy for Gemini calls; off unless HEDGE_OPERATIONS names an operation
+hedger = Hedger(
+    operations=[op.strip() for op in os.getenv('HEDGE_OPERATIONS', '').split(',') if op.strip()],
+    percentile=float(os.getenv('HEDGE_PERCENTILE', '0.95')),
+    window=int(os.getenv('HEDGE_WINDOW', '500')),
+    min_samples=int(os.getenv('HEDGE_MIN_SAMPLES', '50')),
+    min_delay=float(os.getenv('HEDGE_MIN_DELAY_MS', '50')) / 1000,
+    budget_ratio=float(os.getenv('HEDGE_BUDGET_PERCENT', '5')) / 100,
+    budget_burst=float(os.getenv('HEDGE_BUDGET_BURST', '5')),
+    max_workers=int(os.getenv('HEDGE_MAX_WORKERS', '32'))
+)
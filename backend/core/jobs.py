@@ -0,0 +1,288 @@
+"""
+Persistent, priority-ordered background job queue.
+
+A job moves through named stages (for agent jobs: 'classify' then 'respond').
+Each stage handler updates the job and returns the next stage, or None when
+the job is finished. Queued stages are ordered by a rank computed from the job,
+so urgent work overtakes queued routine work, and then by submission order.
+
+Jobs live in a directory with one JSON file per job (atomically replaced on
+every state change), which all worker processes share. Any process accepts
+submissions and answers status requests from the files; the process holding
+`<dir>/.owner.lock` runs the jobs, picks up files the others wrote every
+`poll_seconds`, and on taking ownership requeues jobs that were queued or
+running when the previous owner stopped. A stage may run again after that, so
+handlers must be idempotent. When the owner exits another process takes over.
+"""
+import heapq
+import json
+import os
+import threading
+import time
+import uuid
+from typing import Callable, Dict, List, Optional
+
+from core.metrics import metrics
+from core.ownership import ProcessLock
+from core import tracing
+from core.structured_log import get_logger
+
+log = get_logger('jobs')
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+FINISHED = (DONE, FAILED)
+
+
+class JobQueue:
+    """Stage-based job queue with shared file storage and a worker pool in the owning process"""
+
+    def __init__(self, path: str, workers: int = 2, keep_finished: int = 200, poll_seconds: float = 0.5):
+        self.path = path
+        self.workers = workers
+        self.keep_finished = keep_finished
+        self.poll_seconds = poll_seconds
+        self._stages: Dict[str, Callable[[Dict], Optional[str]]] = {}
+        self._rank: Callable[[Dict], int] = lambda job: 0
+        # Every job the owner knows about; empty in other processes, which read the files
+        self._jobs: Dict[str, Dict] = {}
+        self._heap: List = []
+        self._seq = 0
+        self._cond = threading.Condition()
+        self._threads: List[threading.Thread] = []
+        self._poller = None
+        self._ownership = ProcessLock(os.path.join(path, '.owner.lock'))
+
+    def register(self, stage: str, handler: Callable[[Dict], Optional[str]]):
+        """Register handler(job) -> next stage name or None"""
+        self._stages[stage] = handler
+
+    def set_rank(self, rank: Callable[[Dict], int]):
+        """Scheduling rank for a queued job; lower runs first"""
+        self._rank = rank
+
+    @property
+    def owner(self) -> bool:
+        """Whether this process runs the jobs"""
+        return bool(self._threads)
+
+    def start(self):
+        """Start following the job directory; this process runs the jobs once it owns the queue"""
+        os.makedirs(self.path, exist_ok=True)
+        with self._cond:
+            if self._poller is not None:
+                return
+            self._poller = threading.Thread(target=self._poll, name='job-poller', daemon=True)
+            self._poller.start()
+
+    def _poll(self):
+        while True:
+            try:
+                if self.owner:
+                    self._scan()
+                elif self._ownership.acquire():
+                    self._take_over()
+            except Exception:
+                log.exception("Error polling the job directory", extra={'path': self.path})
+            time.sleep(self.poll_seconds)
+
+    def _take_over(self):
+        """Load every job file, requeue unfinished jobs and start the workers"""
+        with self._cond:
+            requeued = 0
+            for job in sorted(self._read_all(), key=lambda job: job['created_at']):
+                self._jobs[job['id']] = job
+                if job['status'] in (QUEUED, RUNNING):
+                    # A job interrupted mid-stage reruns that stage
+                    job['status'] = QUEUED
+                    self._enqueue(job)
+                    requeued += 1
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f'job-worker-{i}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        log.info("Running the job queue in this process", extra={
+            'path': self.path, 'jobs': len(self._jobs), 'requeued': requeued
+        })
+
+    def _scan(self):
+        """Queue jobs other processes submitted since the last scan"""
+        for job_id in self._job_ids():
+            if job_id in self._jobs:
+                continue
+            job = self._read(job_id)
+            with self._cond:
+                if job is not None and job_id not in self._jobs:
+                    self._jobs[job_id] = job
+                    if job['status'] == QUEUED:
+                        self._enqueue(job)
+
+    def submit(self, stage: str, **fields) -> Dict:
+        """Create a job at the given stage and queue it"""
+        now = time.time()
+        job = {
+            'id': str(uuid.uuid4()),
+            'status': QUEUED,
+            'stage': stage,
+            'created_at': now,
+            'updated_at': now,
+            'version': 0,
+            'result': None,
+            'error': None,
+            # Job stages continue the submitting request's trace
+            'trace_id': tracing.current_trace_id(),
+            **fields
+        }
+        with self._cond:
+            self._write(job)
+            if self.owner:
+                self._jobs[job['id']] = job
+                self._enqueue(job)
+            # Otherwise the owner picks the file up on its next scan
+            return dict(job)
+
+    def checkpoint(self, job_id: str, **fields):
+        """Record progress from inside a stage handler and persist it at once"""
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                self._touch(job, **fields)
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                return dict(job)
+        return self._read(job_id)
+
+    def wait_for_change(self, job_id: str, version: int, timeout: float) -> Optional[Dict]:
+        """Block until the job's version moves past `version` (or timeout), returning its current state"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            if job_id in self._jobs:
+                while job_id in self._jobs and self._jobs[job_id]['version'] <= version:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                job = self._jobs.get(job_id)
+                return dict(job) if job else self._read(job_id)
+        # Run by another process: follow the job's file
+        while True:
+            job = self._read(job_id)
+            remaining = deadline - time.monotonic()
+            if job is None or job['version'] > version or remaining <= 0:
+                return job
+            time.sleep(min(self.poll_seconds, remaining))
+
+    def depth(self) -> Dict[str, int]:
+        if self.owner:
+            with self._cond:
+                jobs = list(self._jobs.values())
+        else:
+            jobs = self._read_all()
+        counts = {QUEUED: 0, RUNNING: 0, DONE: 0, FAILED: 0}
+        for job in jobs:
+            counts[job['status']] += 1
+        return counts
+
+    def _enqueue(self, job: Dict):
+        self._seq += 1
+        heapq.heappush(self._heap, (self._rank(job), self._seq, job['id']))
+        self._cond.notify_all()
+
+    def _touch(self, job: Dict, **changes):
+        job.update(changes)
+        job['updated_at'] = time.time()
+        job['version'] += 1
+        self._write(job)
+        self._cond.notify_all()
+
+    def _work(self):
+        while True:
+            with self._cond:
+                while not self._heap:
+                    self._cond.wait()
+                _, _, job_id = heapq.heappop(self._heap)
+                job = self._jobs.get(job_id)
+                if job is None or job['status'] != QUEUED:
+                    continue
+                self._touch(job, status=RUNNING)
+                handler = self._stages.get(job['stage'])
+                snapshot = dict(job)
+
+            try:
+                if handler is None:
+                    raise ValueError(f"No handler for stage {snapshot['stage']}")
+                with tracing.traced(f"job.{snapshot['stage']}", snapshot.get('trace_id'), job_id=job_id):
+                    next_stage = handler(snapshot)
+                error = None
+            except Exception as e:
+                log.exception("Job failed", extra={'job_id': job_id, 'stage': snapshot['stage']})
+                next_stage, error = None, str(e)
+
+            with self._cond:
+                # Copy back whatever the handler recorded on the job
+                snapshot.pop('version', None)
+                job.update(snapshot)
+                if error is not None:
+                    self._touch(job, status=FAILED, error=error)
+                elif next_stage is None:
+                    self._touch(job, status=DONE)
+                else:
+                    job['stage'] = next_stage
+                    self._touch(job, status=QUEUED)
+                    self._enqueue(job)
+                self._prune()
+
+    def _prune(self):
+        finished = [job for job in self._jobs.values() if job['status'] in FINISHED]
+        if len(finished) > self.keep_finished:
+            finished.sort(key=lambda job: job['updated_at'])
+            for job in finished[:len(finished) - self.keep_finished]:
+                del self._jobs[job['id']]
+                try:
+                    os.remove(self._job_path(job['id']))
+                except FileNotFoundError:
+                    pass
+
+    def _job_path(self, job_id: str) -> str:
+        return os.path.join(self.path, f"{job_id}.json")
+
+    def _job_ids(self) -> List[str]:
+        return [name[:-len('.json')] for name in os.listdir(self.path) if name.endswith('.json')]
+
+    def _read(self, job_id: str) -> Optional[Dict]:
+        try:
+            uuid.UUID(job_id)  # Ids come from URLs; never let one name a path outside the directory
+            with open(self._job_path(job_id), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (ValueError, FileNotFoundError):
+            return None
+
+    def _read_all(self) -> List[Dict]:
+        jobs = []
+        for job_id in self._job_ids():
+            job = self._read(job_id)
+            if job is not None:
+                jobs.append(job)
+        return jobs
+
+    def _write(self, job: Dict):
+        tmp_path = os.path.join(self.path, f".{job['id']}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(job, f, ensure_ascii=False)
+        os.replace(tmp_path, self._job_path(job['id']))
+
+
+# Global agent job queue instance
+job_queue = JobQueue(
+    path=os.getenv('AGENT_JOBS_DIR', 'agent_jobs'),
+    workers=int(os.getenv('AGENT_JOB_WORKERS', '2')),
+    poll_seconds=float(os.getenv('AGENT_JOBS_POLL_SECONDS', '0.5'))
+)
+
+metrics.gauge('helpdesk_agent_jobs_queued', 'Agent job stages waiting for a worker (in the owning process)',
+              callback=lambda: len(job_queue._heap))
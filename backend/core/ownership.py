@@ -0,0 +1,41 @@
+"""
+Single-owner background work across worker processes.
+
+Under gunicorn every worker imports the app and would start the same
+background loops. Work that must run in exactly one process (running agent
+jobs, classifying unclassified tickets) takes a ProcessLock first: an
+exclusive, non-blocking flock that the operating system releases when the
+owning process exits, so another worker can take over by trying again.
+"""
+from typing import Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process file locks, assume a single process
+    fcntl = None
+
+
+class ProcessLock:
+    """Exclusive lock on `path`, held for the life of the process once acquired"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+
+    def acquire(self) -> bool:
+        """Take the lock if no other process holds it; returns whether this process owns it"""
+        if fcntl is None:
+            return True
+        if self._file is None:
+            lock_file = open(self.path, 'w')
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock_file.close()
+                return False
+            self._file = lock_file
+        return True
+
+    @property
+    def held(self) -> bool:
+        return fcntl is None or self._file is not None
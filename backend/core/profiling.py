@@ -0,0 +1,376 @@
+"""
+On-demand profiling for running workers.
+
+Three hooks, all gated behind ADMIN_TOKEN:
+
+- Per-request profiles: an admin request carrying `X-Profile: cpu` runs under
+  cProfile (saved as a pstats `.prof` file); `X-Profile: sample` samples the
+  request thread's stack instead (saved as collapsed `.folded` stacks, the
+  input format of flamegraph.pl, speedscope and inferno).
+- Memory reports: tracemalloc top allocators plus the footprint of the large
+  in-process structures (knowledge base chunks, FAISS indexes, model weights).
+- A continuous low-rate sampler over all threads that writes one `.folded`
+  window file per flush interval.
+
+Profiles are written to PROFILE_DIR and named after the request's trace id, so
+a slow trace found with trace_view.py can be profiled by replaying it with the
+same X-Trace-Id.
+"""
+import cProfile
+import hmac
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import Dict, List, Optional
+
+from core.structured_log import get_logger
+
+log = get_logger('profiling')
+
+PROFILE_CPU = 'cpu'
+PROFILE_SAMPLE = 'sample'
+PROFILE_MODES = (PROFILE_CPU, PROFILE_SAMPLE)
+
+
+def is_admin(headers) -> bool:
+    """True when the request carries the configured admin token (hooks are off without one)"""
+    token = os.getenv('ADMIN_TOKEN')
+    if not token:
+        return False
+    return hmac.compare_digest(headers.get('X-Admin-Token', ''), token)
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def fold_stack(frame, prefix: Optional[str] = None) -> str:
+    """Collapsed stack for a frame, root first, separated by semicolons"""
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    if prefix:
+        labels.append(prefix)
+    return ';'.join(reversed(labels))
+
+
+def write_folded(path: str, counts: Counter):
+    """Write `stack count` lines, heaviest first"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        for stack, count in counts.most_common():
+            f.write(f"{stack} {count}\n")
+    os.replace(tmp_path, path)
+
+
+class StackSampler:
+    """Samples Python stacks from a background thread via sys._current_frames()"""
+
+    def __init__(self, interval: float, thread_id: Optional[int] = None):
+        self.interval = interval
+        self.thread_id = thread_id  # None samples every thread, prefixed with its name
+        self.counts: Counter = Counter()
+        self.samples = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> Counter:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self.drain()
+
+    def drain(self) -> Counter:
+        """Take the stacks collected so far and start a new window"""
+        with self._lock:
+            counts, self.counts = self.counts, Counter()
+        return counts
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            if self.thread_id is not None:
+                frame = frames.get(self.thread_id)
+                stacks = [fold_stack(frame)] if frame is not None else []
+            else:
+                names = {t.ident: t.name for t in threading.enumerate()}
+                stacks = [fold_stack(frame, names.get(tid, str(tid)))
+                          for tid, frame in frames.items() if tid != own]
+            del frames
+            with self._lock:
+                for stack in stacks:
+                    self.counts[stack] += 1
+                self.samples += 1
+
+
+class RequestProfile:
+    """Profile of a single request, started before the view and saved at teardown"""
+
+    def __init__(self, mode: str, name: str, directory: str, sample_interval: float):
+        self.mode = mode
+        self.name = name
+        self.path = os.path.join(directory, f"{name}.{'prof' if mode == PROFILE_CPU else 'folded'}")
+        self._profiler = None
+        self._sampler = None
+        if mode == PROFILE_CPU:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        else:
+            self._sampler = StackSampler(sample_interval, threading.get_ident())
+            self._sampler.start()
+
+    @property
+    def filename(self) -> str:
+        return os.path.basename(self.path)
+
+    def finish(self):
+        if self._profiler is not None:
+            self._profiler.disable()
+            self._profiler.dump_stats(self.path)
+        else:
+            write_folded(self.path, self._sampler.stop())
+
+
+class Profiler:
+    """Per-request profiles, the continuous sampler and memory reports for one process"""
+
+    def __init__(self, directory: str, sample_interval_ms: float = 1.0,
+                 continuous_interval_ms: float = 50.0, flush_seconds: float = 60.0, keep_files: int = 100):
+        self.directory = directory
+        self.sample_interval = sample_interval_ms / 1000
+        self.continuous_interval = continuous_interval_ms / 1000
+        self.flush_seconds = flush_seconds
+        self.keep_files = keep_files
+        self._cpu_lock = threading.Lock()  # cProfile allows one active profiler per process
+        self._continuous: Optional[StackSampler] = None
+        self._continuous_lock = threading.Lock()
+        self._flush_thread = None
+        self.stats = {'cpu': 0, 'sample': 0, 'busy': 0, 'windows': 0}
+
+    # Per-request profiles
+
+    def start_request(self, mode: str, name: str) -> Optional[RequestProfile]:
+        """Begin profiling the current request; None if the mode is unknown or cProfile is busy"""
+        if mode not in PROFILE_MODES:
+            return None
+        os.makedirs(self.directory, exist_ok=True)
+        if mode == PROFILE_CPU and not self._cpu_lock.acquire(blocking=False):
+            self.stats['busy'] += 1
+            return None
+        try:
+            profile = RequestProfile(mode, name, self.directory, self.sample_interval)
+        except Exception:
+            if mode == PROFILE_CPU:
+                self._cpu_lock.release()
+            raise
+        self.stats[mode] += 1
+        return profile
+
+    def finish_request(self, profile: RequestProfile):
+        try:
+            profile.finish()
+        except Exception:
+            log.exception("Could not save request profile", extra={'path': profile.path})
+        finally:
+            if profile.mode == PROFILE_CPU:
+                self._cpu_lock.release()
+        self._prune()
+
+    def list_profiles(self) -> List[Dict]:
+        if not os.path.isdir(self.directory):
+            return []
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(('.prof', '.folded')):
+                stat = os.stat(os.path.join(self.directory, name))
+                entries.append({'name': name, 'bytes': stat.st_size, 'modified': stat.st_mtime})
+        return sorted(entries, key=lambda e: e['modified'], reverse=True)
+
+    def profile_path(self, name: str) -> Optional[str]:
+        """Path of a stored profile, refusing anything outside the profile directory"""
+        if os.path.basename(name) != name or not name.endswith(('.prof', '.folded')):
+            return None
+        path = os.path.join(self.directory, name)
+        return path if os.path.isfile(path) else None
+
+    def _prune(self):
+        for entry in self.list_profiles()[self.keep_files:]:
+            try:
+                os.remove(os.path.join(self.directory, entry['name']))
+            except OSError:
+                pass
+
+    # Continuous sampling
+
+    @property
+    def continuous_enabled(self) -> bool:
+        return self._continuous is not None
+
+    def set_continuous(self, enabled: bool, interval_ms: Optional[float] = None):
+        with self._continuous_lock:
+            if enabled and self._continuous is None:
+                if interval_ms:
+                    self.continuous_interval = interval_ms / 1000
+                os.makedirs(self.directory, exist_ok=True)
+                self._continuous = StackSampler(self.continuous_interval)
+                self._continuous.start()
+                self._flush_thread = threading.Thread(
+                    target=self._flush_loop, args=(self._continuous,), name='profile-flush', daemon=True)
+                self._flush_thread.start()
+                log.info("Continuous profiler started", extra={'interval_ms': self.continuous_interval * 1000})
+            elif not enabled and self._continuous is not None:
+                sampler, self._continuous = self._continuous, None
+                self._write_window(sampler.stop())
+                log.info("Continuous profiler stopped", extra={'samples': sampler.samples})
+
+    def _flush_loop(self, sampler: StackSampler):
+        while not sampler._stop.wait(self.flush_seconds):
+            self._write_window(sampler.drain())
+
+    def _write_window(self, counts: Counter):
+        if not counts:
+            return
+        self.stats['windows'] += 1
+        name = f"continuous-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{self.stats['windows']}.folded"
+        write_folded(os.path.join(self.directory, name), counts)
+        self._prune()
+
+    def status(self) -> Dict:
+        sampler = self._continuous
+        return {
+            'continuous': {
+                'enabled': sampler is not None,
+                'interval_ms': self.continuous_interval * 1000,
+                'flush_seconds': self.flush_seconds,
+                'samples': sampler.samples if sampler else 0,
+            },
+            'requests': dict(self.stats),
+            'directory': os.path.abspath(self.directory),
+        }
+
+    # Memory
+
+    @staticmethod
+    def set_tracemalloc(enabled: bool, frames: int = 1):
+        if enabled and not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+        elif not enabled and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    @staticmethod
+    def memory_report(limit: int = 20, group_by: str = 'lineno') -> Dict:
+        report = {'process': _process_memory(), 'structures': _structure_sizes()}
+        if tracemalloc.is_tracing():
+            snapshot = tracemalloc.take_snapshot().filter_traces((
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, __file__),
+                tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+            ))
+            stats = snapshot.statistics(group_by)
+            current, peak = tracemalloc.get_traced_memory()
+            report['tracemalloc'] = {
+                'tracing': True,
+                'traced_bytes': current,
+                'peak_bytes': peak,
+                'top': [{
+                    'location': _location(stat.traceback, group_by),
+                    'bytes': stat.size,
+                    'count': stat.count,
+                } for stat in stats[:limit]],
+            }
+        else:
+            report['tracemalloc'] = {'tracing': False}
+        return report
+
+
+def _location(traceback: tracemalloc.Traceback, group_by: str):
+    if group_by == 'traceback':
+        return [f"{frame.filename}:{frame.lineno}" for frame in traceback]
+    frame = traceback[0]
+    return frame.filename if group_by == 'filename' else f"{frame.filename}:{frame.lineno}"
+
+
+def _process_memory() -> Dict:
+    info = {}
+    try:
+        import resource
+        # ru_maxrss is KiB on Linux
+        info['max_rss_bytes'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    except ImportError:
+        pass
+    try:
+        with open('/proc/self/statm') as f:
+            info['rss_bytes'] = int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        pass
+    return info
+
+
+def _index_bytes(index) -> Optional[Dict]:
+    if index is None:
+        return None
+    code_size = getattr(index, 'code_size', index.d * 4)
+    return {'type': type(index).__name__, 'vectors': index.ntotal, 'dimension': index.d,
+            'bytes': index.ntotal * code_size}
+
+
+def _model_bytes(model) -> Optional[int]:
+    try:
+        return sum(p.numel() * p.element_size() for p in model.parameters())
+    except Exception:
+        return None
+
+
+def _structure_sizes() -> Dict:
+    """Footprint of the knowledge base, similarity index and conversation cache"""
+    sizes = {}
+    try:
+        from knowledge_base import kb
+        sizes['kb_documents'] = {
+            'count': len(kb.documents),
+            'bytes': sum(sys.getsizeof(doc) for doc in kb.documents),
+            'metadata_count': len(kb.metadata),
+        }
+        sizes['kb_index'] = _index_bytes(kb.index)
+        sizes['model_weights_bytes'] = _model_bytes(kb.model)
+        encoder_path = getattr(kb.query_encoder, 'model_path', None)
+        if encoder_path and os.path.exists(encoder_path):
+            sizes['onnx_encoder_bytes'] = os.path.getsize(encoder_path)
+    except Exception as e:
+        sizes['kb_error'] = str(e)
+    try:
+        from core.similar_tickets import similar_tickets
+        sizes['similar_tickets_index'] = _index_bytes(similar_tickets.index)
+    except Exception as e:
+        sizes['similar_tickets_error'] = str(e)
+    try:
+        from core.conversations import conversation_store
+        sizes['conversations_bytes'] = conversation_store.total_bytes
+    except Exception as e:
+        sizes['conversations_error'] = str(e)
+    return sizes
+
+
+# Global profiler instance
+profiler = Profiler(
+    directory=os.getenv('PROFILE_DIR', 'profiles'),
+    sample_interval_ms=float(os.getenv('PROFILE_SAMPLE_INTERVAL_MS', '1')),
+    continuous_interval_ms=float(os.getenv('PROFILE_CONTINUOUS_INTERVAL_MS', '50')),
+    flush_seconds=float(os.getenv('PROFILE_FLUSH_SECONDS', '60')),
+    keep_files=int(os.getenv('PROFILE_KEEP_FILES', '100'))
+)
+if os.getenv('PROFILE_TRACEMALLOC') == '1':
+    profiler.set_tracemalloc(True, int(os.getenv('PROFILE_TRACEMALLOC_FRAMES', '1')))
+if os.getenv('PROFILE_CONTINUOUS') == '1':
+    profiler.set_continuous(True)
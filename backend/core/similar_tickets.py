@@ -0,0 +1,146 @@
+"""
+Vector index of ticket embeddings for duplicate detection and answer reuse.
+
+Ticket texts are embedded through the knowledge base's embedding service (the
+same encoder and micro-batcher as search queries) and kept in a FAISS
+inner-product index. Encoding happens on a background worker
+fed by ticket store events, so saving a ticket never waits on the encoder.
+"""
+import os
+import queue
+import threading
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+import faiss
+
+from core.ticket_store import TICKET_CREATED, ticket_text
+from core.structured_log import get_logger
+
+log = get_logger('similar_tickets')
+
+MAX_TEXT_CHARS = 2000
+
+
+def _encode_batch(texts: List[str]) -> np.ndarray:
+    from knowledge_base import kb
+    # Wait for the final query encoder (ONNX replaces torch once the knowledge base
+    # is ready) so every ticket vector comes from the same model
+    kb.encoder_ready.wait()
+    # Through the shared micro-batcher, alongside query traffic, rather than a second caller of the model
+    futures = [kb.embedder.submit(text) for text in texts]
+    return np.vstack([future.result() for future in futures]).astype('float32')
+
+
+def _encode_one(text: str) -> np.ndarray:
+    from knowledge_base import kb
+    return np.asarray(kb.embedder.encode_one(text), dtype='float32')
+
+
+class SimilarTicketIndex:
+    """Cosine-similarity index over ticket embeddings, maintained incrementally"""
+
+    def __init__(self, dimension: int = 384, duplicate_threshold: float = 0.9, batch_size: int = 64):
+        self.dimension = dimension
+        self.duplicate_threshold = duplicate_threshold
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        self._pending = queue.Queue()
+        self._worker = None
+        self._generation = 0
+        self._reset()
+
+    def _reset(self):
+        self.index = faiss.IndexFlatIP(self.dimension)
+        self._ids: List[str] = []
+        self._rows: Dict[str, int] = {}
+
+    def __len__(self):
+        return len(self._ids)
+
+    @property
+    def backlog(self) -> int:
+        return self._pending.qsize()
+
+    def _ensure_worker(self):
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._run, name='similar-tickets', daemon=True)
+            self._worker.start()
+
+    def rebuild(self, tickets: List[Dict]):
+        """Queue every ticket for encoding into a fresh index"""
+        with self._lock:
+            self._generation += 1
+            self._reset()
+        for ticket in tickets:
+            self._pending.put((self._generation, ticket['id'], ticket_text(ticket)))
+        self._ensure_worker()
+
+    def on_ticket_event(self, event: str, ticket: Dict):
+        """TicketStore listener"""
+        if event == TICKET_CREATED and ticket['id'] not in self._rows:
+            self._pending.put((self._generation, ticket['id'], ticket_text(ticket)))
+            self._ensure_worker()
+
+    def _run(self):
+        while True:
+            batch = [self._pending.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._pending.get_nowait())
+                except queue.Empty:
+                    break
+            batch = [item for item in batch if item[0] == self._generation and item[1] not in self._rows]
+            if not batch:
+                continue
+            try:
+                vectors = _encode_batch([text[:MAX_TEXT_CHARS] for _, _, text in batch])
+                for (generation, ticket_id, _), vector in zip(batch, vectors):
+                    self.add(ticket_id, vector, generation)
+            except Exception as e:
+                log.exception("Error embedding tickets for similarity index", extra={'batch': len(batch)})
+
+    def add(self, ticket_id: str, vector: np.ndarray, generation: Optional[int] = None):
+        """Add a ticket's embedding (normalized here) unless it is already indexed"""
+        vector = np.ascontiguousarray(vector, dtype='float32').reshape(1, -1).copy()
+        faiss.normalize_L2(vector)
+        with self._lock:
+            if ticket_id in self._rows or (generation is not None and generation != self._generation):
+                return
+            self._rows[ticket_id] = len(self._ids)
+            self._ids.append(ticket_id)
+            self.index.add(vector)
+
+    def _search(self, vector: np.ndarray, limit: int, exclude: Optional[str]) -> List[Tuple[str, float]]:
+        vector = np.ascontiguousarray(vector, dtype='float32').reshape(1, -1).copy()
+        faiss.normalize_L2(vector)
+        with self._lock:
+            if not self._ids:
+                return []
+            scores, rows = self.index.search(vector, min(limit + 1, len(self._ids)))
+            hits = [(self._ids[row], float(score)) for score, row in zip(scores[0], rows[0])
+                    if row >= 0 and self._ids[row] != exclude]
+        return hits[:limit]
+
+    def similar_to_ticket(self, ticket: Dict, limit: int = 5) -> List[Tuple[str, float]]:
+        """Tickets most similar to a stored ticket, excluding itself"""
+        with self._lock:
+            row = self._rows.get(ticket['id'])
+            vector = self.index.reconstruct(row) if row is not None else None
+        if vector is None:
+            vector = _encode_one(ticket_text(ticket)[:MAX_TEXT_CHARS])
+        return self._search(vector, limit, exclude=ticket['id'])
+
+    def match_text(self, text: str, limit: int = 3) -> Tuple[np.ndarray, List[Tuple[str, float]]]:
+        """Embed new ticket text and return its vector with the closest existing tickets"""
+        vector = _encode_one(text[:MAX_TEXT_CHARS])
+        return vector, self._search(vector, limit, exclude=None)
+
+    def duplicate_of(self, hits: List[Tuple[str, float]]) -> Optional[Dict]:
+        """The best hit if it is similar enough to count as a duplicate"""
+        if hits and hits[0][1] >= self.duplicate_threshold:
+            return {'ticket_id': hits[0][0], 'score': round(hits[0][1], 4)}
+        return None
+
+
+# Global similar-ticket index instance
+similar_tickets = SimilarTicketIndex(duplicate_threshold=float(os.getenv('SIMILAR_TICKET_THRESHOLD', '0.9')))
@@ -0,0 +1,66 @@
+"""
+Single-flight coalescing of identical in-flight calls.
+
+While a call for a key is running, further calls with the same key wait for
+it and share its result (or exception) instead of issuing their own. Once the
+call finishes the key is forgotten, so this is not a cache: later identical
+calls run again.
+"""
+import hashlib
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Optional
+
+from core.metrics import CACHE_HITS
+
+
+def prompt_key(model: str, prompt: str) -> str:
+    """Hash of a prompt with whitespace normalized, scoped to the model"""
+    normalized = ' '.join(prompt.split())
+    return hashlib.sha256(f"{model}\n{normalized}".encode('utf-8')).hexdigest()
+
+
+class SingleFlight:
+    """Runs at most one call per key at a time and shares its outcome with concurrent callers"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, Future] = {}
+        self.stats = {'calls': 0, 'executed': 0, 'coalesced': 0, 'errors': 0}
+
+    def do(self, key: str, fn: Callable[[], Any], timeout: Optional[float] = None) -> Any:
+        """Run fn, or wait up to `timeout` seconds for the identical call already running"""
+        with self._lock:
+            self.stats['calls'] += 1
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+                self.stats['executed'] += 1
+            else:
+                self.stats['coalesced'] += 1
+                CACHE_HITS.inc(cache='single_flight')
+
+        if not leader:
+            return future.result(timeout)
+
+        try:
+            result = fn()
+        except BaseException as e:
+            with self._lock:
+                self.stats['errors'] += 1
+                del self._calls[key]
+            future.set_exception(e)
+            raise
+        with self._lock:
+            del self._calls[key]
+        future.set_result(result)
+        return result
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+
+# Global single-flight group for Gemini calls
+llm_flight = SingleFlight()
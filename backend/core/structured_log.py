@@ -0,0 +1,179 @@
+"""
+Non-blocking structured logging.
+
+Records are filtered and queued in the calling thread (a few microseconds, no
+I/O) and formatted as one JSON object per line by a background listener that
+owns stdout. When the queue is full records are dropped and counted rather
+than blocking the request. Every record carries the current request's trace
+id as request_id.
+
+Chatty call sites (per-page crawl logs, per-request debug lines) can use a
+sampled or rate-limited logger; warnings and errors are never sampled.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from typing import Optional
+
+from core import tracing
+
+ROOT_LOGGER = 'helpdesk'
+
+# Attributes every LogRecord has; anything else was passed through `extra`
+_STANDARD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'request_id'}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, with `extra` fields inlined"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': round(record.created, 6),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        if getattr(record, 'request_id', None):
+            entry['request_id'] = record.request_id
+        for key, value in vars(record).items():
+            if key not in _STANDARD_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Readable single-line output for local development (LOG_FORMAT=text)"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        extras = ' '.join(f"{k}={v}" for k, v in vars(record).items()
+                          if k not in _STANDARD_ATTRS and not k.startswith('_'))
+        line = f"{record.levelname:<7} {record.name}: {record.getMessage()}"
+        if extras:
+            line += f"  {extras}"
+        if getattr(record, 'request_id', None):
+            line += f"  [{record.request_id[:8]}]"
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            line += '\n' + record.exc_text
+        return line
+
+
+class SamplingFilter(logging.Filter):
+    """Keep a random fraction of records below WARNING"""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= logging.WARNING or random.random() < self.rate
+
+
+class RateLimitFilter(logging.Filter):
+    """Token bucket over records below WARNING: at most `per_second` on average, bursting to `burst`"""
+
+    def __init__(self, per_second: float, burst: Optional[float] = None):
+        super().__init__()
+        self.per_second = per_second
+        self.burst = burst or max(per_second, 1.0)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.suppressed = 0
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.per_second)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                if self.suppressed:
+                    record.suppressed = self.suppressed
+                    self.suppressed = 0
+                return True
+            self.suppressed += 1
+            return False
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that tags records with the request id and drops instead of blocking when full"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Resolve the message and request id in the caller's context; formatting happens later
+        record.request_id = tracing.current_trace_id()
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_setup_lock = threading.Lock()
+_listener: Optional[logging.handlers.QueueListener] = None
+queue_handler: Optional[NonBlockingQueueHandler] = None
+
+
+def setup_logging():
+    """Route the helpdesk logger hierarchy through the background writer (idempotent)"""
+    global _listener, queue_handler
+    with _setup_lock:
+        if _listener is not None:
+            return
+        stream = logging.StreamHandler(sys.stdout)
+        stream.setFormatter(TextFormatter() if os.getenv('LOG_FORMAT', 'json') == 'text' else JsonFormatter())
+        log_queue = queue.Queue(maxsize=int(os.getenv('LOG_QUEUE_SIZE', '10000')))
+        queue_handler = NonBlockingQueueHandler(log_queue)
+
+        root = logging.getLogger(ROOT_LOGGER)
+        root.setLevel(os.getenv('LOG_LEVEL', 'INFO').upper())
+        root.addHandler(queue_handler)
+        root.propagate = False
+
+        _listener = logging.handlers.QueueListener(log_queue, stream)
+        _listener.start()
+        atexit.register(_listener.stop)  # Drains the queue on shutdown
+
+
+def get_logger(name: str, sample_rate: Optional[float] = None,
+               max_per_second: Optional[float] = None) -> logging.Logger:
+    """
+    Logger under the helpdesk hierarchy.
+
+    Args:
+        name: Short component name, e.g. 'agent' or 'crawler'
+        sample_rate: Keep only this fraction of INFO/DEBUG records
+        max_per_second: Rate-limit INFO/DEBUG records from this logger
+    """
+    setup_logging()
+    logger = logging.getLogger(f"{ROOT_LOGGER}.{name}")
+    if sample_rate is not None and sample_rate < 1 and not any(isinstance(f, SamplingFilter) for f in logger.filters):
+        logger.addFilter(SamplingFilter(sample_rate))
+    if max_per_second is not None and not any(isinstance(f, RateLimitFilter) for f in logger.filters):
+        logger.addFilter(RateLimitFilter(max_per_second))
+    return logger
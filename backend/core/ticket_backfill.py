@@ -0,0 +1,126 @@
+"""
+Background classification of tickets that arrive without one.
+
+Seed tickets and tickets saved with a placeholder classification have no
+labels, so label filters, totals and dashboard counts would miss them until
+something classified them. This worker is attached to the ticket store like
+the derived indexes: when the store loads (and whenever an unclassified ticket
+is created) the ticket ids are queued and classified one at a time, and the
+result is written back with update_classification, which updates every index.
+
+Until then the tickets count as pending; `backlog` is reported next to
+listing totals and stats. A degraded classification (Gemini failing, or no
+API key) is not stored; the ticket is requeued and the worker backs off before
+trying again.
+
+With several worker processes only the one holding `<tickets file>.backfill.lock`
+classifies. The others track the same backlog and see its results arrive
+through the shared ticket journal; if the owner exits, one of them takes over.
+"""
+import os
+import queue
+import threading
+import time
+from typing import Dict, List
+
+from core.ownership import ProcessLock
+from core.ticket_store import TICKET_CLASSIFIED, TICKET_CREATED, ticket_store, ticket_text, with_topics
+from core.structured_log import get_logger
+
+log = get_logger('ticket_backfill')
+
+
+def _classify(text: str) -> Dict:
+    from utils import classify_ticket
+    return classify_ticket(text)
+
+
+class ClassificationBackfill:
+    """Single background worker that classifies unclassified tickets and stores the result"""
+
+    def __init__(self, store, enabled: bool = True, retry_seconds: float = 60.0):
+        self.store = store
+        self.enabled = enabled
+        self.retry_seconds = retry_seconds
+        self._pending = queue.Queue()
+        self._queued = set()
+        self._lock = threading.Lock()
+        self._worker = None
+        self._ownership = None
+        self.stats = {'classified': 0, 'retried': 0, 'errors': 0}
+
+    @property
+    def backlog(self) -> int:
+        return len(self._queued)
+
+    def _queue(self, ticket: Dict):
+        if not self.enabled or ticket.get('classification'):
+            return
+        with self._lock:
+            if ticket['id'] in self._queued:
+                return
+            self._queued.add(ticket['id'])
+        self._pending.put(ticket['id'])
+        self._ensure_worker()
+
+    def _ensure_worker(self):
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._run, name='ticket-backfill', daemon=True)
+            self._worker.start()
+
+    def rebuild(self, tickets: List[Dict]):
+        """Queue every unclassified ticket, oldest first"""
+        for ticket in reversed(tickets):
+            self._queue(ticket)
+        if self.backlog:
+            log.info("Queued unclassified tickets", extra={'tickets': self.backlog})
+
+    def on_ticket_event(self, event: str, ticket: Dict):
+        """TicketStore listener"""
+        if event == TICKET_CREATED:
+            self._queue(ticket)
+        elif event == TICKET_CLASSIFIED:
+            # Classified here, by another process, or by the classify stage of an agent job
+            with self._lock:
+                self._queued.discard(ticket['id'])
+
+    def _owns(self) -> bool:
+        if self._ownership is None:
+            self._ownership = ProcessLock(f"{self.store.path}.backfill.lock")
+        return self._ownership.acquire()
+
+    def _run(self):
+        while not self._owns():
+            time.sleep(self.retry_seconds)
+        while True:
+            ticket_id = self._pending.get()
+            ticket = self.store.get(ticket_id)
+            if ticket is None or ticket.get('classification'):
+                # Classified meanwhile (e.g. by a listing request)
+                with self._lock:
+                    self._queued.discard(ticket_id)
+                continue
+            try:
+                classification = _classify(ticket_text(ticket))
+            except Exception:
+                self.stats['errors'] += 1
+                log.exception("Backfill classification failed", extra={'ticket_id': ticket_id})
+                classification = {'degraded': True}
+            if classification.get('degraded'):
+                # Gemini is failing; keep the ticket pending and back off
+                self.stats['retried'] += 1
+                self._pending.put(ticket_id)
+                time.sleep(self.retry_seconds)
+                continue
+            self.store.update_classification(ticket_id, with_topics(classification))
+            with self._lock:
+                self._queued.discard(ticket_id)
+            self.stats['classified'] += 1
+
+
+# Global backfill worker for the ticket store
+ticket_backfill = ClassificationBackfill(
+    ticket_store,
+    enabled=os.getenv('TICKET_CLASSIFY_ON_LOAD', '1') == '1',
+    retry_seconds=float(os.getenv('TICKET_CLASSIFY_RETRY_SECONDS', '60'))
+)
@@ -0,0 +1,204 @@
+"""
+Column-oriented in-memory index over tickets for filtered, paginated listing.
+
+Each ticket occupies one row. Scalar columns (creation time, priority rank)
+live in growable numpy arrays; every label value (topic, sentiment, priority,
+channel) has a bitmap of the rows carrying it, stored as a Python int. Filters
+are bitwise AND/OR over bitmaps, so their cost does not depend on ticket text.
+"""
+import base64
+import json
+import threading
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+from core.ticket_store import TICKET_CREATED, TICKET_CLASSIFIED, created_timestamp
+
+LABEL_FIELDS = ('topic', 'sentiment', 'priority', 'channel')
+SORT_FIELDS = ('createdAt', 'priority')
+
+
+def normalize_priority(value: Optional[str]) -> Optional[str]:
+    """'P1 (Medium)' and 'P1' both index as 'P1'"""
+    if not value:
+        return None
+    return value.split()[0].upper()
+
+
+def ticket_labels(ticket: Dict) -> Dict[str, List[str]]:
+    """Label values a ticket is indexed under, per field"""
+    classification = ticket.get('classification') or {}
+    topics = classification.get('topics')
+    if not isinstance(topics, list):
+        topics = [classification['topic']] if classification.get('topic') else []
+    elif classification.get('topic') and classification['topic'] not in topics:
+        topics = topics + [classification['topic']]
+    priority = normalize_priority(classification.get('priority'))
+    return {
+        'topic': topics,
+        'sentiment': [classification['sentiment']] if classification.get('sentiment') else [],
+        'priority': [priority] if priority else [],
+        'channel': [ticket.get('channel', 'email')],
+    }
+
+
+def encode_cursor(sort_key: float, row: int) -> str:
+    raw = json.dumps([sort_key, row]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Tuple[float, int]:
+    padded = cursor + '=' * (-len(cursor) % 4)
+    sort_key, row = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    return float(sort_key), int(row)
+
+
+class TicketIndex:
+    """Bitmap-filtered, keyset-paginated ticket listing maintained from store events"""
+
+    def __init__(self, initial_capacity: int = 1024):
+        self._lock = threading.RLock()
+        self._reset(initial_capacity)
+
+    def _reset(self, initial_capacity: int):
+        self._ids: List[str] = []
+        self._rows: Dict[str, int] = {}
+        self._created = np.zeros(initial_capacity, dtype='float64')
+        self._priority_rank = np.full(initial_capacity, 9, dtype='int8')
+        self._row_labels: List[Dict[str, List[str]]] = []
+        self._bitmaps: Dict[str, Dict[str, int]] = {field: {} for field in LABEL_FIELDS}
+        self._sorted: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+
+    def __len__(self):
+        return len(self._ids)
+
+    def rebuild(self, tickets: List[Dict]):
+        """Index tickets from scratch, oldest first so row order follows arrival order"""
+        with self._lock:
+            # Reset the columns in place; the lock itself must stay the same object
+            self._reset(max(1024, len(tickets)))
+            for ticket in reversed(tickets):
+                self._insert(ticket)
+
+    def on_ticket_event(self, event: str, ticket: Dict):
+        """TicketStore listener"""
+        with self._lock:
+            if event == TICKET_CREATED and ticket['id'] not in self._rows:
+                self._insert(ticket)
+            elif event in (TICKET_CREATED, TICKET_CLASSIFIED):
+                self._relabel(self._rows[ticket['id']], ticket)
+
+    def _grow(self):
+        capacity = len(self._created) * 2
+        created = np.zeros(capacity, dtype='float64')
+        created[:len(self._created)] = self._created
+        rank = np.full(capacity, 9, dtype='int8')
+        rank[:len(self._priority_rank)] = self._priority_rank
+        self._created, self._priority_rank = created, rank
+
+    def _insert(self, ticket: Dict):
+        row = len(self._ids)
+        if row >= len(self._created):
+            self._grow()
+        self._ids.append(ticket['id'])
+        self._rows[ticket['id']] = row
+        self._created[row] = created_timestamp(ticket)
+        self._row_labels.append({field: [] for field in LABEL_FIELDS})
+        self._relabel(row, ticket)
+
+    def _relabel(self, row: int, ticket: Dict):
+        bit = 1 << row
+        old = self._row_labels[row]
+        new = ticket_labels(ticket)
+        for field in LABEL_FIELDS:
+            bitmaps = self._bitmaps[field]
+            for value in old[field]:
+                bitmaps[value] &= ~bit
+            for value in new[field]:
+                bitmaps[value] = bitmaps.get(value, 0) | bit
+        self._row_labels[row] = new
+        priority = new['priority'][0] if new['priority'] else None
+        self._priority_rank[row] = int(priority[1:]) if priority and priority[1:].isdigit() else 9
+        self._sorted.clear()
+
+    def _order(self, field: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Rows sorted ascending by (field, row), and the sort keys in that order; cached until the next write"""
+        if field not in self._sorted:
+            n = len(self._ids)
+            keys = self._created[:n] if field == 'createdAt' else self._priority_rank[:n].astype('float64')
+            order = np.lexsort((np.arange(n), keys))
+            self._sorted[field] = (order, keys[order])
+        return self._sorted[field]
+
+    def _mask(self, filters: Dict[str, List[str]], since: Optional[float], until: Optional[float]) -> np.ndarray:
+        n = len(self._ids)
+        selected = (1 << n) - 1
+        for field, values in filters.items():
+            if not values:
+                continue
+            if field == 'priority':
+                values = [normalize_priority(v) for v in values]
+            field_bits = 0
+            for value in values:
+                field_bits |= self._bitmaps[field].get(value, 0)
+            selected &= field_bits
+        nbytes = max(1, (n + 7) // 8)
+        mask = np.unpackbits(np.frombuffer(selected.to_bytes(nbytes, 'little'), dtype=np.uint8),
+                             bitorder='little')[:n].astype(bool)
+        if since is not None:
+            mask &= self._created[:n] >= since
+        if until is not None:
+            mask &= self._created[:n] <= until
+        return mask
+
+    def query(self, filters: Dict[str, List[str]] = None, since: Optional[float] = None,
+              until: Optional[float] = None, sort: str = '-createdAt', limit: int = 50,
+              cursor: Optional[str] = None) -> Dict:
+        """
+        Filter, sort and page through ticket ids.
+
+        Args:
+            filters: Label values per field; values within a field are OR-ed, fields AND-ed
+            since, until: Inclusive creation-time bounds in epoch seconds
+            sort: 'createdAt' or 'priority', prefixed with '-' for descending
+            limit: Page size
+            cursor: Opaque cursor from a previous page
+
+        Returns:
+            Dictionary with ids for the page, next_cursor and total matches
+        """
+        descending = sort.startswith('-')
+        field = sort.lstrip('-')
+        if field not in SORT_FIELDS:
+            raise ValueError(f"Unsupported sort field: {field}")
+
+        with self._lock:
+            mask = self._mask(filters or {}, since, until)
+            order, keys = self._order(field)
+            if descending:
+                order, keys = order[::-1], keys[::-1]
+            matched = mask[order]
+            total = int(matched.sum())
+
+            start = 0
+            if cursor:
+                cursor_key, cursor_row = decode_cursor(cursor)
+                # Keyset position: first entry strictly after (key, row) in this order
+                if descending:
+                    after = (keys < cursor_key) | ((keys == cursor_key) & (order < cursor_row))
+                else:
+                    after = (keys > cursor_key) | ((keys == cursor_key) & (order > cursor_row))
+                start = int(np.argmax(after)) if after.any() else len(order)
+
+            positions = np.flatnonzero(matched[start:])[:limit + 1] + start
+            page = positions[:limit]
+            ids = [self._ids[order[p]] for p in page]
+            next_cursor = None
+            if len(positions) > limit and len(page):
+                last = page[-1]
+                next_cursor = encode_cursor(float(keys[last]), int(order[last]))
+            return {'ids': ids, 'next_cursor': next_cursor, 'total': total}
+
+
+# Global ticket index instance
+ticket_index = TicketIndex()
@@ -0,0 +1,279 @@
+"""
+Shared append-only journal with group commit for ticket persistence.
+
+Every change to the tickets (a new ticket, a classification, an answer) is a
+JSON-lines record appended to `<tickets file>.journal`. Several worker
+processes share the journal: a writer holds an exclusive file lock while it
+reads what the others appended, assigns the next sequence number and writes its
+record, so records are totally ordered and ticket ids never collide. Writing a
+record is a single write(); a background thread fsyncs whatever was written
+within `interval_ms` (or once `batch_size` records are waiting) with one
+fsync, so callers return without waiting for the disk.
+
+Once the journal holds `compact_every` records, one process folds it into the
+main JSON file with an atomic rewrite and replaces the journal with a fresh one
+that starts with a base record carrying the current sequence number. Readers
+follow a replaced journal by finishing the old file and continuing in the new
+one. On startup the journal is replayed on top of the JSON file, so anything
+fsynced before a crash is recovered.
+"""
+import atexit
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process file locks, assume a single process
+    fcntl = None
+
+from core.metrics import metrics
+from core.structured_log import get_logger
+
+log = get_logger('journal')
+
+BASE = 'base'
+
+COMMIT_SECONDS = metrics.histogram(
+    'helpdesk_ticket_journal_commit_seconds', 'Journal group commit (fsync) latency'
+)
+COMMIT_BATCH = metrics.histogram(
+    'helpdesk_ticket_journal_batch_size', 'Records per journal group commit',
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256)
+)
+
+
+class GroupCommitJournal:
+    """Journal shared between processes, with batched fsync and periodic compaction into a snapshot file"""
+
+    RETRY_INITIAL_SECONDS = 0.1
+    RETRY_MAX_SECONDS = 5.0
+
+    def __init__(self, journal_path: str, snapshot_path: str, snapshot: Callable[[], Tuple[int, List[Dict]]],
+                 batch_size: int = 64, interval_ms: float = 5.0, compact_every: int = 500,
+                 lock: Optional[threading.RLock] = None):
+        self.journal_path = journal_path
+        self.snapshot_path = snapshot_path
+        # Called with the journal lock held; returns (sequence, copy of every ticket) including other processes' records
+        self.snapshot = snapshot
+        self.batch_size = batch_size
+        self.interval = interval_ms / 1000.0
+        self.compact_every = compact_every
+        self._fd = None
+        self._inode = None
+        self._offset = 0
+        self._partial = b''
+        self.records = 0  # Records after the base record in the current journal file
+        self.base = None  # Sequence number in the current file's base record
+        # The owner's lock (the ticket store's), so reading, appending and compacting never interleave in-process
+        self._lock = lock or threading.RLock()
+        self._lock_file = None
+        self._cond = threading.Condition()
+        self._written = 0
+        self._durable = 0
+        self._thread = None
+        self.last_error = None
+        self.stats = {'records': 0, 'batches': 0, 'compactions': 0, 'errors': 0}
+
+    @contextmanager
+    def locked(self):
+        """Exclusive access to the journal across threads and processes, for appends and compaction"""
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            if self._lock_file is None:
+                self._lock_file = open(f"{self.journal_path}.lock", 'w')
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def open(self) -> List[Dict]:
+        """(Re)open the file currently at the journal path and return all of its records, base record first"""
+        fd = os.open(self.journal_path, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o644)
+        old, self._fd = self._fd, fd
+        self._inode = os.fstat(fd).st_ino
+        self._offset = 0
+        self._partial = b''
+        self.records = 0
+        self.base = None
+        if old is not None:
+            os.close(old)
+        return self.read_new()
+
+    def replaced(self) -> bool:
+        """Whether another process compacted, i.e. the journal path now names a different file"""
+        try:
+            return os.stat(self.journal_path).st_ino != self._inode
+        except FileNotFoundError:
+            return False
+
+    def has_news(self) -> bool:
+        """Cheap check (one stat) for records appended or a compaction since the last read"""
+        try:
+            stat = os.stat(self.journal_path)
+        except FileNotFoundError:
+            return False
+        return stat.st_ino != self._inode or stat.st_size > self._offset
+
+    def read_new(self) -> List[Dict]:
+        """Complete records appended to the open file since the last read; a torn final line is left for later"""
+        chunks = []
+        while True:
+            chunk = os.pread(self._fd, 1 << 20, self._offset)
+            if not chunk:
+                break
+            chunks.append(chunk)
+            self._offset += len(chunk)
+        data = self._partial + b''.join(chunks)
+        complete, _, self._partial = data.rpartition(b'\n')
+        records = []
+        for line in complete.split(b'\n'):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                log.warning("Skipping unreadable journal record", extra={'path': self.journal_path})
+                continue
+            if record.get('op') == BASE:
+                self.base = record['seq']
+            else:
+                self.records += 1
+            records.append(record)
+        return records
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='ticket-journal', daemon=True)
+            self._thread.start()
+            atexit.register(self._flush_at_exit)
+
+    def _flush_at_exit(self):
+        if not self.flush():
+            log.error("Exiting with journal records not yet fsynced",
+                      extra={'pending': self.pending, 'error': self.last_error})
+
+    def append(self, record: Dict):
+        """
+        Write a record; call inside locked() after reading every record appended
+        so far. It becomes durable with the next group commit (see flush()).
+        """
+        data = (json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8')
+        if self._partial:
+            # Nobody else can be writing while we hold the lock, so this is a line torn by a crash; end it
+            data = b'\n' + data
+            self._partial = b''
+        os.write(self._fd, data)
+        self._offset += len(data)
+        self.records += 1
+        self.stats['records'] += 1
+        with self._cond:
+            self._written += 1
+            self._cond.notify_all()
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Wait until every record appended so far is fsynced; False if that did not happen in time"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            target = self._written
+            while self._durable < target:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    @property
+    def pending(self) -> int:
+        return self._written - self._durable
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._written == self._durable:
+                    self._cond.wait()
+                # Let a group of writers arrive before paying for the fsync
+                deadline = time.monotonic() + self.interval
+                while self._written - self._durable < self.batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                target = self._written
+            self._sync_until_done(target)
+            if self.records >= self.compact_every:
+                try:
+                    self.compact()
+                except Exception:
+                    # The records are durable in the journal; compaction is retried after the next batch
+                    self.stats['errors'] += 1
+                    log.exception("Ticket journal compaction failed")
+
+    def _sync_until_done(self, target: int):
+        """
+        fsync the journal, retrying with backoff until it succeeds. Records only
+        count as durable once synced, so flush() keeps returning False while the
+        disk is failing rather than reporting unsaved tickets as saved.
+        """
+        backoff = self.RETRY_INITIAL_SECONDS
+        while True:
+            try:
+                # A duplicate descriptor stays valid if a compaction swaps the journal meanwhile
+                with self._lock:
+                    fd = os.dup(self._fd)
+                try:
+                    with COMMIT_SECONDS.time():
+                        os.fsync(fd)
+                finally:
+                    os.close(fd)
+                break
+            except Exception as e:
+                self.stats['errors'] += 1
+                self.last_error = str(e)
+                log.exception("Ticket journal fsync failed, retrying", extra={'retry_in': backoff})
+                time.sleep(backoff)
+                backoff = min(backoff * 2, self.RETRY_MAX_SECONDS)
+        with self._cond:
+            COMMIT_BATCH.observe(target - self._durable)
+            self.stats['batches'] += 1
+            self.last_error = None
+            self._durable = target
+            self._cond.notify_all()
+
+    def compact(self, upgrade: bool = False):
+        """
+        Rewrite the snapshot file atomically, then replace the journal with one
+        holding only a base record. Skipped when another process compacted first;
+        `upgrade` also compacts a journal that has no base record yet (new, or
+        written before base records existed).
+        """
+        with self.locked():
+            seq, tickets = self.snapshot()
+            if self.records < self.compact_every and not (upgrade and self.base is None):
+                return
+            if self.records:
+                # (A journal with no records only needs its base record; the file is already current)
+                tmp_path = f"{self.snapshot_path}.tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(tickets, f, indent=2, ensure_ascii=False)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.snapshot_path)
+            # A reader that opens the old journal after the snapshot was replaced
+            # replays records the snapshot already holds; replay is idempotent
+            tmp_path = f"{self.journal_path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(json.dumps({'op': BASE, 'seq': seq}) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.journal_path)
+            self.open()
+            self.stats['compactions'] += 1
+            log.info("Compacted ticket journal", extra={'tickets': len(tickets), 'seq': seq})
@@ -0,0 +1,202 @@
+"""
+Full-text search over ticket subject and body.
+
+A positional inverted index ranked with BM25. Queries are whitespace-separated
+clauses that must all match: plain terms, prefix terms ending in '*', and
+"quoted phrases". The index is updated incrementally as tickets are created.
+"""
+import bisect
+import math
+import re
+import threading
+from typing import Dict, List, Tuple
+import numpy as np
+
+from core.ticket_store import TICKET_CREATED, ticket_text
+
+TOKEN_RE = re.compile(r'\w+')
+CLAUSE_RE = re.compile(r'"([^"]+)"|(\S+)')
+MAX_PREFIX_EXPANSIONS = 50
+POSITION_STRIDE = 1 << 20  # Upper bound on tokens per ticket, for packing (row, position) keys
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_RE.findall(text.lower())
+
+
+class TicketSearchIndex:
+    """Positional inverted index with BM25 ranking, maintained from ticket store events"""
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self._ids: List[str] = []
+        self._rows: Dict[str, int] = {}
+        self._doc_lengths: List[int] = []
+        self._total_length = 0
+        # term -> {row: [positions]}; rows are appended in increasing order
+        self._postings: Dict[str, Dict[int, List[int]]] = {}
+        self._vocabulary: List[str] = []  # Sorted, for prefix expansion
+        # Per-term (rows, term frequencies) arrays, built on first query after a change
+        self._arrays: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        self._positions: Dict[str, np.ndarray] = {}
+        self._lengths = np.zeros(0, dtype='float32')
+
+    def __len__(self):
+        return len(self._ids)
+
+    def rebuild(self, tickets: List[Dict]):
+        with self._lock:
+            self._reset()
+            for ticket in reversed(tickets):
+                self._add(ticket, sort_vocabulary=False)
+            self._vocabulary = sorted(self._postings)
+
+    def on_ticket_event(self, event: str, ticket: Dict):
+        """TicketStore listener; classification changes do not affect indexed text"""
+        if event == TICKET_CREATED:
+            with self._lock:
+                if ticket['id'] not in self._rows:
+                    self._add(ticket)
+
+    def _add(self, ticket: Dict, sort_vocabulary: bool = True):
+        row = len(self._ids)
+        self._ids.append(ticket['id'])
+        self._rows[ticket['id']] = row
+        tokens = tokenize(ticket_text(ticket))[:POSITION_STRIDE]
+        self._doc_lengths.append(len(tokens))
+        self._total_length += len(tokens)
+        for position, token in enumerate(tokens):
+            postings = self._postings.get(token)
+            if postings is None:
+                postings = self._postings[token] = {}
+                if sort_vocabulary:
+                    bisect.insort(self._vocabulary, token)
+            postings.setdefault(row, []).append(position)
+            self._arrays.pop(token, None)
+            self._positions.pop(token, None)
+
+    def _expand_prefix(self, prefix: str) -> List[str]:
+        start = bisect.bisect_left(self._vocabulary, prefix)
+        terms = []
+        for term in self._vocabulary[start:start + MAX_PREFIX_EXPANSIONS]:
+            if not term.startswith(prefix):
+                break
+            terms.append(term)
+        return terms
+
+    def _term_arrays(self, term: str) -> Tuple[np.ndarray, np.ndarray]:
+        arrays = self._arrays.get(term)
+        if arrays is None:
+            postings = self._postings.get(term, {})
+            rows = np.fromiter(postings.keys(), dtype=np.int64, count=len(postings))
+            tfs = np.fromiter((len(p) for p in postings.values()), dtype=np.float32, count=len(postings))
+            arrays = self._arrays[term] = (rows, tfs)
+        return arrays
+
+    def _position_keys(self, term: str) -> np.ndarray:
+        """Sorted row * POSITION_STRIDE + position keys for every occurrence of a term"""
+        keys = self._positions.get(term)
+        if keys is None:
+            postings = self._postings.get(term, {})
+            keys = np.fromiter(
+                (row * POSITION_STRIDE + position for row, positions in postings.items() for position in positions),
+                dtype=np.int64
+            )
+            keys.sort()
+            self._positions[term] = keys
+        return keys
+
+    def _phrase_rows(self, terms: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """Rows containing the terms consecutively, with the phrase frequency"""
+        if not all(term in self._postings for term in terms):
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        # Keep start positions whose following positions hold the next phrase terms
+        starts = self._position_keys(terms[0])
+        for offset, term in enumerate(terms[1:], start=1):
+            starts = starts[np.isin(starts + offset, self._position_keys(term), assume_unique=True)]
+            if not len(starts):
+                break
+        rows, counts = np.unique(starts // POSITION_STRIDE, return_counts=True)
+        return rows, counts.astype(np.float32)
+
+    def _idf(self, df: int) -> float:
+        n = len(self._ids)
+        return math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+    def parse(self, query: str) -> List[Tuple[str, List[str]]]:
+        """Split a query into ('term' | 'prefix' | 'phrase', tokens) clauses"""
+        clauses = []
+        for phrase, word in CLAUSE_RE.findall(query):
+            if phrase:
+                tokens = tokenize(phrase)
+                if len(tokens) == 1:
+                    clauses.append(('term', tokens))
+                elif tokens:
+                    clauses.append(('phrase', tokens))
+            elif word.endswith('*') and tokenize(word):
+                clauses.append(('prefix', tokenize(word)[:1]))
+            else:
+                clauses.extend(('term', [token]) for token in tokenize(word))
+        return clauses
+
+    def search(self, query: str, limit: int = 20) -> Dict:
+        """
+        Rank tickets matching every clause of the query.
+
+        Returns:
+            Dictionary with total matches and (ticket id, score) hits, best first
+        """
+        clauses = self.parse(query)
+        if not clauses:
+            return {'total': 0, 'hits': []}
+
+        with self._lock:
+            n = len(self._ids)
+            if len(self._lengths) != n:
+                self._lengths = np.array(self._doc_lengths, dtype=np.float32)
+            avgdl = float(self._lengths.mean()) if n else 1.0
+            norm = self.k1 * (1 - self.b + self.b * self._lengths / max(avgdl, 1e-9))
+
+            # Dense accumulators: BM25 score and number of clauses matched per row
+            scores = np.zeros(n, dtype=np.float32)
+            matched = np.zeros(n, dtype=np.int32)
+            for kind, tokens in clauses:
+                if kind == 'phrase':
+                    postings = [self._phrase_rows(tokens)]
+                else:
+                    terms = self._expand_prefix(tokens[0]) if kind == 'prefix' else tokens
+                    postings = [self._term_arrays(term) for term in terms]
+                clause_hit = np.zeros(n, dtype=bool)
+                for rows, tfs in postings:
+                    if not len(rows):
+                        continue
+                    idf = self._idf(len(rows))
+                    scores[rows] += idf * tfs * (self.k1 + 1) / (tfs + norm[rows])
+                    clause_hit[rows] = True
+                if not clause_hit.any():
+                    return {'total': 0, 'hits': []}
+                matched += clause_hit
+
+            # All clauses must match
+            candidates = np.flatnonzero(matched == len(clauses))
+            if not len(candidates):
+                return {'total': 0, 'hits': []}
+            candidate_scores = scores[candidates]
+            if len(candidates) > limit:
+                top = np.argpartition(-candidate_scores, limit - 1)[:limit]
+            else:
+                top = np.arange(len(candidates))
+            top = top[np.argsort(-candidate_scores[top], kind='stable')]
+            return {
+                'total': int(len(candidates)),
+                'hits': [(self._ids[candidates[i]], float(candidate_scores[i])) for i in top]
+            }
+
+
+# Global ticket search index instance
+ticket_search_index = TicketSearchIndex()
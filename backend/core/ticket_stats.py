@@ -0,0 +1,140 @@
+"""
+Incrementally maintained dashboard aggregates over tickets.
+
+Label counters and per-hour histograms are adjusted in O(1) for every ticket
+created or (re)classified, and rebuilt from the store on startup, so chart
+data never requires scanning or shipping the full ticket list.
+"""
+import threading
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from core.ticket_store import TICKET_CREATED, TICKET_CLASSIFIED, created_timestamp
+from core.ticket_index import LABEL_FIELDS, normalize_priority, ticket_labels
+
+HISTOGRAM_FIELDS = ('topic', 'priority')
+BUCKET_SECONDS = {'hour': 3600, 'day': 86400}
+
+
+class TicketStats:
+    """Label counters and time-bucketed histograms, kept current from ticket store events"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.total = 0
+        self.unclassified = 0
+        self._counts: Dict[str, Counter] = {field: Counter() for field in LABEL_FIELDS}
+        # hour start (epoch seconds) -> field -> Counter
+        self._hourly: Dict[int, Dict[str, Counter]] = defaultdict(lambda: {f: Counter() for f in HISTOGRAM_FIELDS})
+        self._hourly_totals: Counter = Counter()
+        self._labels: Dict[str, Dict[str, List[str]]] = {}
+        self._hours: Dict[str, int] = {}
+
+    def rebuild(self, tickets: List[Dict]):
+        with self._lock:
+            self._reset()
+            for ticket in tickets:
+                self._add(ticket)
+
+    def on_ticket_event(self, event: str, ticket: Dict):
+        """TicketStore listener"""
+        with self._lock:
+            if ticket['id'] not in self._labels:
+                self._add(ticket)
+            elif event in (TICKET_CREATED, TICKET_CLASSIFIED):
+                self._apply(ticket['id'], self._labels[ticket['id']], -1)
+                self._labels[ticket['id']] = ticket_labels(ticket)
+                self._apply(ticket['id'], self._labels[ticket['id']], +1)
+
+    def _add(self, ticket: Dict):
+        created = created_timestamp(ticket)
+        self._count(ticket['id'], ticket_labels(ticket), int(created // 3600 * 3600))
+
+    def _count(self, ticket_id: str, labels: Dict[str, List[str]], hour: int):
+        self._hours[ticket_id] = hour
+        self._hourly_totals[hour] += 1
+        self.total += 1
+        self._labels[ticket_id] = labels
+        self._apply(ticket_id, labels, +1)
+
+    def _matching(self, filters: Dict[str, List[str]]) -> 'TicketStats':
+        """
+        Aggregates over only the tickets matching the filters (values within a
+        field OR-ed, fields AND-ed), counted from the cached labels on request.
+        """
+        wanted = {field: {normalize_priority(v) for v in values} if field == 'priority' else set(values)
+                  for field, values in filters.items()}
+        subset = TicketStats()
+        for ticket_id, labels in self._labels.items():
+            if all(wanted[field].intersection(labels[field]) for field in wanted):
+                subset._count(ticket_id, labels, self._hours[ticket_id])
+        return subset
+
+    def _apply(self, ticket_id: str, labels: Dict[str, List[str]], delta: int):
+        if not labels['topic'] and not labels['sentiment'] and not labels['priority']:
+            self.unclassified += delta
+        for field in LABEL_FIELDS:
+            for value in labels[field]:
+                self._counts[field][value] += delta
+        bucket = self._hourly[self._hours[ticket_id]]
+        for field in HISTOGRAM_FIELDS:
+            for value in labels[field]:
+                bucket[field][value] += delta
+
+    def snapshot(self, bucket: str = 'hour', since: Optional[float] = None,
+                 until: Optional[float] = None, filters: Dict[str, List[str]] = None) -> Dict:
+        """
+        Current aggregates.
+
+        Args:
+            bucket: Histogram resolution, 'hour' or 'day'
+            since, until: Optional epoch-second bounds for the histogram
+            filters: Label values per field; only matching tickets are counted
+
+        Returns:
+            Dictionary with totals, per-label counts and a time histogram
+        """
+        if bucket not in BUCKET_SECONDS:
+            raise ValueError(f"Unsupported bucket: {bucket}")
+        width = BUCKET_SECONDS[bucket]
+        filters = {field: values for field, values in (filters or {}).items() if values}
+        for field in filters:
+            if field not in LABEL_FIELDS:
+                raise ValueError(f"Unsupported filter field: {field}")
+        with self._lock:
+            source = self._matching(filters) if filters else self
+            merged: Dict[int, Dict] = {}
+            for hour, fields in source._hourly.items():
+                if (since is not None and hour + 3600 <= since) or (until is not None and hour > until):
+                    continue
+                start = hour // width * width
+                entry = merged.setdefault(start, {'count': 0, **{f: Counter() for f in HISTOGRAM_FIELDS}})
+                entry['count'] += source._hourly_totals[hour]
+                for field in HISTOGRAM_FIELDS:
+                    entry[field].update(fields[field])
+
+            histogram = []
+            for start in sorted(merged):
+                entry = merged[start]
+                histogram.append({
+                    'bucket': datetime.fromtimestamp(start, tz=timezone.utc).isoformat().replace('+00:00', 'Z'),
+                    'count': entry['count'],
+                    **{f: {k: v for k, v in entry[f].items() if v > 0} for f in HISTOGRAM_FIELDS}
+                })
+
+            return {
+                'total': source.total,
+                'unclassified': source.unclassified,
+                'counts': {field: {k: v for k, v in counter.items() if v > 0}
+                           for field, counter in source._counts.items()},
+                'bucket': bucket,
+                'histogram': histogram,
+            }
+
+
+# Global ticket stats instance
+ticket_stats = TicketStats()
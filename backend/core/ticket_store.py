@@ -0,0 +1,401 @@
+"""
+In-memory ticket store backed by sample_tickets.json.
+
+All ticket reads and writes go through the store so that derived indexes
+(listing, stats, search, similarity) can subscribe to changes instead of
+re-reading the file on every request. Changes are persisted write-behind
+through a group-commit journal next to the JSON file, which every worker
+process shares and follows (see core/ticket_journal.py).
+"""
+import copy
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, Tuple
+
+from core.ticket_journal import BASE, GroupCommitJournal
+from core.metrics import metrics
+from core.structured_log import get_logger
+
+log = get_logger('tickets')
+
+TICKET_CREATED = 'ticket.created'
+TICKET_CLASSIFIED = 'ticket.classified'
+
+# Journal record types
+CREATE = 'create'
+CLASSIFY = 'classify'
+ANSWER = 'answer'
+
+_BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def resolve_tickets_path() -> str:
+    """Locate sample_tickets.json, defaulting to the working directory"""
+    possible_paths = [
+        os.getenv('TICKETS_FILE', ''),
+        'sample_tickets.json',  # Current directory
+        '../sample_tickets.json',  # Parent directory
+        os.path.join(_BACKEND_DIR, 'sample_tickets.json'),  # Backend directory
+        os.path.join(os.path.dirname(_BACKEND_DIR), 'sample_tickets.json'),  # Repository root
+    ]
+    for path in possible_paths:
+        if path and os.path.exists(path):
+            return path
+    return os.getenv('TICKETS_FILE') or 'sample_tickets.json'
+
+
+def parse_timestamp(value: Optional[str]) -> float:
+    """
+    Parse an ISO-8601 timestamp (naive values are treated as UTC) into epoch seconds.
+
+    Raises ValueError for values that are not ISO-8601.
+    """
+    if not value:
+        return 0.0
+    try:
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        raise ValueError(f"Invalid timestamp {value!r}, expected ISO-8601") from None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+def created_timestamp(ticket: Dict) -> float:
+    """A stored ticket's creation time in epoch seconds; 0.0 when missing or unreadable"""
+    try:
+        return parse_timestamp(ticket.get('createdAt'))
+    except ValueError:
+        return 0.0
+
+
+def ticket_text(ticket: Dict) -> str:
+    """Text used for display and classification, handling both stored ticket formats"""
+    if 'subject' in ticket and 'body' in ticket:
+        # Old format with subject and body
+        return f"{ticket.get('subject', '')} - {ticket.get('body', '')}"
+    if 'body' in ticket:
+        # New format where body is the main text (from agent)
+        return ticket.get('body', '')
+    return ticket.get('text', '')
+
+
+def with_topics(classification: Dict) -> Dict:
+    """Add the topics array older clients expect alongside the single topic"""
+    if 'topic' in classification and 'topics' not in classification:
+        classification['topics'] = [classification['topic']]
+    return classification
+
+
+def to_api_ticket(ticket: Dict) -> Dict:
+    """Convert a stored ticket into the shape served by /api/tickets"""
+    return {
+        'id': ticket.get('id'),
+        'channel': ticket.get('channel', 'email'),
+        'createdAt': ticket.get('createdAt'),
+        'text': ticket_text(ticket),
+        'classification': ticket.get('classification', None)
+    }
+
+
+class TicketStore:
+    """
+    Holds every ticket in memory (newest first). Changes are persisted as
+    records in a journal shared by every worker process, and each process
+    applies the records the others append, so all of them serve the same tickets.
+    """
+
+    def __init__(self, path: Optional[str] = None, sync_seconds: float = 1.0):
+        self.path = path
+        self.sync_seconds = sync_seconds
+        self._tickets: List[Dict] = []
+        self._by_id: Dict[str, Dict] = {}
+        self._next_id = 1
+        self._loaded = False
+        self._lock = threading.RLock()
+        self._listeners: List[Callable[[str, Dict], None]] = []
+        self._indexes = []
+        # Sequence number of the latest journal record; records carry it, so it is shared by every process
+        self._seq = 0
+        self._changes = deque(maxlen=int(os.getenv('TICKET_CHANGE_LOG_SIZE', '10000')))
+        self._journal: Optional[GroupCommitJournal] = None
+        self._applying = False
+        self._watcher = None
+
+    def subscribe(self, listener: Callable[[str, Dict], None]):
+        """Register listener(event, ticket), called after every create or classification update"""
+        with self._lock:
+            self._listeners.append(listener)
+
+    def attach(self, index):
+        """
+        Keep a derived index in sync with the store.
+
+        The index must provide rebuild(tickets) and on_ticket_event(event, ticket).
+        It is rebuilt from the current tickets (now, when the store first loads, and
+        whenever the store has to reload) and then receives every subsequent change.
+        """
+        with self._lock:
+            if self._loaded:
+                index.rebuild(list(self._tickets))
+            self._indexes.append(index)
+            self._listeners.append(index.on_ticket_event)
+
+    @property
+    def seq(self) -> int:
+        """Sequence number of the latest change, the same in every process that has caught up"""
+        self.ensure_loaded()
+        return self._seq
+
+    def changes_since(self, since: int) -> Tuple[int, Optional[List[Dict]]]:
+        """
+        Changes after a sequence number.
+
+        Sequence numbers come from the shared journal, so a value obtained from
+        any worker process is valid here. Returns the current sequence and the
+        changes in order, or None when the requested point is older than this
+        process's change log (or unknown) and the caller has to refetch the full
+        listing.
+        """
+        self.ensure_loaded()
+        with self._lock:
+            if since == self._seq:
+                return self._seq, []
+            oldest = self._changes[0][0] - 1 if self._changes else self._seq
+            if since < oldest or since > self._seq:
+                return self._seq, None
+            changes = [
+                {'seq': seq, 'event': event, 'ticket': to_api_ticket(self._by_id[ticket_id])}
+                for seq, event, ticket_id in self._changes if seq > since
+            ]
+            return self._seq, changes
+
+    def _notify(self, event: str, ticket: Dict):
+        # Called with the lock held so listeners observe changes in commit order
+        self._changes.append((self._seq, event, ticket['id']))
+        for listener in list(self._listeners):
+            try:
+                listener(event, ticket)
+            except Exception as e:
+                log.exception("Ticket listener error", extra={'event': event})
+
+    def ensure_loaded(self):
+        """Load the tickets on first use, then pick up whatever other processes have written since"""
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    self._load()
+        elif self._journal.has_news():
+            with self._lock:
+                self._catch_up()
+
+    def _load(self):
+        if self.path is None:
+            self.path = resolve_tickets_path()
+        self._journal = GroupCommitJournal(
+            journal_path=f"{self.path}.journal",
+            snapshot_path=self.path,
+            snapshot=self._snapshot,
+            batch_size=int(os.getenv('TICKET_COMMIT_BATCH', '64')),
+            interval_ms=float(os.getenv('TICKET_COMMIT_INTERVAL_MS', '5')),
+            compact_every=int(os.getenv('TICKET_JOURNAL_COMPACT_EVERY', '500')),
+            lock=self._lock
+        )
+        # Recover records that were journaled but not yet compacted into the JSON file
+        recovered = self._reload(self._journal.open())
+        if self._journal.base is None:
+            # A journal without a base record (new, or from an older version) is folded
+            # into the file once so every process starts from the same sequence number
+            self._journal.compact(upgrade=True)
+        self._loaded = True
+        log.info("Loaded tickets", extra={'path': self.path, 'tickets': len(self._tickets), 'recovered': recovered})
+        self._journal.start()
+        self._watcher = threading.Thread(target=self._watch, name='ticket-sync', daemon=True)
+        self._watcher.start()
+
+    def _reload(self, records: List[Dict]) -> int:
+        """
+        Rebuild from the JSON file plus the records of a just-opened journal and
+        rebuild every index; returns how many journal records were applied.
+
+        The journal is opened before the file is read: a compaction replaces the
+        file first, so a newer file with an older journal only repeats records,
+        which apply idempotently.
+        """
+        tickets = []
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as f:
+                tickets = json.load(f)
+        else:
+            log.warning("Tickets file not found, starting empty", extra={'path': self.path})
+
+        for ticket in tickets:
+            ticket.setdefault('id', str(uuid.uuid4()))
+        self._tickets = tickets
+        self._by_id = {t['id']: t for t in tickets}
+        numbers = [_ticket_number(t['id']) for t in tickets]
+        self._next_id = max(numbers, default=0) + 1
+        # Without a base record, start from a millisecond clock so the sequence keeps increasing across resets
+        self._seq = self._journal.base if self._journal.base is not None else int(time.time() * 1000)
+        self._changes.clear()
+        applied = 0
+        for record in records:
+            applied += self._apply(record, notify=False)
+        for index in self._indexes:
+            index.rebuild(list(self._tickets))
+        return applied
+
+    def _catch_up(self):
+        """Apply records other processes appended to the shared journal; called with the lock held"""
+        if self._applying:
+            return  # A listener reading the store while we apply records
+        self._applying = True
+        try:
+            replaced = self._journal.replaced()
+            # After a compaction elsewhere the old file is complete; finish it before switching
+            for record in self._journal.read_new():
+                self._apply(record)
+            if replaced:
+                records = self._journal.open()
+                if self._journal.base == self._seq:
+                    for record in records:
+                        self._apply(record)
+                else:
+                    # We missed records (several compactions since we last looked); start over
+                    log.info("Reloading tickets after missing journal records",
+                             extra={'seq': self._seq, 'base': self._journal.base})
+                    self._reload(records)
+        finally:
+            self._applying = False
+
+    def _apply(self, record: Dict, notify: bool = True) -> int:
+        """Apply one journal record to the in-memory tickets; returns 1 if it changed them"""
+        op = record.get('op', CREATE)  # Journals written before record types held bare tickets
+        if op == BASE:
+            return 0
+        self._seq = record.get('seq', self._seq + 1)
+        if op == CREATE:
+            ticket = record.get('ticket', record)
+            if ticket['id'] in self._by_id:
+                return 0  # Already in the JSON file
+            # Add to beginning of list (most recent first)
+            self._tickets.insert(0, ticket)
+            self._by_id[ticket['id']] = ticket
+            self._next_id = max(self._next_id, _ticket_number(ticket['id']) + 1)
+            event = TICKET_CREATED
+        else:
+            ticket = self._by_id.get(record['id'])
+            if ticket is None:
+                return 0
+            if op == CLASSIFY:
+                ticket['classification'] = record['classification']
+                event = TICKET_CLASSIFIED
+            else:
+                ticket['answer'] = record['answer']
+                return 1
+        if notify:
+            self._notify(event, ticket)
+        return 1
+
+    def _commit(self, record: Dict):
+        """Journal and apply a change; called inside journal.locked() after _catch_up()"""
+        record['seq'] = self._seq + 1
+        # Durable within a few milliseconds via group commit; callers do not wait on disk
+        self._journal.append(record)
+        self._apply(record)
+
+    def _watch(self):
+        # Apply other processes' changes even when no request arrives, so live subscribers hear about them
+        while True:
+            time.sleep(self.sync_seconds)
+            try:
+                self.ensure_loaded()
+            except Exception:
+                log.exception("Error syncing tickets from the journal")
+
+    def all(self) -> List[Dict]:
+        """Snapshot of all stored tickets, newest first"""
+        self.ensure_loaded()
+        with self._lock:
+            return list(self._tickets)
+
+    def versioned_all(self) -> Tuple[int, List[Dict]]:
+        """All tickets (newest first) together with the sequence number they reflect"""
+        self.ensure_loaded()
+        with self._lock:
+            return self._seq, list(self._tickets)
+
+    def get(self, ticket_id: str) -> Optional[Dict]:
+        self.ensure_loaded()
+        return self._by_id.get(ticket_id)
+
+    def __len__(self):
+        self.ensure_loaded()
+        return len(self._tickets)
+
+    def add(self, text: str, channel: str, classification: Optional[dict]) -> Dict:
+        """Create, persist and publish a new ticket; classification may be None to classify later"""
+        self.ensure_loaded()
+        labels = classification or {}
+        with self._journal.locked():
+            # Ticket ids come from the shared journal, so read what other processes added first
+            self._catch_up()
+            ticket = {
+                "id": f"TICKET-{self._next_id}",
+                "channel": channel,
+                "createdAt": datetime.utcnow().isoformat() + "Z",
+                "subject": f"Agent Query: {labels.get('topic', 'General')} - {labels.get('priority', 'P2 (Low)')}",
+                "body": text,
+                "classification": classification  # Add classification data
+            }
+            self._commit({'op': CREATE, 'ticket': ticket})
+        return ticket
+
+    def update_classification(self, ticket_id: str, classification: dict) -> Optional[Dict]:
+        """Attach a classification to an existing ticket, persist it and publish it"""
+        self.ensure_loaded()
+        with self._journal.locked():
+            self._catch_up()
+            if ticket_id not in self._by_id:
+                return None
+            self._commit({'op': CLASSIFY, 'id': ticket_id, 'classification': classification})
+            return self._by_id[ticket_id]
+
+    def set_answer(self, ticket_id: str, answer: dict) -> Optional[Dict]:
+        """Persist the answer a ticket was resolved with, for reuse on near-duplicates"""
+        self.ensure_loaded()
+        with self._journal.locked():
+            self._catch_up()
+            if ticket_id not in self._by_id:
+                return None
+            self._commit({'op': ANSWER, 'id': ticket_id, 'answer': answer})
+            return self._by_id[ticket_id]
+
+    def _snapshot(self) -> Tuple[int, List[Dict]]:
+        """Sequence and deep copy of every ticket for compaction; the journal calls this with its lock held"""
+        with self._lock:
+            self._catch_up()
+            return self._seq, copy.deepcopy(self._tickets)
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Block until every change made by this process so far is durable"""
+        return self._journal.flush(timeout) if self._journal else True
+
+
+def _ticket_number(ticket_id: str) -> int:
+    """n for ids of the form TICKET-n, 0 for any other id"""
+    prefix, _, number = ticket_id.partition('-')
+    return int(number) if prefix == 'TICKET' and number.isdigit() else 0
+
+
+# Global ticket store instance
+ticket_store = TicketStore(sync_seconds=float(os.getenv('TICKET_SYNC_SECONDS', '1')))
+
+metrics.gauge('helpdesk_tickets', 'Tickets in the store', callback=lambda: len(ticket_store._tickets))
+metrics.gauge('helpdesk_ticket_journal_pending', 'Journal records written but not yet fsynced by this process',
+              callback=lambda: ticket_store._journal.pending)
@@ -0,0 +1,222 @@
+"""
+Lightweight request tracing with a sampling JSONL exporter.
+
+A trace is started per HTTP request (or background job) and spans nest through
+a context variable, so `with span('name'):` anywhere below a traced request
+records a child of whatever span is current. Work handed to other threads
+carries its parent along, either by running under `propagate(fn)` or, for
+batching workers that serve many requests at once, by capturing `current()`
+and calling `record_span` when the shared work finishes.
+
+Sampling is decided when a trace ends: a fraction of all traces plus every
+slow or failed trace is written, one JSON object per line, by a background
+writer so exporting never blocks a request.
+"""
+import contextvars
+import json
+import os
+import queue
+import random
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+TRACE_ID_RE = re.compile(r'^[0-9a-f]{32}$')
+
+_current: contextvars.ContextVar = contextvars.ContextVar('trace_span', default=None)
+
+
+class Trace:
+    """Spans of one request, collected in memory until the root span ends"""
+
+    def __init__(self, name: str, trace_id: Optional[str] = None, attrs: Optional[Dict] = None):
+        self.trace_id = trace_id or uuid.uuid4().hex
+        self.name = name
+        self.start = time.time()
+        self._start_perf = time.perf_counter()
+        self.spans: List[Dict] = []
+        self.error = False
+        self.root = Span(self, name, None, attrs)
+
+    def offset_ms(self, perf: float) -> float:
+        return round((perf - self._start_perf) * 1000, 3)
+
+
+class Span:
+    __slots__ = ('trace', 'id', 'parent_id', 'name', 'attrs', 'start', 'end')
+
+    def __init__(self, trace: Trace, name: str, parent: Optional['Span'], attrs: Optional[Dict] = None):
+        self.trace = trace
+        self.id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.id if parent else None
+        self.name = name
+        self.attrs = dict(attrs) if attrs else {}
+        self.start = time.perf_counter()
+        self.end = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def finish(self, end: Optional[float] = None):
+        self.end = end or time.perf_counter()
+        self.trace.spans.append({
+            'id': self.id,
+            'parent': self.parent_id,
+            'name': self.name,
+            'start_ms': self.trace.offset_ms(self.start),
+            'duration_ms': round((self.end - self.start) * 1000, 3),
+            'thread': threading.current_thread().name,
+            'attrs': self.attrs,
+        })
+
+
+def current() -> Optional[Span]:
+    """The active span in this context, if the current work is being traced"""
+    return _current.get()
+
+
+def current_trace_id() -> Optional[str]:
+    active = _current.get()
+    return active.trace.trace_id if active else None
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """Record a child span of the current span; a no-op outside a trace"""
+    parent = _current.get()
+    if parent is None:
+        yield None
+        return
+    child = Span(parent.trace, name, parent, attrs)
+    token = _current.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.set(error=repr(e))
+        child.trace.error = True
+        raise
+    finally:
+        _current.reset(token)
+        child.finish()
+
+
+def record_span(parent: Optional[Span], name: str, start: float, end: float, **attrs):
+    """Attach a span measured elsewhere (perf_counter times) under a captured parent span"""
+    if parent is None:
+        return
+    child = Span(parent.trace, name, parent, attrs)
+    child.start = start
+    child.finish(end)
+
+
+def propagate(fn: Callable) -> Callable:
+    """Wrap fn so it runs with the caller's trace context, e.g. when submitted to a thread pool"""
+    ctx = contextvars.copy_context()
+    return lambda *args, **kwargs: ctx.run(fn, *args, **kwargs)
+
+
+def start_trace(name: str, trace_id: Optional[str] = None, **attrs):
+    """Begin a trace in the current context and return (trace, token) for end_trace"""
+    if trace_id is not None and not TRACE_ID_RE.match(trace_id):
+        trace_id = None
+    trace = Trace(name, trace_id, attrs)
+    return trace, _current.set(trace.root)
+
+
+def end_trace(trace: Trace, token, **attrs):
+    """Finish the root span, restore the previous context and offer the trace to the exporter"""
+    trace.root.set(**attrs)
+    trace.root.finish()
+    try:
+        _current.reset(token)
+    except ValueError:
+        _current.set(None)  # Ended from a different context (e.g. a streamed response)
+    exporter.offer(trace)
+
+
+@contextmanager
+def traced(name: str, trace_id: Optional[str] = None, **attrs):
+    """Run a block as its own trace (for background work outside a request)"""
+    trace, token = start_trace(name, trace_id, **attrs)
+    try:
+        yield trace
+    except BaseException as e:
+        trace.error = True
+        trace.root.set(error=repr(e))
+        raise
+    finally:
+        end_trace(trace, token)
+
+
+class JsonlExporter:
+    """Tail-sampling exporter writing one trace per line from a background thread"""
+
+    def __init__(self, path: str, sample_rate: float = 0.1, slow_ms: float = 1000.0, max_queue: int = 1000):
+        self.path = path
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._lock = threading.Lock()
+        self.stats = {'offered': 0, 'exported': 0, 'dropped': 0}
+
+    def should_export(self, trace: Trace) -> bool:
+        duration_ms = (trace.root.end - trace.root.start) * 1000
+        return trace.error or duration_ms >= self.slow_ms or random.random() < self.sample_rate
+
+    def offer(self, trace: Trace):
+        self.stats['offered'] += 1
+        if not self.should_export(trace):
+            return
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait(trace)
+        except queue.Full:
+            self.stats['dropped'] += 1
+
+    def _ensure_worker(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='trace-exporter', daemon=True)
+                    self._thread.start()
+
+    @staticmethod
+    def serialize(trace: Trace) -> Dict[str, Any]:
+        return {
+            'trace_id': trace.trace_id,
+            'name': trace.name,
+            'start': trace.start,
+            'duration_ms': round((trace.root.end - trace.root.start) * 1000, 3),
+            'error': trace.error,
+            'spans': sorted(trace.spans, key=lambda s: s['start_ms']),
+        }
+
+    def _run(self):
+        while True:
+            traces = [self._queue.get()]
+            while True:
+                try:
+                    traces.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    for trace in traces:
+                        f.write(json.dumps(self.serialize(trace), ensure_ascii=False, default=str) + '\n')
+                self.stats['exported'] += len(traces)
+            except Exception:
+                # Imported here: structured_log imports this module for request ids
+                from core.structured_log import get_logger
+                get_logger('tracing').exception("Trace export failed", extra={'traces': len(traces)})
+
+
+# Global trace exporter instance
+exporter = JsonlExporter(
+    path=os.getenv('TRACE_FILE', 'traces.jsonl'),
+    sample_rate=float(os.getenv('TRACE_SAMPLE_RATE', '0.1')),
+    slow_ms=float(os.getenv('TRACE_SLOW_MS', '1000'))
+)
@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+"""
+Retrieval quality versus cost: sweep chunking, top_k, score threshold and index type
+
+Each configuration is scored on a labeled query set (query -> expected page URLs):
+recall@k and MRR over the hits that would go into the prompt, recall after the
+context builder's token budget, mean context tokens, and per-query search and
+context-assembly latency. Query encoding is shared by every configuration and
+reported once.
+
+    python eval_retrieval.py bootstrap                      # draft labels from sample_tickets.json
+    python eval_retrieval.py run --chunk-tokens 64 128 256 --top-k 4 8 12 --thresholds 0.2 0.3 0.4
+
+Pages are rebuilt from the persisted knowledge base (knowledge_base/*.pkl) unless
+--crawl is given. The winning settings map to KB_CHUNK_TOKENS, RAG_TOP_K and
+RAG_MIN_SCORE.
+"""
+
+import os
+import re
+import sys
+import math
+import time
+import json
+import pickle
+import argparse
+from collections import Counter, OrderedDict, defaultdict
+from datetime import datetime, timezone
+import numpy as np
+import faiss
+
+# Add the backend directory to the path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from core.chunking import StructuredChunker
+from core.context import ContextBuilder
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_LABELS = os.path.join(BACKEND_DIR, 'data', 'retrieval_eval.json')
+INDEX_TYPES = ['flat', 'sq8', 'hnsw', 'ivf']
+
+TOKEN_RE = re.compile(r'[a-z0-9]+')
+STOPWORDS = set("""a an and are as at be but by can do does for from has have how i in is it its me my of on or our
+so that the their there this to we what when where which who why will with you your not need want
+any all into about using use also just been was were they them then than these those""".split())
+
+
+# Corpus
+
+def pages_from_index(index_path):
+    """Page texts rebuilt from the persisted chunks, in chunk order"""
+    with open(os.path.join(index_path, 'documents.pkl'), 'rb') as f:
+        documents = pickle.load(f)
+    with open(os.path.join(index_path, 'metadata.pkl'), 'rb') as f:
+        metadata = pickle.load(f)
+    chunks = defaultdict(list)
+    for text, meta in zip(documents, metadata):
+        if meta.get('source') != 'fallback':
+            chunks[meta['url']].append((meta.get('chunk_id', 0), text))
+    return OrderedDict((url, '\n\n'.join(text for _, text in sorted(parts))) for url, parts in chunks.items())
+
+
+def pages_from_crawl():
+    from utils import DOC_SOURCES, discover_documentation_pages, extract_page_content
+    pages = OrderedDict()
+    for base_url, config in DOC_SOURCES.items():
+        for url in discover_documentation_pages(base_url, max_pages=15):
+            content = extract_page_content(url, config['selectors'], config['exclude'])
+            if content and len(content) > 100:
+                pages[url] = content
+    return pages
+
+
+# Labels
+
+def _terms(text):
+    return [t for t in TOKEN_RE.findall(text.lower()) if t not in STOPWORDS and len(t) > 2]
+
+
+def bootstrap_labels(pages, tickets, per_query, min_ratio):
+    """
+    Draft expected URLs per ticket by TF-IDF similarity between the ticket and
+    each page. Lexical matching is independent of the embedding model being
+    evaluated, but the drafts should still be reviewed by hand.
+    """
+    urls = list(pages)
+    page_terms = [Counter(_terms(pages[url])) for url in urls]
+    document_frequency = Counter(term for terms in page_terms for term in terms)
+    idf = {term: math.log((1 + len(urls)) / (1 + df)) + 1 for term, df in document_frequency.items()}
+
+    def weights(counts):
+        vector = {term: (1 + math.log(count)) * idf.get(term, 0) for term, count in counts.items()}
+        norm = math.sqrt(sum(v * v for v in vector.values())) or 1.0
+        return {term: v / norm for term, v in vector.items()}
+
+    page_vectors = [weights(terms) for terms in page_terms]
+    labels = []
+    for ticket in tickets:
+        query = ticket.get('body', '').strip() or ticket.get('subject', '')
+        query_vector = weights(Counter(_terms(query)))
+        scores = [sum(w * page.get(term, 0) for term, w in query_vector.items()) for page in page_vectors]
+        ranked = sorted(range(len(urls)), key=lambda i: -scores[i])
+        if not ranked or scores[ranked[0]] <= 0:
+            continue
+        best = scores[ranked[0]]
+        expected = [urls[i] for i in ranked[:per_query] if scores[i] >= best * min_ratio]
+        labels.append({
+            'id': ticket.get('id'),
+            'query': query,
+            'expected_urls': expected,
+            'topic': (ticket.get('classification') or {}).get('topic'),
+            'bootstrapped': True,
+        })
+    return labels
+
+
+# Indexes
+
+def build_index(kind, vectors, nprobe, hnsw_ef):
+    dimension = vectors.shape[1]
+    if kind == 'flat':
+        index = faiss.IndexFlatIP(dimension)
+    elif kind == 'sq8':
+        index = faiss.IndexScalarQuantizer(dimension, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT)
+    elif kind == 'hnsw':
+        index = faiss.IndexHNSWFlat(dimension, 32, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efSearch = hnsw_ef
+    elif kind == 'ivf':
+        # ~sqrt(n) lists, with enough points per list for k-means training
+        nlist = max(1, min(int(math.sqrt(len(vectors))), len(vectors) // 39))
+        index = faiss.IndexIVFFlat(faiss.IndexFlatIP(dimension), dimension, nlist, faiss.METRIC_INNER_PRODUCT)
+        index.nprobe = min(nprobe, nlist)
+    else:
+        raise ValueError(f"Unknown index type {kind}")
+    if not index.is_trained:
+        index.train(vectors)
+    index.add(vectors)
+    return index
+
+
+# Evaluation
+
+def encode(model, texts, batch_size=64):
+    vectors = np.ascontiguousarray(model.encode(texts, batch_size=batch_size), dtype='float32')
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def score_config(hits_per_query, labels, top_k, threshold, builder):
+    """recall@k, MRR and context cost for one (top_k, threshold) over pre-searched hits"""
+    from knowledge_base import select_context_hits
+    recalls, context_recalls, reciprocal_ranks, tokens, build_ms = [], [], [], [], []
+    for hits, label in zip(hits_per_query, labels):
+        selected = select_context_hits(hits[:top_k], threshold)
+        expected = set(label['expected_urls'])
+        urls = [hit['metadata']['url'] for hit in selected]
+        recalls.append(len(expected & set(urls)) / len(expected))
+        rank = next((i + 1 for i, url in enumerate(urls) if url in expected), None)
+        reciprocal_ranks.append(1 / rank if rank else 0.0)
+
+        started = time.perf_counter()
+        built = builder.build(selected)
+        build_ms.append((time.perf_counter() - started) * 1000)
+        tokens.append(built['tokens_used'])
+        context_recalls.append(len(expected & set(built['sources'])) / len(expected))
+    return {
+        'recall': round(float(np.mean(recalls)), 4),
+        'context_recall': round(float(np.mean(context_recalls)), 4),
+        'mrr': round(float(np.mean(reciprocal_ranks)), 4),
+        'context_tokens': round(float(np.mean(tokens)), 1),
+        'context_ms': round(float(np.mean(build_ms)), 3),
+    }
+
+
+def evaluate(pages, labels, model, count_tokens, args):
+    """Every combination of chunk size x index type x top_k x threshold"""
+    queries = [label['query'] for label in labels]
+    started = time.perf_counter()
+    query_vectors = np.vstack([encode(model, [query]) for query in queries])
+    encode_ms = (time.perf_counter() - started) * 1000 / len(queries)
+    builder = ContextBuilder(count_tokens=count_tokens, max_tokens=args.context_tokens)
+    max_k = max(args.top_k)
+
+    rows = []
+    for chunk_tokens in args.chunk_tokens:
+        chunker = StructuredChunker(count_tokens=count_tokens, max_tokens=chunk_tokens)
+        documents, metadata = [], []
+        for url, text in pages.items():
+            for i, chunk in enumerate(chunker.chunk(text)):
+                if len(chunk) > 50:
+                    documents.append(chunk)
+                    metadata.append({'url': url, 'chunk_id': i})
+        vectors = encode(model, documents)
+        print(f"  chunk_tokens={chunk_tokens}: {len(documents)} chunks")
+
+        for kind in args.index_types:
+            started = time.perf_counter()
+            try:
+                index = build_index(kind, vectors, args.nprobe, args.hnsw_ef)
+            except Exception as e:
+                print(f"  skipping {kind}: {e}")
+                continue
+            build_seconds = time.perf_counter() - started
+            index_bytes = int(faiss.serialize_index(index).nbytes)
+
+            hits_per_query, search_ms = [], []
+            for query_vector in query_vectors:
+                started = time.perf_counter()
+                scores, ids = index.search(query_vector[None, :], max_k)
+                search_ms.append((time.perf_counter() - started) * 1000)
+                # Stored vectors stand in for index.reconstruct, which IVF indexes only support with a direct map
+                hits_per_query.append([
+                    {'content': documents[i], 'metadata': metadata[i], 'score': float(s), 'embedding': vectors[i]}
+                    for s, i in zip(scores[0], ids[0]) if i >= 0
+                ])
+
+            for top_k in args.top_k:
+                for threshold in args.thresholds:
+                    rows.append(dict(
+                        chunk_tokens=chunk_tokens, index=kind, top_k=top_k, threshold=threshold,
+                        chunks=len(documents), index_bytes=index_bytes, build_seconds=round(build_seconds, 3),
+                        search_ms_p50=round(float(np.percentile(search_ms, 50)), 3),
+                        search_ms_p95=round(float(np.percentile(search_ms, 95)), 3),
+                        **score_config(hits_per_query, labels, top_k, threshold, builder)
+                    ))
+    return rows, encode_ms
+
+
+def cheapest(rows, min_recall):
+    """Fewest context tokens, then fastest search, among configurations meeting the recall bar"""
+    eligible = [row for row in rows if row['context_recall'] >= min_recall]
+    return min(eligible, key=lambda row: (row['context_tokens'], row['search_ms_p95'])) if eligible else None
+
+
+def print_rows(rows):
+    print(f"\n{'chunk':>5} {'index':<5} {'k':>3} {'thr':>5} {'chunks':>6} {'recall':>7} {'ctx rec':>7} {'MRR':>6} "
+          f"{'ctx tok':>8} {'srch p50':>9} {'srch p95':>9} {'ctx ms':>7} {'idx KiB':>8}")
+    for row in rows:
+        print(f"{row['chunk_tokens']:>5} {row['index']:<5} {row['top_k']:>3} {row['threshold']:>5.2f} {row['chunks']:>6} "
+              f"{row['recall']:>7.3f} {row['context_recall']:>7.3f} {row['mrr']:>6.3f} {row['context_tokens']:>8.1f} "
+              f"{row['search_ms_p50']:>9.3f} {row['search_ms_p95']:>9.3f} {row['context_ms']:>7.2f} "
+              f"{row['index_bytes'] / 1024:>8.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    for name in ('bootstrap', 'run'):
+        sub = commands.add_parser(name)
+        sub.add_argument('--labels', default=DEFAULT_LABELS, help='Labeled query set (JSON list)')
+        sub.add_argument('--index-path', default=os.path.join(BACKEND_DIR, 'knowledge_base'))
+        sub.add_argument('--crawl', action='store_true', help='Fetch pages from DOC_SOURCES instead of the saved index')
+        if name == 'bootstrap':
+            sub.add_argument('--tickets', default=os.path.join(BACKEND_DIR, 'sample_tickets.json'))
+            sub.add_argument('--per-query', type=int, default=2, help='Expected URLs drafted per ticket')
+            sub.add_argument('--min-ratio', type=float, default=0.6, help='Keep URLs scoring at least this fraction of the best')
+        else:
+            sub.add_argument('--chunk-tokens', nargs='+', type=int, default=[64, 128, 256])
+            sub.add_argument('--top-k', nargs='+', type=int, default=[4, 8, 12])
+            sub.add_argument('--thresholds', nargs='+', type=float, default=[0.2, 0.3, 0.4])
+            sub.add_argument('--index-types', nargs='+', default=['flat', 'hnsw', 'ivf'], choices=INDEX_TYPES)
+            sub.add_argument('--context-tokens', type=int, default=int(os.getenv('RAG_CONTEXT_TOKENS', '600')))
+            sub.add_argument('--nprobe', type=int, default=8)
+            sub.add_argument('--hnsw-ef', type=int, default=64)
+            sub.add_argument('--min-recall', type=float, default=0.8, help='Context recall bar for the recommendation')
+            sub.add_argument('--output', help='Result JSON (default bench_results/retrieval_<revision>_<time>.json)')
+    args = parser.parse_args()
+
+    pages = pages_from_crawl() if args.crawl else pages_from_index(args.index_path)
+    if not pages:
+        print("No documentation pages found; build the knowledge base first (python init_kb.py) or pass --crawl")
+        sys.exit(1)
+    print(f"🔧 {len(pages)} documentation pages")
+
+    if args.command == 'bootstrap':
+        with open(args.tickets, 'r', encoding='utf-8') as f:
+            tickets = json.load(f)
+        labels = bootstrap_labels(pages, tickets, args.per_query, args.min_ratio)
+        os.makedirs(os.path.dirname(os.path.abspath(args.labels)), exist_ok=True)
+        with open(args.labels, 'w', encoding='utf-8') as f:
+            json.dump(labels, f, indent=2)
+        print(f"Drafted labels for {len(labels)} of {len(tickets)} tickets in {args.labels}; review before relying on them")
+        return
+
+    if not os.path.exists(args.labels):
+        print(f"No labels at {args.labels}; draft them with `python eval_retrieval.py bootstrap`")
+        sys.exit(1)
+    with open(args.labels, 'r', encoding='utf-8') as f:
+        labels = [label for label in json.load(f) if label.get('expected_urls')]
+    missing = {url for label in labels for url in label['expected_urls']} - set(pages)
+    if missing:
+        print(f"⚠️  {len(missing)} expected URLs are not in the corpus and can never be retrieved")
+    print(f"Evaluating {len(labels)} labeled queries")
+
+    from bench_load import git_revision
+    from knowledge_base import kb
+    rows, encode_ms = evaluate(pages, labels, kb.model, kb.count_tokens, args)
+    print_rows(rows)
+    print(f"\nQuery encoding (shared by all configurations): {encode_ms:.2f} ms/query")
+
+    best = cheapest(rows, args.min_recall)
+    if best:
+        print(f"✅ Cheapest configuration with context recall >= {args.min_recall}: chunk_tokens={best['chunk_tokens']} "
+              f"index={best['index']} top_k={best['top_k']} threshold={best['threshold']} "
+              f"({best['context_tokens']} tokens, recall {best['context_recall']})")
+        print(f"   KB_CHUNK_TOKENS={best['chunk_tokens']} RAG_TOP_K={best['top_k']} RAG_MIN_SCORE={best['threshold']}")
+    else:
+        print(f"❌ No configuration reaches context recall {args.min_recall}")
+
+    revision = git_revision()
+    output = args.output or os.path.join(BACKEND_DIR, 'bench_results',
+                                         f"retrieval_{revision}_{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump({
+            'meta': {'revision': revision, 'timestamp': datetime.now(timezone.utc).isoformat(),
+                     'labels': args.labels, 'queries': len(labels), 'pages': len(pages),
+                     'encode_ms_per_query': round(encode_ms, 3), 'args': vars(args)},
+            'results': rows,
+            'recommended': best,
+        }, f, indent=2)
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
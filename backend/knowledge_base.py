@@ -5,13 +5,38 @@ FAISS-based knowledge base for Atlan documentation
 import os
 import json
 import pickle
+import queue
+import threading
+import time
 import numpy as np
 from typing import List, Dict, Tuple
 import faiss
 from sentence_transformers import SentenceTransformer
 from utils import DOC_SOURCES, extract_page_content, discover_documentation_pages
+from core.context import ContextBuilder
+from core.encoders import load_query_encoder
+from core.embedding_service import EmbeddingService
+from core.chunking import StructuredChunker, ChunkDeduplicator
+from core.metrics import metrics, stage
+from core.tracing import span
+from core.structured_log import get_logger
 import hashlib
 
+log = get_logger('kb')
+crawl_log = get_logger('crawler', max_per_second=float(os.getenv('CRAWL_LOG_RATE', '5')))
+
+# Retrieval settings for prompt context; eval_retrieval.py sweeps these against labeled queries
+RAG_TOP_K = int(os.getenv('RAG_TOP_K', '8'))
+RAG_MIN_SCORE = float(os.getenv('RAG_MIN_SCORE', '0.3'))
+RAG_FALLBACK_HITS = 3
+
+
+def select_context_hits(results: List[Dict], min_score: float = RAG_MIN_SCORE) -> List[Dict]:
+    """Hits scoring above min_score, or the best few when none do"""
+    relevant = [r for r in results if r['score'] > min_score]
+    return relevant or results[:RAG_FALLBACK_HITS]
+
+
 class AtlanKnowledgeBase:
     def __init__(self, model_name='all-MiniLM-L6-v2', index_path='knowledge_base'):
         self.model = SentenceTransformer(model_name)
@@ -20,40 +45,34 @@ class AtlanKnowledgeBase:
         self.documents = []
         self.metadata = []
         self.dimension = 384  # Dimension for all-MiniLM-L6-v2
+        self.encoder_backend = os.getenv('KB_ENCODER_BACKEND', 'torch')
+        self.query_encoder = self.model  # Swapped for the configured backend once the index is ready
+        # Set once query_encoder is final; vectors that are compared with each other must wait for it
+        self.encoder_ready = threading.Event()
+        self.chunker = StructuredChunker(
+            count_tokens=self.count_tokens,
+            max_tokens=int(os.getenv('KB_CHUNK_TOKENS', '128'))
+        )
+        self.embedder = EmbeddingService(
+            lambda texts: self.query_encoder.encode(texts),
+            max_batch_size=int(os.getenv('KB_EMBED_MAX_BATCH', '32')),
+            max_wait_ms=float(os.getenv('KB_EMBED_MAX_WAIT_MS', '2'))
+        )
+        self.context_builder = ContextBuilder(
+            count_tokens=self.count_tokens,
+            max_tokens=int(os.getenv('RAG_CONTEXT_TOKENS', '600'))
+        )
         
         # Create index directory if it doesn't exist
         os.makedirs(index_path, exist_ok=True)
         
-    def _chunk_text(self, text: str, chunk_size: int = 500, overlap: int = 50) -> List[str]:
-        """Split text into overlapping chunks for better retrieval"""
-        if len(text) <= chunk_size:
-            return [text]
-        
-        chunks = []
-        start = 0
-        
-        while start < len(text):
-            end = start + chunk_size
-            
-            # Try to break at sentence boundary
-            if end < len(text):
-                # Look for sentence endings
-                sentence_end = text.rfind('.', start, end)
-                if sentence_end > start + chunk_size // 2:
-                    end = sentence_end + 1
-                else:
-                    # Look for paragraph breaks
-                    para_break = text.rfind('\n\n', start, end)
-                    if para_break > start + chunk_size // 2:
-                        end = para_break
-            
-            chunk = text[start:end].strip()
-            if chunk:
-                chunks.append(chunk)
-            
-            start = end - overlap
-            
-        return chunks
+    def count_tokens(self, text: str) -> int:
+        """Count tokens with the encoder's tokenizer (used for prompt budgeting)"""
+        return len(self.model.tokenizer.tokenize(text))
+    
+    def _chunk_text(self, text: str) -> List[str]:
+        """Split text into token-bounded chunks along headings, lists and paragraphs"""
+        return self.chunker.chunk(text)
     
     def build_index(self, force_rebuild: bool = False):
         """Build or load the FAISS index from Atlan documentation"""
@@ -64,7 +83,7 @@ class AtlanKnowledgeBase:
         # Check if index exists and is recent
         if not force_rebuild and all(os.path.exists(f) for f in [index_file, docs_file, metadata_file]):
             try:
-                print("Loading existing FAISS index...")
+                log.info("Loading existing FAISS index")
                 self.index = faiss.read_index(index_file)
                 
                 with open(docs_file, 'rb') as f:
@@ -73,26 +92,109 @@ class AtlanKnowledgeBase:
                 with open(metadata_file, 'rb') as f:
                     self.metadata = pickle.load(f)
                     
-                print(f"Loaded index with {len(self.documents)} documents")
+                log.info("Loaded FAISS index", extra={'documents': len(self.documents)})
+                self._load_query_encoder()
                 return
             except Exception as e:
-                print(f"Error loading existing index: {e}")
-                print("Rebuilding index...")
+                log.warning("Error loading existing index, rebuilding", extra={'error': str(e)})
         
-        print("Building new FAISS index from Atlan documentation...")
+        log.info("Building new FAISS index from Atlan documentation")
         
+        index = faiss.IndexFlatIP(self.dimension)  # Inner product for cosine similarity
         all_chunks = []
         all_metadata = []
         
+        batch_size = int(os.getenv('KB_ENCODE_BATCH_SIZE', '256'))
+        workers = int(os.getenv('KB_ENCODE_WORKERS', str(os.cpu_count() or 1)))
+        pool = self.model.start_multi_process_pool(['cpu'] * workers) if workers > 1 else None
+        
+        # Crawl in a producer thread so page fetches overlap with encoding; the
+        # bounded queue keeps at most a couple of batches in flight.
+        batches = queue.Queue(maxsize=2)
+        deduplicator = ChunkDeduplicator()
+        stop = threading.Event()
+        producer = threading.Thread(target=self._produce_batches, args=(batches, batch_size, deduplicator, stop), daemon=True)
+        producer.start()
+        
+        started = time.time()
+        try:
+            while True:
+                batch = batches.get()
+                if batch is None:
+                    break
+                if isinstance(batch, Exception):
+                    # A partial crawl must not replace (or be saved over) the previous index
+                    log.error("Crawl failed, keeping the previous index", extra={
+                        'error': str(batch), 'chunks_embedded': len(all_chunks)
+                    })
+                    raise batch
+                chunks, metadata = batch
+                if pool is not None:
+                    embeddings = self.model.encode_multi_process(chunks, pool, batch_size=32)
+                else:
+                    embeddings = self.model.encode(chunks, batch_size=32)
+                embeddings = np.ascontiguousarray(embeddings, dtype='float32')
+                
+                # Normalize embeddings for cosine similarity
+                faiss.normalize_L2(embeddings)
+                index.add(embeddings)
+                all_chunks.extend(chunks)
+                all_metadata.extend(metadata)
+                
+                elapsed = max(time.time() - started, 1e-6)
+                log.info("Embedded batch", extra={'chunks': len(all_chunks), 'chunks_per_s': round(len(all_chunks) / elapsed, 1)})
+        finally:
+            # If encoding failed the producer may be blocked on a full queue; tell it to stop crawling
+            stop.set()
+            if pool is not None:
+                SentenceTransformer.stop_multi_process_pool(pool)
+        
+        elapsed = max(time.time() - started, 1e-6)
+        log.info("Created text chunks", extra={
+            'chunks': len(all_chunks), 'seconds': round(elapsed, 1),
+            'chunks_per_s': round(len(all_chunks) / elapsed, 1), 'workers': workers, 'batch_size': batch_size
+        })
+        log.info("Removed duplicate chunks before embedding", extra={
+            'removed': deduplicator.removed, 'exact': deduplicator.exact_removed, 'near': deduplicator.near_removed
+        })
+        
+        # Swap in the finished index and store documents and metadata
+        self.index = index
+        self.documents = all_chunks
+        self.metadata = all_metadata
+        
+        # Save index and data
+        faiss.write_index(self.index, index_file)
+        
+        with open(docs_file, 'wb') as f:
+            pickle.dump(self.documents, f)
+            
+        with open(metadata_file, 'wb') as f:
+            pickle.dump(self.metadata, f)
+            
+        log.info("Built and saved FAISS index", extra={'documents': len(all_chunks)})
+        self._load_query_encoder()
+    
+    def _load_query_encoder(self):
+        """Load the query encoder for the configured backend (ONNX exports are cached next to the index)"""
+        if self.query_encoder is self.model and self.encoder_backend != 'torch':
+            self.query_encoder = load_query_encoder(
+                self.model, self.encoder_backend, os.path.join(self.index_path, 'onnx')
+            )
+        self.encoder_ready.set()
+    
+    def _iter_chunks(self, deduplicator: ChunkDeduplicator = None):
+        """Yield (chunk, metadata) pairs from the documentation sources as pages are crawled"""
+        produced = 0
         for base_url, config in DOC_SOURCES.items():
-            print(f"Processing {base_url}...")
+            crawl_log.info("Processing documentation source", extra={'url': base_url})
             
             # Discover pages
             pages = discover_documentation_pages(base_url, max_pages=15)
             
             for page_url in pages:
                 try:
-                    print(f"  Extracting content from {page_url}")
+                    crawl_log.info("Extracting content", extra={'url': page_url})
                     content = extract_page_content(page_url, config["selectors"], config["exclude"])
                     
                     if content and len(content) > 100:
@@ -100,21 +202,24 @@ class AtlanKnowledgeBase:
                         chunks = self._chunk_text(content)
                         
                         for i, chunk in enumerate(chunks):
+                            # Skip boilerplate repeated across pages
+                            if deduplicator is not None and deduplicator.is_duplicate(chunk):
+                                continue
                             if len(chunk) > 50:  # Only include meaningful chunks
-                                all_chunks.append(chunk)
-                                all_metadata.append({
+                                produced += 1
+                                yield chunk, {
                                     'url': page_url,
                                     'source': base_url,
                                     'chunk_id': i,
                                     'content_hash': hashlib.md5(chunk.encode()).hexdigest()
-                                })
+                                }
                                 
                 except Exception as e:
-                    print(f"    Error processing {page_url}: {e}")
+                    crawl_log.warning("Error processing page", extra={'url': page_url, 'error': str(e)})
                     continue
         
-        if not all_chunks:
-            print("No content extracted! Using fallback content...")
+        if not produced:
+            log.warning("No content extracted, using fallback content")
             # Add some fallback content
             fallback_content = [
                 "Atlan is a modern data catalog that helps organizations discover, understand, and trust their data.",
@@ -125,112 +230,117 @@ class AtlanKnowledgeBase:
             ]
             
             for i, content in enumerate(fallback_content):
-                all_chunks.append(content)
-                all_metadata.append({
+                yield content, {
                     'url': 'https://docs.atlan.com/',
                     'source': 'fallback',
                     'chunk_id': i,
                     'content_hash': hashlib.md5(content.encode()).hexdigest()
-                })
-        
-        print(f"Created {len(all_chunks)} text chunks")
-        
-        # Generate embeddings
-        print("Generating embeddings...")
-        embeddings = self.model.encode(all_chunks, show_progress_bar=True)
-        
-        # Create FAISS index
-        self.index = faiss.IndexFlatIP(self.dimension)  # Inner product for cosine similarity
-        
-        # Normalize embeddings for cosine similarity
-        faiss.normalize_L2(embeddings)
-        self.index.add(embeddings.astype('float32'))
-        
-        # Store documents and metadata
-        self.documents = all_chunks
-        self.metadata = all_metadata
-        
-        # Save index and data
-        faiss.write_index(self.index, index_file)
-        
-        with open(docs_file, 'wb') as f:
-            pickle.dump(self.documents, f)
-            
-        with open(metadata_file, 'wb') as f:
-            pickle.dump(self.metadata, f)
-            
-        print(f"✅ Built and saved FAISS index with {len(all_chunks)} documents")
+                }
+    
+    def _produce_batches(self, batches: queue.Queue, batch_size: int, deduplicator: ChunkDeduplicator = None,
+                         stop: threading.Event = None):
+        """
+        Group crawled chunks into fixed-size batches; a trailing None marks the
+        end, or the exception if the crawl failed. Gives up as soon as `stop` is
+        set (the consumer failed and will not read any more batches).
+        """
+        stop = stop or threading.Event()
+
+        def put(item) -> bool:
+            while not stop.is_set():
+                try:
+                    batches.put(item, timeout=0.5)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        chunks, metadata = [], []
+        try:
+            for chunk, meta in self._iter_chunks(deduplicator):
+                if stop.is_set():
+                    return
+                chunks.append(chunk)
+                metadata.append(meta)
+                if len(chunks) >= batch_size:
+                    if not put((chunks, metadata)):
+                        return
+                    chunks, metadata = [], []
+            if chunks and not put((chunks, metadata)):
+                return
+        except Exception as e:
+            log.error("Error while crawling documentation", extra={'error': str(e)})
+            put(e)
+            return
+        put(None)
     
-    def search(self, query: str, top_k: int = 5) -> List[Dict]:
+    def search(self, query: str, top_k: int = 5, include_embeddings: bool = False) -> List[Dict]:
         """Search for relevant documents using FAISS"""
         if self.index is None:
             self.build_index()
         
         # Generate query embedding
-        query_embedding = self.model.encode([query])
-        faiss.normalize_L2(query_embedding)
+        with stage('retrieve_encode'):
+            query_embedding = np.ascontiguousarray(self.embedder.encode_one(query), dtype='float32')
+            faiss.normalize_L2(query_embedding)
         
         # Search
-        scores, indices = self.index.search(query_embedding.astype('float32'), top_k)
+        with stage('retrieve_search'):
+            scores, indices = self.index.search(query_embedding.astype('float32'), top_k)
         
         results = []
         for score, idx in zip(scores[0], indices[0]):
-            if idx < len(self.documents):  # Valid index
-                results.append({
+            if 0 <= idx < len(self.documents):  # Valid index
+                result = {
                     'content': self.documents[idx],
                     'metadata': self.metadata[idx],
                     'score': float(score)
-                })
+                }
+                if include_embeddings:
+                    result['embedding'] = self.index.reconstruct(int(idx))
+                results.append(result)
         
         return results
     
-    def get_context_for_query(self, query: str, max_context_length: int = 2000) -> Tuple[str, List[str]]:
+    def get_context_for_query(self, query: str, max_context_tokens: int = None) -> Tuple[str, List[str]]:
         """Get formatted context and sources for a query"""
-        results = self.search(query, top_k=8)
+        results = self.search(query, top_k=RAG_TOP_K, include_embeddings=True)
         
         if not results:
             return "No relevant information found in the knowledge base.", []
         
-        # Filter results by score threshold
-        relevant_results = [r for r in results if r['score'] > 0.3]
-        
-        if not relevant_results:
-            relevant_results = results[:3]  # Take top 3 if none meet threshold
+        relevant_results = select_context_hits(results)
         
-        # Build context
-        context_parts = []
-        sources = set()
-        current_length = 0
-        
-        for result in relevant_results:
-            content = result['content']
-            url = result['metadata']['url']
-            
-            if current_length + len(content) > max_context_length:
-                # Truncate content to fit
-                remaining_space = max_context_length - current_length
-                if remaining_space > 100:  # Only add if there's meaningful space
-                    content = content[:remaining_space] + "..."
-                else:
-                    break
-            
-            context_parts.append(f"From {url}:\n{content}")
-            sources.add(url)
-            current_length += len(content)
+        builder = self.context_builder
+        if max_context_tokens is not None:
+            builder = ContextBuilder(count_tokens=self.count_tokens, max_tokens=max_context_tokens)
+        with span('context_build', candidates=len(relevant_results)) as active:
+            built = builder.build(relevant_results)
+            if active:
+                active.set(tokens_used=built['tokens_used'], chunks_used=built['chunks_used'])
         
-        context = "\n\n---\n\n".join(context_parts)
-        return context, list(sources)
+        log.debug("Built context", extra={
+            'tokens_used': built['tokens_used'], 'chunks_used': built['chunks_used'],
+            'tokens_saved': built['tokens_saved'], 'baseline_tokens': built['baseline_tokens']
+        })
+        return built['context'], built['sources']
 
 # Global knowledge base instance
 kb = AtlanKnowledgeBase()
 
+metrics.gauge('helpdesk_kb_index_loaded', 'Whether the FAISS index is loaded (1) or still initializing (0)',
+              callback=lambda: 1 if kb.index is not None else 0)
+metrics.gauge('helpdesk_kb_documents', 'Chunks in the knowledge base', callback=lambda: len(kb.documents))
+metrics.gauge('helpdesk_kb_index_vectors', 'Vectors in the FAISS index', callback=lambda: kb.index.ntotal)
+
 def initialize_knowledge_base():
     """Initialize the knowledge base (call this on startup)"""
     try:
         kb.build_index()
         return True
     except Exception as e:
-        print(f"Error initializing knowledge base: {e}")
+        log.error("Error initializing knowledge base", extra={'error': str(e)})
+        kb.encoder_ready.set()  # The torch model stays the query encoder
         return False
 
 def search_knowledge_base(query: str, top_k: int = 5):
@@ -238,18 +348,16 @@ def search_knowledge_base(query: str, top_k: int = 5):
     try:
         return kb.search(query, top_k)
     except Exception as e:
-        print(f"Error searching knowledge base: {e}")
+        log.error("Error searching knowledge base", extra={'error': str(e)})
         return []
 
 def get_rag_context(query: str):
     """Get RAG context for a query"""
     try:
         if kb.index is None:
-            print("Knowledge base not initialized, building now...")
+            log.warning("Knowledge base not initialized, building now")
             kb.build_index()
         return kb.get_context_for_query(query)
     except Exception as e:
-        print(f"Error getting RAG context: {e}")
-        import traceback
-        traceback.print_exc()
+        log.exception("Error getting RAG context")
         return "Error retrieving context from knowledge base.", []
\ No newline at end of file
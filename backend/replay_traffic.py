@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+Replay captured traffic against a running instance and diff latency distributions
+
+Captures are written by the app with CAPTURE_TRAFFIC=1 (see core/capture.py).
+A replay re-issues the captured requests in arrival order and records client-side
+latency per endpoint:
+
+    python replay_traffic.py replay captures/capture.jsonl --url http://localhost:5001            # original pacing
+    python replay_traffic.py replay captures/capture.jsonl* --speed 4 --output after.json          # 4x faster
+    python replay_traffic.py replay captures/capture.jsonl --speed max --concurrency 16            # as fast as possible
+    python replay_traffic.py diff before.json after.json
+
+A capture file can also be passed to `diff`; its server-side durations are used.
+Every replayed request comes from one address, so raise CLIENT_RATE_PER_SECOND /
+CLIENT_BURST on the target or 429s will dominate. Replayed POSTs create tickets on
+the target, so point replays at a staging copy rather than production.
+"""
+
+import os
+import sys
+import glob
+import time
+import json
+import argparse
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+import numpy as np
+import requests
+
+# Add the backend directory to the path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from bench_load import percentile_summary, git_revision
+
+
+def load_capture(patterns, path_prefix=None, limit=None):
+    """Captured records from one or more (rotated) files, in arrival order"""
+    records = []
+    for pattern in patterns:
+        for path in sorted(glob.glob(pattern)) or [pattern]:
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    if 'method' in record and (path_prefix is None or record['path'].startswith(path_prefix)):
+                        records.append(record)
+    records.sort(key=lambda record: record['ts'])
+    return records[:limit] if limit else records
+
+
+def split_truncated(records):
+    """
+    (replayable, skipped): requests whose body was cut at CAPTURE_MAX_BODY_BYTES
+    would reach the target as invalid JSON and come back as fast 400s, so they
+    are left out of replays and of the capture side of a diff
+    """
+    replayable = [record for record in records if not record.get('body_truncated')]
+    return replayable, len(records) - len(replayable)
+
+
+def send(session, base_url, record, timeout):
+    """Re-issue one captured request; returns (latency_ms, status, response_bytes)"""
+    url = base_url + record['path'] + (f"?{record['query']}" if record.get('query') else '')
+    headers = {'Content-Type': record['content_type']} if record.get('content_type') else {}
+    started = time.perf_counter()
+    try:
+        response = session.request(record['method'], url, data=record.get('body', '').encode('utf-8') or None,
+                                   headers=headers, timeout=timeout)
+        return (time.perf_counter() - started) * 1000, response.status_code, len(response.content)
+    except requests.RequestException:
+        return (time.perf_counter() - started) * 1000, 0, 0
+
+
+def replay(records, base_url, speed, concurrency, timeout):
+    """
+    Paced replay (speed is a multiplier of the captured inter-arrival times) is
+    open-loop: requests are sent on schedule whether or not earlier ones have
+    finished, up to `concurrency` at once. speed=None sends back-to-back from
+    `concurrency` workers.
+    """
+    results = [None] * len(records)
+    lateness = []
+    local = threading.local()
+
+    def session():
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+        return local.session
+
+    def run(index):
+        results[index] = send(session(), base_url, records[index], timeout)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        if speed is None:
+            list(pool.map(run, range(len(records))))
+        else:
+            origin = records[0]['ts'] if records else 0
+            for index, record in enumerate(records):
+                due = started + (record['ts'] - origin) / speed
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                elif delay < -0.01:
+                    lateness.append(-delay * 1000)
+                pool.submit(run, index)
+    elapsed = time.perf_counter() - started
+    return results, elapsed, lateness
+
+
+def summarize_run(records, results):
+    """Per-endpoint and overall latency summaries plus raw samples for later diffs"""
+    by_title = defaultdict(list)
+    statuses = defaultdict(lambda: defaultdict(int))
+    status_changed = 0
+    for record, (latency, status, _) in zip(records, results):
+        by_title[record['title']].append(latency)
+        statuses[record['title']][str(status)] += 1
+        if status != record.get('status'):
+            status_changed += 1
+    endpoints = {
+        title: {'requests': len(latencies), 'statuses': dict(statuses[title]),
+                'latency_ms': percentile_summary(latencies), 'samples_ms': [round(v, 3) for v in latencies]}
+        for title, latencies in by_title.items()
+    }
+    overall = [latency for latency, _, _ in results]
+    return {'overall': {'requests': len(overall), 'latency_ms': percentile_summary(overall)},
+            'endpoints': endpoints, 'status_changed': status_changed}
+
+
+def capture_summary(records):
+    """Summary of captured requests using their server-side durations"""
+    return summarize_run(records, [(r['duration_ms'], r['status'], r.get('response_bytes') or 0) for r in records])
+
+
+def load_run(path):
+    """A saved replay result, or a capture file summarized from its server-side durations"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            document = json.load(f)
+        if isinstance(document, dict) and 'endpoints' in document:
+            return document
+    except json.JSONDecodeError:
+        pass  # JSONL capture
+    return capture_summary(split_truncated(load_capture([path]))[0])
+
+
+def ks_distance(a, b):
+    """Two-sample Kolmogorov-Smirnov statistic: largest gap between the empirical CDFs"""
+    a, b = np.sort(a), np.sort(b)
+    points = np.concatenate([a, b])
+    cdf_a = np.searchsorted(a, points, side='right') / len(a)
+    cdf_b = np.searchsorted(b, points, side='right') / len(b)
+    return float(np.max(np.abs(cdf_a - cdf_b)))
+
+
+def diff(before, after, threshold, min_samples=20):
+    """Print per-endpoint percentile deltas and distribution distance; returns regressed endpoints"""
+    regressions = []
+    print(f"{'endpoint':<36} {'n':>6} {'p50 ms':>16} {'p95 ms':>16} {'p99 ms':>16} {'KS':>6}")
+    for title in sorted(set(before['endpoints']) | set(after['endpoints'])):
+        old, new = before['endpoints'].get(title), after['endpoints'].get(title)
+        if old is None or new is None:
+            print(f"{title:<36} {'only in ' + ('after' if old is None else 'before'):>16}")
+            continue
+        cells = []
+        for metric in ('p50', 'p95', 'p99'):
+            a, b = old['latency_ms'][metric], new['latency_ms'][metric]
+            cells.append(f"{b:>8.1f} ({(b - a) / a * 100:+5.0f}%)" if a else f"{'n/a':>16}")
+        distance = ks_distance(old['samples_ms'], new['samples_ms'])
+        print(f"{title:<36} {new['requests']:>6} {' '.join(cells)} {distance:>6.2f}")
+        old_p95, new_p95 = old['latency_ms']['p95'], new['latency_ms']['p95']
+        if min(old['requests'], new['requests']) >= min_samples and old_p95 and new_p95 > old_p95 * (1 + threshold):
+            regressions.append(title)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('replay', help='Re-issue captured requests against a running instance')
+    run_parser.add_argument('captures', nargs='+', help='Capture files or globs (rotated files are merged)')
+    run_parser.add_argument('--url', default='http://localhost:5001')
+    run_parser.add_argument('--speed', default='1', help="Multiplier of captured pacing, or 'max'")
+    run_parser.add_argument('--concurrency', type=int, default=32, help='Maximum requests in flight')
+    run_parser.add_argument('--path-prefix', help='Only replay requests whose path starts with this')
+    run_parser.add_argument('--limit', type=int, help='Replay at most this many requests')
+    run_parser.add_argument('--timeout', type=float, default=60.0)
+    run_parser.add_argument('--output', help='Result JSON (default bench_results/replay_<revision>_<time>.json)')
+    run_parser.add_argument('--baseline', help='Saved replay or capture file to diff against when done')
+    run_parser.add_argument('--threshold', type=float, default=0.1, help='Relative p95 increase counted as a regression')
+
+    diff_parser = commands.add_parser('diff', help='Compare two replay results (or a capture and a replay)')
+    diff_parser.add_argument('before')
+    diff_parser.add_argument('after')
+    diff_parser.add_argument('--threshold', type=float, default=0.1)
+    args = parser.parse_args()
+
+    if args.command == 'diff':
+        regressions = diff(load_run(args.before), load_run(args.after), args.threshold)
+        if regressions:
+            print(f"\n❌ p95 regressed beyond {args.threshold:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+        return
+
+    speed = None if args.speed == 'max' else float(args.speed)
+    records, skipped_truncated = split_truncated(load_capture(args.captures, args.path_prefix, args.limit))
+    if skipped_truncated:
+        print(f"⚠️  Skipping {skipped_truncated} requests whose captured body was truncated; "
+              f"raise CAPTURE_MAX_BODY_BYTES to replay them")
+    if not records:
+        print("No captured requests to replay")
+        sys.exit(1)
+    span = records[-1]['ts'] - records[0]['ts']
+    print(f"🔧 Replaying {len(records)} requests captured over {span:.1f}s at "
+          f"{'max speed' if speed is None else f'{speed:g}x'} against {args.url}")
+
+    results, elapsed, lateness = replay(records, args.url.rstrip('/'), speed, args.concurrency, args.timeout)
+    summary = summarize_run(records, results)
+    summary['meta'] = {
+        'revision': git_revision(),
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'target': args.url,
+        'captures': args.captures,
+        'speed': args.speed,
+        'concurrency': args.concurrency,
+        'skipped_truncated': skipped_truncated,
+        'elapsed_seconds': round(elapsed, 3),
+        'throughput_rps': round(len(records) / elapsed, 2) if elapsed > 0 else 0.0,
+        # How far behind schedule the sender fell; large values mean the run was not at the requested pace
+        'late_sends': len(lateness),
+        'max_lateness_ms': round(max(lateness), 2) if lateness else 0.0,
+    }
+
+    overall = summary['overall']['latency_ms']
+    print(f"Done in {elapsed:.1f}s ({summary['meta']['throughput_rps']} req/s): p50 {overall['p50']} ms, "
+          f"p95 {overall['p95']} ms, p99 {overall['p99']} ms; {summary['status_changed']} responses "
+          f"differ in status from the capture")
+    if summary['meta']['late_sends']:
+        print(f"⚠️  {summary['meta']['late_sends']} sends fell behind schedule "
+              f"(max {summary['meta']['max_lateness_ms']} ms); raise --concurrency for a faithful pace")
+
+    output = args.output or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'bench_results',
+        f"replay_{summary['meta']['revision']}_{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(summary, f)
+    print(f"Results written to {output}\n")
+
+    if args.baseline:
+        regressions = diff(load_run(args.baseline), summary, args.threshold)
+        if regressions:
+            print(f"\n❌ p95 regressed beyond {args.threshold:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+    else:
+        # Client-side replay latency includes the network, so this is a shape comparison only
+        print("Compared with the captured server-side durations:")
+        diff(capture_summary(records), summary, args.threshold)
+
+if __name__ == '__main__':
+    main()
@@ -1,16 +1,31 @@
 """
 AI agent-related API routes with FAISS knowledge base integration.
 """
-from flask import Blueprint, jsonify, request
+import os
+import json
+import uuid
+from flask import Blueprint, Response, jsonify, request, stream_with_context
 from pydantic import BaseModel, ValidationError
 from typing import List, Optional
-from utils import classify_ticket, generate_response
-from knowledge_base import search_knowledge_base
-import json
-import os
-from datetime import datetime
+from utils import classify_ticket, generate_response, retrieve_context
+from knowledge_base import kb, search_knowledge_base
+from core.ticket_store import ticket_store
+from core.similar_tickets import similar_tickets
+from core.conversations import conversation_store
+from core.admission import admission_controlled
+from core.jobs import job_queue, FINISHED
+from core.metrics import stage, CACHE_HITS, CACHE_MISSES
+from core.tracing import span
+from core import deadline
+from core.structured_log import get_logger
 
 agent_bp = Blueprint('agent', __name__)
+log = get_logger('agent')
+
+# Minimum cosine similarity for a chat message to count as an on-topic follow-up
+CHAT_FOLLOWUP_SIMILARITY = float(os.getenv('CHAT_FOLLOWUP_SIMILARITY', '0.5'))
+
+JOB_STREAM_HEARTBEAT_SECONDS = 15
 
 class AgentRequest(BaseModel):
     text: str
@@ -23,43 +38,142 @@ class ChatMessage(BaseModel):
 def save_ticket_to_json(text: str, channel: str, classification: dict):
     """Save agent query as a ticket to sample_tickets.json"""
     try:
-        # Load existing tickets
-        tickets_file = 'sample_tickets.json'
-        if os.path.exists(tickets_file):
-            with open(tickets_file, 'r', encoding='utf-8') as f:
-                tickets = json.load(f)
-        else:
-            tickets = []
-        
-        # Generate new ticket ID
-        existing_ids = [int(ticket['id'].split('-')[1]) for ticket in tickets if ticket['id'].startswith('TICKET-')]
-        next_id = max(existing_ids) + 1 if existing_ids else 1
-        
-        # Create new ticket
-        new_ticket = {
-            "id": f"TICKET-{next_id}",
-            "channel": channel,
-            "createdAt": datetime.utcnow().isoformat() + "Z",
-            "subject": f"Agent Query: {classification.get('topic', 'General')} - {classification.get('priority', 'P2 (Low)')}",
-            "body": text,
-            "classification": classification  # Add classification data
-        }
-        
-        # Add to beginning of list (most recent first)
-        tickets.insert(0, new_ticket)
-        
-        # Save back to file
-        with open(tickets_file, 'w', encoding='utf-8') as f:
-            json.dump(tickets, f, indent=2, ensure_ascii=False)
-        
-        print(f"Saved new ticket: {new_ticket['id']}")
+        # A degraded classification is a placeholder; save the ticket unclassified so it is classified later
+        new_ticket = ticket_store.add(text, channel, None if classification.get('degraded') else classification)
         return new_ticket['id']
         
     except Exception as e:
-        print(f"Error saving ticket to JSON: {e}")
+        log.exception("Error saving ticket")
+        return None
+
+def record_ticket(text: str, channel: str, classification: dict):
+    """
+    Save a classified ticket and look for earlier tickets asking the same thing.
+
+    Returns:
+        Tuple of (ticket_id, duplicate_of, similar_tickets)
+    """
+    duplicate_of, similar = None, []
+    try:
+        with span('similar_lookup'):
+            vector, similar = similar_tickets.match_text(text)
+        duplicate_of = similar_tickets.duplicate_of(similar)
+    except Exception as e:
+        vector = None
+        log.warning("Similar ticket lookup failed", extra={'error': str(e)})
+    
+    with stage('persist'):
+        ticket_id = save_ticket_to_json(text, channel, classification)
+    log.info("Saved ticket", extra={'ticket_id': ticket_id, 'duplicate_of': duplicate_of and duplicate_of['ticket_id']})
+    if ticket_id and vector is not None:
+        # Reuse the lookup embedding instead of re-encoding in the background
+        similar_tickets.add(ticket_id, vector)
+    return ticket_id, duplicate_of, [{'ticket_id': i, 'score': round(score, 4)} for i, score in similar]
+
+def reusable_answer(duplicate_of: Optional[dict]) -> Optional[dict]:
+    """The stored answer of the ticket this one duplicates, if that ticket was answered"""
+    if not duplicate_of:
+        return None
+    original = ticket_store.get(duplicate_of['ticket_id'])
+    answer = original.get('answer') if original else None
+    if not answer:
+        CACHE_MISSES.inc(cache='duplicate_answer')
         return None
+    CACHE_HITS.inc(cache='duplicate_answer')
+    return {
+        'response': answer['response'],
+        'sources': answer.get('sources', []),
+        'type': answer.get('type', 'rag'),
+        'reused_from': duplicate_of['ticket_id']
+    }
+
+def store_answer(ticket_id: Optional[str], answer: dict):
+    """Keep a ticket's answer for later duplicates; degraded fallbacks are not worth reusing"""
+    if ticket_id and not answer.get('degraded'):
+        ticket_store.set_answer(ticket_id, {
+            'response': answer['response'],
+            'sources': answer.get('sources', []),
+            'type': answer['type']
+        })
+
+def answer_ticket(text: str, classification: dict, duplicate_of: Optional[dict] = None) -> dict:
+    """
+    Generate a RAG answer or routing message for a classified ticket: {response, sources, type}.
+
+    A ticket flagged as a duplicate (similarity above SIMILAR_TICKET_THRESHOLD)
+    of an answered ticket gets that answer back, with reused_from set, instead
+    of a new generation.
+    """
+    reused = reusable_answer(duplicate_of)
+    if reused is not None:
+        return reused
+    
+    RAG_TOPICS = ["How-to", "Product", "Best practices", "API/SDK", "SSO"]
+    topic = classification.get('topic', 'Other')
+    
+    if topic in RAG_TOPICS:
+        # Generate RAG response for eligible topics
+        response_data = generate_response(text, topic)
+        
+        # Ensure we have valid response data
+        if not response_data or 'response' not in response_data:
+            log.warning("Invalid response data, using fallback", extra={'topic': topic})
+            response_data = {
+                'response': 'I apologize, but I encountered an issue generating a response. Please try again or contact support.',
+                'sources': []
+            }
+        
+        has_sources = response_data.get('sources') and len(response_data.get('sources', [])) > 0
+        response_type = 'rag' if has_sources else 'routed'
+        
+        return {
+            'response': response_data['response'],
+            'sources': response_data.get('sources', []),
+            'type': response_type,
+            'degraded': response_data.get('degraded', False)
+        }
+    
+    # For routed topics, provide a simple routing message
+    priority = classification.get('priority', 'P2 (Low)')
+    
+    # Create appropriate routing message based on topic and priority
+    if priority.startswith('P0'):
+        urgency_msg = "This is a high-priority issue and will be escalated immediately."
+    elif priority.startswith('P1'):
+        urgency_msg = "This will be prioritized and handled promptly."
+    else:
+        urgency_msg = "This will be handled by our team in the order received."
+    
+    routing_messages = {
+        'Connector': f"Your connector-related query has been routed to our Data Integration team. {urgency_msg} You can expect a response within 24-48 hours with specific guidance on your connector setup.",
+        'Lineage': f"Your data lineage question has been forwarded to our Data Governance specialists. {urgency_msg} They will provide detailed insights about your lineage configuration.",
+        'Glossary': f"Your business glossary inquiry has been assigned to our Metadata Management team. {urgency_msg} They will assist you with glossary setup and best practices.",
+        'Sensitive data': f"Your data privacy and security question has been escalated to our Data Security team. {urgency_msg} They will ensure your sensitive data requirements are properly addressed."
+    }
+    
+    default_message = f"Your {topic.lower()} query has been routed to the appropriate specialist team. {urgency_msg} Thank you for your patience."
+    
+    return {
+        'response': routing_messages.get(topic, default_message),
+        'sources': [],
+        'type': 'routed'
+    }
+
+def build_agent_result(classification: dict, answer: dict, ticket_id, duplicate_of, similar) -> dict:
+    return {
+        'analysis': classification,
+        'response': answer['response'],
+        'sources': answer['sources'],
+        'type': answer['type'],
+        'ticket_id': ticket_id,
+        'duplicate_of': duplicate_of,
+        'similar_tickets': similar,
+        # Ticket whose stored answer was returned instead of generating one
+        'reused_from': answer.get('reused_from')
+    }
 
 @agent_bp.route('/api/agent/respond', methods=['POST'])
+@admission_controlled()
 def agent_respond():
     """
     Process a ticket through the AI agent pipeline.
@@ -79,85 +193,134 @@ def agent_respond():
         text = agent_request.text
         
         # Step 1: Classify the ticket
-        print(f"Classifying ticket: {text[:100]}...")
         classification = classify_ticket(text)
-        print(f"Classification result: {classification}")
-        
-        # Step 2: Save ticket to JSON file
-        ticket_id = save_ticket_to_json(text, agent_request.channel, classification)
-        print(f"Saved ticket with ID: {ticket_id}")
+        log.info("Classified ticket", extra={'classification': classification, 'chars': len(text)})
         
-        # Step 3: Determine response type and generate appropriate response
-        RAG_TOPICS = ["How-to", "Product", "Best practices", "API/SDK", "SSO"]
-        topic = classification.get('topic', 'Other')
+        # Step 2: Save ticket to JSON file, flagging likely duplicates
+        ticket_id, duplicate_of, similar = record_ticket(text, agent_request.channel, classification)
         
-        if topic in RAG_TOPICS:
-            # Generate RAG response for eligible topics
-            print(f"Generating RAG response for topic: {topic}")
-            response_data = generate_response(text, topic)
-            print(f"Response data keys: {response_data.keys() if response_data else 'None'}")
-            
-            # Ensure we have valid response data
-            if not response_data or 'response' not in response_data:
-                print("Warning: Invalid response_data, using fallback")
-                response_data = {
-                    'response': 'I apologize, but I encountered an issue generating a response. Please try again or contact support.',
-                    'sources': []
-                }
-            
-            has_sources = response_data.get('sources') and len(response_data.get('sources', [])) > 0
-            response_type = 'rag' if has_sources else 'routed'
-            
-            result = {
-                'analysis': classification,
-                'response': response_data['response'],
-                'sources': response_data.get('sources', []),
-                'type': response_type,
-                'ticket_id': ticket_id
-            }
-        else:
-            # For routed topics, provide a simple routing message
-            print(f"Routing ticket for topic: {topic}")
-            priority = classification.get('priority', 'P2 (Low)')
-            
-            # Create appropriate routing message based on topic and priority
-            if priority.startswith('P0'):
-                urgency_msg = "This is a high-priority issue and will be escalated immediately."
-            elif priority.startswith('P1'):
-                urgency_msg = "This will be prioritized and handled promptly."
-            else:
-                urgency_msg = "This will be handled by our team in the order received."
-            
-            routing_messages = {
-                'Connector': f"Your connector-related query has been routed to our Data Integration team. {urgency_msg} You can expect a response within 24-48 hours with specific guidance on your connector setup.",
-                'Lineage': f"Your data lineage question has been forwarded to our Data Governance specialists. {urgency_msg} They will provide detailed insights about your lineage configuration.",
-                'Glossary': f"Your business glossary inquiry has been assigned to our Metadata Management team. {urgency_msg} They will assist you with glossary setup and best practices.",
-                'Sensitive data': f"Your data privacy and security question has been escalated to our Data Security team. {urgency_msg} They will ensure your sensitive data requirements are properly addressed."
-            }
-            
-            default_message = f"Your {topic.lower()} query has been routed to the appropriate specialist team. {urgency_msg} Thank you for your patience."
-            
-            result = {
-                'analysis': classification,
-                'response': routing_messages.get(topic, default_message),
-                'sources': [],
-                'type': 'routed',
-                'ticket_id': ticket_id
-            }
+        # Step 3: Reuse a duplicate's answer, or determine response type and generate one
+        answer = answer_ticket(text, classification, duplicate_of)
+        store_answer(ticket_id, answer)
+        result = build_agent_result(classification, answer, ticket_id, duplicate_of, similar)
+        # Stages that took their fallback to meet the request deadline
+        result['degraded'] = deadline.shortcuts()
         
-        print(f"Final response structure: {list(result.keys())}")
+        log.info("Agent response ready", extra={'ticket_id': ticket_id, 'type': result['type'], 'sources': len(result['sources'])})
         return jsonify(result)
         
     except Exception as e:
-        print(f"Error in agent_respond: {e}")
-        import traceback
-        traceback.print_exc()
+        log.exception("Error in agent_respond")
         return jsonify({'error': str(e)}), 500
 
+# Background job mode: classify (and save) first, then answer in priority order
+JOB_CLASSIFY = 'classify'
+JOB_RESPOND = 'respond'
+
+def _job_rank(job: dict) -> int:
+    """P0 answers run first, then triage of new jobs, then P1 and P2 answers"""
+    if job['stage'] == JOB_CLASSIFY:
+        return 1
+    priority = (job.get('classification') or {}).get('priority', 'P2')
+    return {'P0': 0, 'P1': 2}.get(priority[:2], 3)
+
+def _classify_job(job: dict):
+    # A restart after the ticket was saved reruns this stage; do not save it twice
+    if job.get('ticket_id') is None:
+        job['classification'] = classify_ticket(job['text'])
+        job['ticket_id'], job['duplicate_of'], job['similar_tickets'] = record_ticket(
+            job['text'], job['channel'], job['classification']
+        )
+        job_queue.checkpoint(job['id'], **{key: job[key] for key in (
+            'classification', 'ticket_id', 'duplicate_of', 'similar_tickets'
+        )})
+    return JOB_RESPOND
+
+def _respond_job(job: dict):
+    answer = answer_ticket(job['text'], job['classification'], job['duplicate_of'])
+    store_answer(job['ticket_id'], answer)
+    job['result'] = build_agent_result(
+        job['classification'], answer, job['ticket_id'], job['duplicate_of'], job['similar_tickets']
+    )
+    return None
+
+job_queue.register(JOB_CLASSIFY, _classify_job)
+job_queue.register(JOB_RESPOND, _respond_job)
+job_queue.set_rank(_job_rank)
+
+def _job_view(job: dict) -> dict:
+    return {key: job.get(key) for key in (
+        'id', 'status', 'stage', 'ticket_id', 'classification', 'duplicate_of', 'result', 'error',
+        'created_at', 'updated_at'
+    )}
+
+@agent_bp.route('/api/agent/jobs', methods=['POST'])
+@admission_controlled()
+def submit_agent_job():
+    """
+    Queue a ticket for background processing and return at once with 202.
+
+    Poll GET /api/agent/jobs/<id> or stream /api/agent/jobs/<id>/stream for
+    its status; ticket_id appears once the ticket is classified and saved.
+    """
+    data = request.get_json(silent=True)
+    if not data or 'text' not in data:
+        return jsonify({'error': 'Text is required'}), 400
+    try:
+        agent_request = AgentRequest(**data)
+    except ValidationError as e:
+        return jsonify({'error': f'Invalid input: {e}'}), 400
+    
+    job = job_queue.submit(
+        JOB_CLASSIFY, text=agent_request.text, channel=agent_request.channel,
+        classification=None, ticket_id=None, duplicate_of=None, similar_tickets=[]
+    )
+    response = jsonify(_job_view(job))
+    response.headers['Location'] = f"/api/agent/jobs/{job['id']}"
+    return response, 202
+
+@agent_bp.route('/api/agent/jobs/<job_id>', methods=['GET'])
+def get_agent_job(job_id):
+    """Current status of a background job, with its result once done"""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': f'Job {job_id} not found'}), 404
+    return jsonify(_job_view(job))
+
+@agent_bp.route('/api/agent/jobs/<job_id>/stream', methods=['GET'])
+def stream_agent_job(job_id):
+    """Server-Sent Events: a 'status' event per job state change, ending once the job finishes"""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': f'Job {job_id} not found'}), 404
+    
+    def generate():
+        current = job
+        yield f"event: status\ndata: {json.dumps(_job_view(current), ensure_ascii=False)}\n\n"
+        while current['status'] not in FINISHED:
+            updated = job_queue.wait_for_change(job_id, current['version'], timeout=JOB_STREAM_HEARTBEAT_SECONDS)
+            if updated is None:
+                break
+            if updated['version'] == current['version']:
+                yield ": keep-alive\n\n"
+                continue
+            current = updated
+            yield f"event: status\ndata: {json.dumps(_job_view(current), ensure_ascii=False)}\n\n"
+    
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
 @agent_bp.route('/api/agent/chat', methods=['POST'])
+@admission_controlled()
 def agent_chat():
     """
     Chat endpoint for conversational AI interactions.
+
+    Turns sharing a conversation_id form a session. A follow-up that stays on
+    the session's topic reuses its classification, ticket and retrieved context,
+    and every turn's prompt carries a bounded summary of the earlier turns.
     """
     try:
         data = request.get_json()
@@ -171,23 +334,54 @@ def agent_chat():
             return jsonify({'error': f'Invalid input: {e}'}), 400
         
         message = chat_request.message
+        conversation_id = chat_request.conversation_id or str(uuid.uuid4())
+        # Client-chosen ids are scoped to the caller so sessions are never shared across clients
+        conversation = conversation_store.get_or_create(f"{request.remote_addr}|{conversation_id}")
         
-        # Classify the message to understand intent
-        classification = classify_ticket(message)
-        topic = classification.get('topic', 'Other')
+        try:
+            with span('follow_up_check'):
+                vector = kb.embedder.encode_one(message)[0]
+        except Exception as e:
+            vector = None
+            log.warning("Could not embed chat message for follow-up detection", extra={'error': str(e)})
+        follow_up = vector is not None and conversation.is_follow_up(vector, CHAT_FOLLOWUP_SIMILARITY)
         
-        # Save chat message as ticket
-        ticket_id = save_ticket_to_json(message, 'live_chat', classification)
+        if follow_up:
+            # Same topic: skip classification and keep the conversation's ticket
+            classification = conversation.classification
+            ticket_id = conversation.ticket_id
+            conversation.absorb(vector)
+            conversation_store.stats['follow_ups'] += 1
+        else:
+            # Classify the message to understand intent
+            classification = classify_ticket(message)
+            # Save chat message as ticket
+            with stage('persist'):
+                ticket_id = save_ticket_to_json(message, 'live_chat', classification)
+            conversation.ticket_id = ticket_id
+            # Do not anchor follow-ups to a placeholder classification; the next message classifies again
+            conversation.set_topic(classification, None, [], None if classification.get('degraded') else vector)
+        topic = classification.get('topic', 'Other')
         
         # Use same routing logic as agent_respond
         RAG_TOPICS = ["How-to", "Product", "Best practices", "API/SDK", "SSO"]
         
         if topic in RAG_TOPICS:
-            # Generate RAG response for eligible topics
-            response_data = generate_response(message, topic)
-            kb_results = search_knowledge_base(message, top_k=3)
+            # Generate RAG response for eligible topics, reusing the topic's retrieval results
+            if conversation.context is not None:
+                CACHE_HITS.inc(cache='conversation_context')
+            else:
+                CACHE_MISSES.inc(cache='conversation_context')
+                context, sources = retrieve_context(message, topic)
+                conversation.set_topic(classification, context, sources, conversation.topic_vector)
+            response_data = generate_response(
+                message, topic,
+                context=conversation.context,
+                sources=conversation.sources,
+                history=conversation.history(conversation_store.turn_chars)
+            )
             
-            return jsonify({
+            result = {
                 'response': response_data['response'],
                 'sources': response_data.get('sources', []),
                 'classification': {
@@ -195,11 +389,12 @@ def agent_chat():
                     'sentiment': classification.get('sentiment', 'Neutral'),
                     'priority': classification.get('priority', 'P2 (Low)')
                 },
-                'knowledge_base_results': len(kb_results),
-                'conversation_id': chat_request.conversation_id or 'new',
+                'knowledge_base_results': len(conversation.sources),
+                'conversation_id': conversation_id,
                 'ticket_id': ticket_id,
+                'follow_up': follow_up,
                 'type': 'rag'
-            })
+            }
         else:
             # For routed topics, provide routing message
             priority = classification.get('priority', 'P2 (Low)')
@@ -220,7 +415,7 @@ def agent_chat():
             
             default_message = f"Your {topic.lower()} query has been routed to the appropriate team. {urgency_msg}"
             
-            return jsonify({
+            result = {
                 'response': routing_messages.get(topic, default_message),
                 'sources': [],
                 'classification': {
@@ -229,10 +424,16 @@ def agent_chat():
                     'priority': classification.get('priority', 'P2 (Low)')
                 },
                 'knowledge_base_results': 0,
-                'conversation_id': chat_request.conversation_id or 'new',
+                'conversation_id': conversation_id,
                 'ticket_id': ticket_id,
+                'follow_up': follow_up,
                 'type': 'routed'
-            })
+            }
+        
+        result['degraded'] = deadline.shortcuts()
+        conversation.add_turn(message, result['response'], conversation_store.keep_turns, conversation_store.summary_chars)
+        conversation_store.save(conversation)
+        return jsonify(result)
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
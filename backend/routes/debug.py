@@ -0,0 +1,85 @@
+"""
+Admin-only debugging routes: stored profiles, memory report, the continuous profiler and traffic capture.
+"""
+import io
+import pstats
+from functools import wraps
+from flask import Blueprint, Response, jsonify, request, send_file
+from core.profiling import profiler, is_admin
+from core.capture import capture
+
+debug_bp = Blueprint('debug', __name__)
+
+
+def admin_only(view):
+    """Require X-Admin-Token to match ADMIN_TOKEN; the routes do not exist without one"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not is_admin(request.headers):
+            return jsonify({'error': 'Not found'}), 404
+        return view(*args, **kwargs)
+    return wrapper
+
+
+@debug_bp.route('/api/debug/profiles', methods=['GET'])
+@admin_only
+def list_profiles():
+    """Stored per-request profiles and continuous profiler windows, newest first"""
+    return jsonify({'profiles': profiler.list_profiles(), **profiler.status()})
+
+
+@debug_bp.route('/api/debug/profiles/<name>', methods=['GET'])
+@admin_only
+def get_profile(name):
+    """Download a profile; `?format=text` renders a .prof file as a pstats table"""
+    path = profiler.profile_path(name)
+    if path is None:
+        return jsonify({'error': 'Profile not found'}), 404
+    if name.endswith('.prof') and request.args.get('format') == 'text':
+        out = io.StringIO()
+        stats = pstats.Stats(path, stream=out)
+        stats.sort_stats(request.args.get('sort', 'cumulative')).print_stats(request.args.get('limit', 40, type=int))
+        return Response(out.getvalue(), mimetype='text/plain')
+    return send_file(path, as_attachment=True, download_name=name)
+
+
+@debug_bp.route('/api/debug/memory', methods=['GET'])
+@admin_only
+def memory_report():
+    """tracemalloc top allocators plus knowledge base, index and model sizes"""
+    group_by = request.args.get('group_by', 'lineno')
+    if group_by not in ('lineno', 'filename', 'traceback'):
+        return jsonify({'error': 'group_by must be lineno, filename or traceback'}), 400
+    return jsonify(profiler.memory_report(limit=request.args.get('limit', 20, type=int), group_by=group_by))
+
+
+@debug_bp.route('/api/debug/memory/tracemalloc', methods=['POST'])
+@admin_only
+def toggle_tracemalloc():
+    """Start or stop tracemalloc: {"enabled": true, "frames": 1}"""
+    data = request.get_json(silent=True) or {}
+    profiler.set_tracemalloc(bool(data.get('enabled')), int(data.get('frames', 1)))
+    return jsonify(profiler.memory_report(limit=0)['tracemalloc'])
+
+
+@debug_bp.route('/api/debug/profiler', methods=['GET', 'POST'])
+@admin_only
+def continuous_profiler():
+    """Status of the continuous sampler; POST {"enabled": true, "interval_ms": 50} toggles it"""
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        profiler.set_continuous(bool(data.get('enabled')), data.get('interval_ms'))
+    return jsonify(profiler.status())
+
+
+@debug_bp.route('/api/debug/capture', methods=['GET', 'POST'])
+@admin_only
+def traffic_capture():
+    """Traffic capture status; POST {"enabled": true, "sample_rate": 0.1} changes it at runtime"""
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        if 'sample_rate' in data:
+            capture.sample_rate = float(data['sample_rate'])
+        if 'enabled' in data:
+            capture.enabled = bool(data['enabled'])
+    return jsonify(capture.status())
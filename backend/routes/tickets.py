@@ -1,16 +1,27 @@
 """
 Ticket-related API routes.
 """
-import json
 import os
-import uuid
-from datetime import datetime
-from flask import Blueprint, jsonify, request
+import json
+import hashlib
+import threading
+from flask import Blueprint, Response, jsonify, request, make_response, stream_with_context
 from pydantic import BaseModel, ValidationError
-from typing import List, Optional
+from typing import List, Optional, Tuple
 from utils import classify_ticket
+from core.ticket_store import ticket_store, to_api_ticket, parse_timestamp
+from core.ticket_index import ticket_index, LABEL_FIELDS
+from core.events import RESYNC, event_bus
+from core.ticket_stats import ticket_stats
+from core.ticket_search import ticket_search_index
+from core.similar_tickets import similar_tickets
+from core.ticket_backfill import ticket_backfill
+from core.admission import admission_controlled
+from core.metrics import CACHE_HITS, CACHE_MISSES
+from core.structured_log import get_logger
 
 tickets_bp = Blueprint('tickets', __name__)
+log = get_logger('tickets')
 
 class TicketModel(BaseModel):
     id: str
@@ -19,94 +30,321 @@ class TicketModel(BaseModel):
     text: str
     classification: Optional[dict] = None
 
+# Keep the listing, aggregate, search and similarity indexes in sync with the ticket store
+ticket_store.attach(ticket_index)
+ticket_store.attach(ticket_stats)
+ticket_store.attach(ticket_search_index)
+ticket_store.attach(similar_tickets)
+# Classify tickets that arrive unclassified so label filters and counts include them
+ticket_store.attach(ticket_backfill)
+
+class LiveFeed:
+    """Publishes ticket changes, including other workers' (via the shared journal), to live dashboard subscribers"""
+
+    def rebuild(self, tickets):
+        # The store reloaded after missing journal records; subscribers refetch instead
+        event_bus.publish(RESYNC, {})
+
+    def on_ticket_event(self, event, ticket):
+        event_bus.publish(event, to_api_ticket(ticket), ticket_store.seq)
+
+ticket_store.attach(LiveFeed())
+
+SSE_HEARTBEAT_SECONDS = 15
+
 def load_sample_tickets():
     """Load and process sample tickets."""
     try:
-        # Try multiple possible paths for the tickets file
-        possible_paths = [
-            'sample_tickets.json',  # Current directory
-            '../sample_tickets.json',  # Parent directory
-            os.path.join(os.path.dirname(__file__), '../../sample_tickets.json'),  # Relative to this file
-            os.path.join(os.getcwd(), 'sample_tickets.json'),  # Current working directory
-        ]
-        
-        tickets_path = None
-        for path in possible_paths:
-            if os.path.exists(path):
-                tickets_path = path
-                break
-        
-        if not tickets_path:
-            print(f"Could not find sample_tickets.json in any of these paths: {possible_paths}")
-            print(f"Current working directory: {os.getcwd()}")
-            print(f"This file location: {os.path.dirname(__file__)}")
-            return []
-        
-        print(f"Loading tickets from: {tickets_path}")
-        
-        with open(tickets_path, 'r', encoding='utf-8') as f:
-            raw_tickets = json.load(f)
-        
-        print(f"Loaded {len(raw_tickets)} raw tickets")
-        
-        processed_tickets = []
-        for ticket in raw_tickets:
-            # Convert to expected format, handling both old and new structures
-            if 'subject' in ticket and 'body' in ticket:
-                # Old format with subject and body
-                text = f"{ticket.get('subject', '')} - {ticket.get('body', '')}"
-            elif 'body' in ticket:
-                # New format where body is the main text (from agent)
-                text = ticket.get('body', '')
-            else:
-                # Fallback
-                text = ticket.get('text', '')
-            
-            processed_ticket = {
-                'id': ticket.get('id', str(uuid.uuid4())),
-                'channel': ticket.get('channel', 'email'),
-                'createdAt': ticket.get('createdAt', datetime.now().isoformat()),
-                'text': text,
-                'classification': ticket.get('classification', None)  # Use existing classification if available
-            }
-            processed_tickets.append(processed_ticket)
-        
-        print(f"Processed {len(processed_tickets)} tickets")
+        processed_tickets = [to_api_ticket(ticket) for ticket in ticket_store.all()]
         return processed_tickets
     except Exception as e:
-        print(f"Error loading tickets: {e}")
-        import traceback
-        traceback.print_exc()
+        log.exception("Error loading tickets")
         return []
 
+def _split_param(name: str) -> List[str]:
+    """Comma-separated and repeated query parameters as one list"""
+    values = []
+    for raw in request.args.getlist(name):
+        values.extend(v.strip() for v in raw.split(',') if v.strip())
+    return values
+
+# Serialized full listing, reused until the store's change sequence moves
+_listing_cache = {'seq': None, 'body': None}
+_listing_lock = threading.Lock()
+
+def _listing_etag(seq: int) -> str:
+    """Strong validator for a listing: the shared store sequence plus the exact query string, valid on any worker"""
+    query_hash = hashlib.md5(request.query_string).hexdigest()[:8]
+    return f"{seq}-{query_hash}"
+
+def _not_modified(etag: str):
+    CACHE_HITS.inc(cache='etag')
+    response = make_response('', 304)
+    response.set_etag(etag)
+    return response
+
+def _full_listing_body() -> Tuple[int, bytes]:
+    """
+    The serialized full listing and the store sequence it reflects. The body
+    is reused until the sequence moves; serializing happens outside the lock,
+    which only guards the sequence check and the swap of the cached body.
+    """
+    seq, stored = ticket_store.versioned_all()
+    with _listing_lock:
+        if _listing_cache['seq'] == seq:
+            CACHE_HITS.inc(cache='full_listing')
+            return seq, _listing_cache['body']
+    CACHE_MISSES.inc(cache='full_listing')
+    body = jsonify([to_api_ticket(ticket) for ticket in stored]).get_data()
+    log.info("Serialized full listing", extra={'tickets': len(stored)})
+    with _listing_lock:
+        if _listing_cache['seq'] is None or seq > _listing_cache['seq']:
+            _listing_cache['body'] = body
+            _listing_cache['seq'] = seq
+    return seq, body
+
+PAGINATION_PARAMS = ('limit', 'cursor', 'sort', 'since', 'until') + LABEL_FIELDS
+
 @tickets_bp.route('/api/tickets', methods=['GET'])
 def get_tickets():
-    """Get all tickets with classifications."""
+    """
+    Get tickets with classifications.
+
+    Classification happens in the background (core/ticket_backfill.py), never
+    on this request path; tickets it has not reached yet have a null
+    classification. Without query parameters the full list is returned as an array. With any of
+    limit, cursor, sort, since, until, topic, sentiment, priority or channel the
+    response is a single page: {tickets, next_cursor, total, limit,
+    pending_classification}.
+
+    Responses carry a strong ETag derived from the store's change sequence;
+    a matching If-None-Match returns 304 without touching the tickets.
+    """
     try:
-        tickets = load_sample_tickets()
-        print(f"Loaded {len(tickets)} tickets for API response")
-        
-        # Classify each ticket if not already classified
-        classified_count = 0
-        for ticket in tickets:
-            if not ticket.get('classification'):
-                classification = classify_ticket(ticket['text'])
-                # Convert single topic to topics array for backward compatibility
-                if 'topic' in classification and 'topics' not in classification:
-                    classification['topics'] = [classification['topic']]
-                ticket['classification'] = classification
-                classified_count += 1
-        
-        print(f"Classified {classified_count} tickets on-the-fly")
-        print(f"Returning {len(tickets)} tickets to frontend")
-        
-        return jsonify(tickets)
+        ticket_store.ensure_loaded()
+        etag = _listing_etag(ticket_store.seq)
+        if request.if_none_match.contains(etag):
+            return _not_modified(etag)
+
+        if not any(param in request.args for param in PAGINATION_PARAMS):
+            seq, body = _full_listing_body()
+            response = make_response(body)
+            response.mimetype = 'application/json'
+            response.set_etag(_listing_etag(seq))
+            return response
+
+        try:
+            limit = min(max(int(request.args.get('limit', 50)), 1), 500)
+            since = request.args.get('since')
+            until = request.args.get('until')
+            page = ticket_index.query(
+                filters={field: _split_param(field) for field in LABEL_FIELDS},
+                since=parse_timestamp(since) if since else None,
+                until=parse_timestamp(until) if until else None,
+                sort=request.args.get('sort', '-createdAt'),
+                limit=limit,
+                cursor=request.args.get('cursor')
+            )
+        except (ValueError, TypeError) as e:
+            return jsonify({'error': f'Invalid query: {e}'}), 400
+
+        tickets = [to_api_ticket(ticket_store.get(ticket_id)) for ticket_id in page['ids']]
+        response = jsonify({
+            'tickets': tickets,
+            'next_cursor': page['next_cursor'],
+            'total': page['total'],
+            'limit': limit,
+            # Tickets still waiting for a classification; label filters cannot match them yet
+            'pending_classification': ticket_backfill.backlog
+        })
+        response.set_etag(_listing_etag(ticket_store.seq))
+        return response
     except Exception as e:
-        print(f"Error in get_tickets: {e}")
-        import traceback
-        traceback.print_exc()
+        log.exception("Error in get_tickets")
         return jsonify({'error': str(e)}), 500
 
+@tickets_bp.route('/api/tickets/search', methods=['GET'])
+def search_tickets():
+    """
+    Full-text search over ticket subject and body, ranked by BM25.
+
+    q supports plain terms, prefix terms (sam*) and "quoted phrases"; every
+    clause must match.
+    """
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'error': 'Query parameter q is required'}), 400
+    try:
+        limit = min(max(int(request.args.get('limit', 20)), 1), 100)
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+
+    try:
+        ticket_store.ensure_loaded()
+        found = ticket_search_index.search(query, limit=limit)
+        results = [
+            {'ticket': to_api_ticket(ticket_store.get(ticket_id)), 'score': round(score, 4)}
+            for ticket_id, score in found['hits']
+        ]
+        return jsonify({'query': query, 'total': found['total'], 'results': results})
+    except Exception as e:
+        log.exception("Error in search_tickets")
+        return jsonify({'error': str(e)}), 500
+
+@tickets_bp.route('/api/tickets/<ticket_id>/similar', methods=['GET'])
+def get_similar_tickets(ticket_id):
+    """
+    Earlier tickets closest to this one by embedding similarity.
+
+    Each result carries its cosine score; `duplicate_of` is set when the best
+    match is above the duplicate threshold.
+    """
+    try:
+        limit = min(max(int(request.args.get('limit', 5)), 1), 50)
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+
+    try:
+        ticket = ticket_store.get(ticket_id)
+        if ticket is None:
+            return jsonify({'error': f'Ticket {ticket_id} not found'}), 404
+        hits = similar_tickets.similar_to_ticket(ticket, limit=limit)
+        results = [
+            {'ticket': to_api_ticket(ticket_store.get(similar_id)), 'score': round(score, 4)}
+            for similar_id, score in hits
+        ]
+        return jsonify({
+            'ticket_id': ticket_id,
+            'results': results,
+            'duplicate_of': similar_tickets.duplicate_of(hits),
+            'indexed': len(similar_tickets),
+            'pending': similar_tickets.backlog
+        })
+    except Exception as e:
+        log.exception("Error in get_similar_tickets")
+        return jsonify({'error': str(e)}), 500
+
+@tickets_bp.route('/api/tickets/stats', methods=['GET'])
+def get_ticket_stats():
+    """
+    Dashboard aggregates: totals, counts per topic/sentiment/priority/channel
+    and a topic/priority histogram bucketed by hour or day.
+
+    Accepts the same topic/sentiment/priority/channel filters as the listing;
+    with any set, only matching tickets are counted.
+    """
+    try:
+        ticket_store.ensure_loaded()
+        etag = _listing_etag(ticket_store.seq)
+        if request.if_none_match.contains(etag):
+            return _not_modified(etag)
+
+        try:
+            since = request.args.get('since')
+            until = request.args.get('until')
+            stats = ticket_stats.snapshot(
+                bucket=request.args.get('bucket', 'hour'),
+                since=parse_timestamp(since) if since else None,
+                until=parse_timestamp(until) if until else None,
+                filters={field: _split_param(field) for field in LABEL_FIELDS}
+            )
+        except ValueError as e:
+            return jsonify({'error': f'Invalid query: {e}'}), 400
+
+        stats['seq'] = ticket_store.seq
+        # Unclassified tickets the background classifier has not reached yet
+        stats['pending_classification'] = ticket_backfill.backlog
+        response = jsonify(stats)
+        response.set_etag(etag)
+        return response
+    except Exception as e:
+        log.exception("Error in get_ticket_stats")
+        return jsonify({'error': str(e)}), 500
+
+@tickets_bp.route('/api/tickets/changes', methods=['GET'])
+def get_ticket_changes():
+    """
+    Tickets created or classified after a change sequence number.
+
+    Poll with the returned seq as the next `since`. When `reset` is true the
+    requested point has fallen out of the change log and the client should
+    refetch /api/tickets.
+    """
+    try:
+        since = int(request.args.get('since', 0))
+    except ValueError:
+        return jsonify({'error': 'since must be an integer sequence number'}), 400
+
+    try:
+        seq, changes = ticket_store.changes_since(since)
+        if changes is None:
+            return jsonify({'seq': seq, 'changes': [], 'reset': True})
+        return jsonify({'seq': seq, 'changes': changes, 'reset': False})
+    except Exception as e:
+        log.exception("Error in get_ticket_changes")
+        return jsonify({'error': str(e)}), 500
+
+def _sse(event: str, data, seq=None) -> str:
+    lines = [f"event: {event}"]
+    if seq is not None:
+        lines.append(f"id: {seq}")
+    lines.append(f"data: {json.dumps(data, ensure_ascii=False)}")
+    return "\n".join(lines) + "\n\n"
+
+@tickets_bp.route('/api/tickets/stream', methods=['GET'])
+def stream_tickets():
+    """
+    Server-Sent Events feed of ticket.created and ticket.classified events.
+
+    Reconnecting clients send Last-Event-ID (or ?since=) and first receive the
+    changes they missed. A 'resync' event means the client fell behind and
+    should refetch /api/tickets.
+
+    Every worker serves the same feed: changes made through other workers
+    arrive through the shared ticket journal within TICKET_SYNC_SECONDS.
+
+    Each open stream holds a worker thread for as long as the client stays
+    connected, so production runs gunicorn with threaded workers (see README);
+    SSE_MAX_CLIENTS caps streams per process and answers 503 beyond it.
+    """
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('since')
+    ticket_store.ensure_loaded()
+    subscription = event_bus.subscribe()
+    if subscription is None:
+        response = jsonify({'error': 'Too many live subscribers, poll /api/tickets/changes instead'})
+        response.headers['Retry-After'] = str(SSE_HEARTBEAT_SECONDS)
+        return response, 503
+
+    def generate():
+        try:
+            seq = ticket_store.seq
+            replayed_to = None
+            yield _sse('hello', {'seq': seq})
+            if last_event_id is not None and last_event_id.isdigit():
+                _, missed = ticket_store.changes_since(int(last_event_id))
+                if missed is None:
+                    yield _sse('resync', {}, seq)
+                else:
+                    for change in missed:
+                        yield _sse(change['event'], change['ticket'], change['seq'])
+                replayed_to = seq
+            while True:
+                item = subscription.get(timeout=SSE_HEARTBEAT_SECONDS)
+                if item is None:
+                    yield ": keep-alive\n\n"
+                    continue
+                if replayed_to is not None and item['event'] != 'resync' \
+                        and item['seq'] is not None and item['seq'] <= replayed_to:
+                    continue  # Already delivered from the change log
+                yield _sse(item['event'], item['data'], item['seq'])
+        finally:
+            event_bus.unsubscribe(subscription)
+
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
 @tickets_bp.route('/api/tickets/test', methods=['GET'])
 def test_tickets():
     """Test endpoint to check if tickets are loading."""
@@ -117,12 +355,13 @@ def test_tickets():
             'ticket_count': len(tickets),
             'sample_ticket_ids': [t['id'] for t in tickets[:5]],
             'working_directory': os.getcwd(),
-            'file_exists': os.path.exists('sample_tickets.json')
+            'file_exists': os.path.exists(ticket_store.path or 'sample_tickets.json')
         })
     except Exception as e:
         return jsonify({'error': str(e), 'working_directory': os.getcwd()}), 500
 
 @tickets_bp.route('/api/classify', methods=['POST'])
+@admission_controlled()
 def classify():
     """Classify a single ticket text."""
     try:
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Parity check for the ONNX query encoder against the PyTorch SentenceTransformer
+"""
+
+import os
+import sys
+import glob
+import tempfile
+import numpy as np
+
+# Add the backend directory to the path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from sentence_transformers import SentenceTransformer
+from core.encoders import OnnxEncoder
+
+SEED_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'kb', 'seed')
+
+# Minimum cosine agreement per backend: (mean, worst case)
+THRESHOLDS = {
+    'onnx': (0.999, 0.995),
+    'onnx-int8': (0.98, 0.95),
+}
+
+
+def load_seed_passages():
+    """Split the seed corpus into paragraph-sized passages"""
+    passages = []
+    for path in sorted(glob.glob(os.path.join(SEED_DIR, '*.md'))):
+        with open(path, 'r', encoding='utf-8') as f:
+            for block in f.read().split('\n\n'):
+                block = block.strip()
+                if len(block) > 20:
+                    passages.append(block)
+    return passages
+
+
+def cosine_rows(a, b):
+    a = a / np.linalg.norm(a, axis=1, keepdims=True)
+    b = b / np.linalg.norm(b, axis=1, keepdims=True)
+    return (a * b).sum(axis=1)
+
+
+def test_encoder_parity():
+    """ONNX embeddings must agree with torch embeddings on the seed corpus"""
+    model = SentenceTransformer('all-MiniLM-L6-v2')
+    passages = load_seed_passages()
+    assert passages, f"No seed passages found in {SEED_DIR}"
+    reference = model.encode(passages)
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        for backend, (min_mean, min_worst) in THRESHOLDS.items():
+            encoder = OnnxEncoder.from_sentence_transformer(model, cache_dir, quantize=backend == 'onnx-int8')
+            agreement = cosine_rows(reference, encoder.encode(passages))
+            print(f"{backend}: {len(passages)} passages, mean cosine {agreement.mean():.5f}, "
+                  f"worst {agreement.min():.5f}")
+            assert agreement.mean() >= min_mean, f"{backend} mean cosine below {min_mean}"
+            assert agreement.min() >= min_worst, f"{backend} worst cosine below {min_worst}"
+
+
+if __name__ == "__main__":
+    print("🧪 Checking ONNX encoder parity...")
+    print("=" * 50)
+    try:
+        test_encoder_parity()
+        print("✅ Encoder parity check passed!")
+    except AssertionError as e:
+        print(f"❌ Encoder parity check failed: {e}")
+        sys.exit(1)
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Render exported traces: per-trace waterfalls and the slowest spans
+
+Usage:
+    python trace_view.py                       # waterfall of the 5 most recent traces
+    python trace_view.py --trace <trace_id>    # waterfall of one trace (job stages included)
+    python trace_view.py --top 20              # slowest spans across all traces
+    python trace_view.py --top 20 --span gemini
+"""
+
+import os
+import sys
+import json
+import argparse
+from collections import OrderedDict, defaultdict
+
+
+def load_traces(path):
+    """Traces from the JSONL export, merging lines that share a trace id (e.g. job stages)"""
+    traces = OrderedDict()
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            existing = traces.get(record['trace_id'])
+            if existing is None:
+                record['segments'] = [record['name']]
+                traces[record['trace_id']] = record
+                continue
+            # Rebase the later segment's spans onto the first segment's clock
+            offset_ms = (record['start'] - existing['start']) * 1000
+            for span in record['spans']:
+                span['start_ms'] = round(span['start_ms'] + offset_ms, 3)
+            existing['spans'].extend(record['spans'])
+            existing['segments'].append(record['name'])
+            existing['error'] = existing['error'] or record['error']
+            existing['duration_ms'] = max(existing['duration_ms'], offset_ms + record['duration_ms'])
+    return traces
+
+
+def print_waterfall(trace, width=50):
+    total = max(trace['duration_ms'], 0.001)
+    print(f"\nTrace {trace['trace_id']}  {' + '.join(trace['segments'])}  "
+          f"{trace['duration_ms']:.1f} ms{'  ERROR' if trace['error'] else ''}")
+
+    children = defaultdict(list)
+    ids = {span['id'] for span in trace['spans']}
+    for span in trace['spans']:
+        parent = span['parent'] if span['parent'] in ids else None
+        children[parent].append(span)
+
+    def walk(parent, depth):
+        for span in sorted(children.get(parent, []), key=lambda s: s['start_ms']):
+            start = int(span['start_ms'] / total * width)
+            length = max(1, int(span['duration_ms'] / total * width))
+            bar = ' ' * min(start, width - 1) + '#' * min(length, width - min(start, width - 1))
+            label = ('  ' * depth + span['name'])[:32]
+            attrs = ' '.join(f"{k}={v}" for k, v in span.get('attrs', {}).items() if k != 'endpoint')
+            print(f"  {label:<32} |{bar:<{width}}| {span['duration_ms']:>9.2f} ms  {attrs}")
+            walk(span['id'], depth + 1)
+
+    walk(None, 0)
+
+
+def print_top(traces, count, name=None):
+    spans = [
+        (span, trace) for trace in traces.values() for span in trace['spans']
+        if span['parent'] is not None and (name is None or span['name'] == name)
+    ]
+    spans.sort(key=lambda item: item[0]['duration_ms'], reverse=True)
+    print(f"\nTop {min(count, len(spans))} slowest spans{f' named {name}' if name else ''}:")
+    print(f"  {'duration':>10}  {'span':<20} {'trace':<34} request")
+    for span, trace in spans[:count]:
+        print(f"  {span['duration_ms']:>8.2f}ms  {span['name']:<20} {trace['trace_id']:<34} {trace['segments'][0]}")
+
+    by_name = defaultdict(list)
+    for span, _ in spans:
+        by_name[span['name']].append(span['duration_ms'])
+    print("\nPer span name (count, p50, p95, max ms):")
+    for span_name, durations in sorted(by_name.items(), key=lambda item: -sum(item[1])):
+        durations.sort()
+        p50 = durations[len(durations) // 2]
+        p95 = durations[min(len(durations) - 1, int(len(durations) * 0.95))]
+        print(f"  {span_name:<20} {len(durations):>6} {p50:>9.2f} {p95:>9.2f} {durations[-1]:>9.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Render traces exported to a JSONL file')
+    parser.add_argument('--file', default=os.getenv('TRACE_FILE', 'traces.jsonl'), help='Trace export file')
+    parser.add_argument('--trace', help='Show the waterfall for this trace id')
+    parser.add_argument('--last', type=int, default=5, help='Waterfalls for the N most recent traces')
+    parser.add_argument('--top', type=int, help='List the N slowest spans instead of waterfalls')
+    parser.add_argument('--span', help='With --top, only consider spans with this name')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.file):
+        print(f"No trace file at {args.file}")
+        sys.exit(1)
+    traces = load_traces(args.file)
+    print(f"Loaded {len(traces)} traces from {args.file}")
+
+    if args.top:
+        print_top(traces, args.top, args.span)
+    elif args.trace:
+        if args.trace not in traces:
+            print(f"Trace {args.trace} not found")
+            sys.exit(1)
+        print_waterfall(traces[args.trace])
+    else:
+        for trace in list(traces.values())[-args.last:]:
+            print_waterfall(trace)
+
+
+if __name__ == '__main__':
+    main()
@@ -4,12 +4,28 @@ import requests
 from bs4 import BeautifulSoup
 import re
 import json
+from core.single_flight import llm_flight, prompt_key
+from core.hedging import hedger
+from core.metrics import stage, LLM_ERRORS, LLM_FALLBACKS
+from core.tracing import span
+from core.structured_log import get_logger
+from core import deadline
 
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
+# Alternative Gemini REST endpoint, e.g. the stub server used by bench_load.py
+GEMINI_API_ENDPOINT = os.getenv('GEMINI_API_ENDPOINT')
 MODEL_NAME = 'models/gemini-2.5-flash'
 
 if GEMINI_API_KEY:
-    genai.configure(api_key=GEMINI_API_KEY)
+    if GEMINI_API_ENDPOINT:
+        genai.configure(api_key=GEMINI_API_KEY, transport='rest',
+                        client_options={'api_endpoint': GEMINI_API_ENDPOINT})
+    else:
+        genai.configure(api_key=GEMINI_API_KEY)
+
+log = get_logger('llm')
+# Per-page crawl messages are rate limited; warnings and errors always pass
+crawl_log = get_logger('crawler', max_per_second=float(os.getenv('CRAWL_LOG_RATE', '5')))
 
 # Classification prompt
 CLASSIFY_PROMPT = '''You are an expert helpdesk ticket classifier for Atlan. Given a customer support ticket, classify it with:
@@ -91,9 +107,47 @@ DOC_SOURCES = {
         "exclude": ["nav", "header", "footer", ".sidebar", ".navigation"]
     }
 }
+# Comma-separated base URLs replacing the sources above (e.g. a local fixture site)
+if os.getenv('DOC_SOURCE_URLS'):
+    DOC_SOURCES = {
+        url.strip(): dict(DOC_SOURCES["https://docs.atlan.com/"])
+        for url in os.getenv('DOC_SOURCE_URLS').split(',') if url.strip()
+    }
+
+MARKUP_PREFIX_RE = re.compile(r'^(?:#{1,6}|[-*]|\d+[.)])\s+')
+CONTENT_TAGS = ['h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'p', 'li', 'pre', 'div']
+MAX_CONTENT_LINES = 50
+
+def _content_block(tag):
+    """Markdown-style rendering of one content element, or None to skip it"""
+    if tag.find_parent(['li', 'pre']):
+        return None  # Rendered as part of its list item or code block
+    if tag.name == 'div' and tag.find(CONTENT_TAGS):
+        return None  # Only leaf divs; containers are covered by their children
+    if tag.name == 'pre':
+        code = tag.get_text().strip('\n')
+        return f"```\n{code}\n```" if code.strip() else None
+    text = ' '.join(tag.get_text(' ', strip=True).split())
+    if tag.name in ('h1', 'h2', 'h3', 'h4', 'h5', 'h6'):
+        return f"{'#' * int(tag.name[1])} {text}" if len(text) > 2 else None
+    if tag.name == 'li':
+        if len(text) <= 10:
+            return None
+        parent = tag.find_parent(['ol', 'ul'])
+        if parent is not None and parent.name == 'ol':
+            return f"{len(tag.find_previous_siblings('li')) + 1}. {text}"
+        return f"- {text}"
+    return text if len(text) > 20 else None  # Filter out short/empty text
 
 def extract_page_content(url, selectors, exclude_selectors):
-    """Extract meaningful content from a webpage"""
+    """
+    Extract meaningful content from a webpage.
+
+    Main content keeps its structure as markdown: headings become '#' lines,
+    list items '- ' / '1. ' lines and <pre> blocks fenced code, with a blank line
+    between blocks (consecutive list items stay together), so the structure-aware
+    chunker can split on it.
+    """
     try:
         headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
@@ -108,21 +162,34 @@ def extract_page_content(url, selectors, exclude_selectors):
                 elem.decompose()
         
         # Try to find main content using selectors
-        content_text = ""
+        blocks = []
+        seen = set()
+        lines = 0
         for selector in selectors:
             elements = soup.select(selector)
             if elements:
                 for elem in elements:
-                    # Extract text from paragraphs, headings, and lists
-                    for tag in elem.find_all(['p', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'li', 'div']):
-                        text = tag.get_text(strip=True)
-                        if text and len(text) > 20:  # Filter out short/empty text
-                            content_text += text + "\n"
+                    for tag in elem.find_all(CONTENT_TAGS):
+                        block = _content_block(tag)
+                        # Remove duplicates while preserving order
+                        if not block or block in seen:
+                            continue
+                        seen.add(block)
+                        if blocks and tag.name == 'li' and blocks[-1][0] == 'li':
+                            blocks[-1] = ('li', blocks[-1][1] + '\n' + block)
+                        else:
+                            blocks.append((tag.name, block))
+                        lines += block.count('\n') + 1
+                        if lines >= MAX_CONTENT_LINES:  # Limit to the first 50 meaningful lines
+                            break
+                    if lines >= MAX_CONTENT_LINES:
+                        break
                 break
+        if blocks:
+            return '\n\n'.join(block for _, block in blocks)
         
         # Fallback: extract all meaningful text
-        if not content_text:
-            content_text = soup.get_text(separator='\n', strip=True)
+        content_text = soup.get_text(separator='\n', strip=True)
         
         # Clean up the text
         lines = [line.strip() for line in content_text.split('\n') if line.strip()]
@@ -134,10 +201,10 @@ def extract_page_content(url, selectors, exclude_selectors):
                 seen.add(line)
                 unique_lines.append(line)
         
-        return '\n'.join(unique_lines[:50])  # Limit to first 50 meaningful lines
+        return '\n'.join(unique_lines[:MAX_CONTENT_LINES])  # Limit to first 50 meaningful lines
         
     except Exception as e:
-        print(f"Content extraction error for {url}: {e}")
+        crawl_log.warning("Content extraction failed", extra={'url': url, 'error': str(e)})
         return ""
 
 def discover_documentation_pages(base_url, max_pages=10):
@@ -194,7 +261,7 @@ def discover_documentation_pages(base_url, max_pages=10):
                 break
                 
     except Exception as e:
-        print(f"Page discovery error for {base_url}: {e}")
+        crawl_log.warning("Page discovery failed", extra={'url': base_url, 'error': str(e)})
     
     return list(set(discovered_urls))[:max_pages]
 
@@ -204,17 +271,21 @@ def scrape_relevant_content(query, max_snippets=5):
     sources_used = []
     
     for base_url, config in DOC_SOURCES.items():
-        print(f"Scraping content from {base_url}...")
+        crawl_log.info("Scraping content", extra={'url': base_url})
         
         # Discover relevant pages
         pages = discover_documentation_pages(base_url, max_pages=8)
         
         for page_url in pages:
+            if not deadline.has(deadline.GENERATE_MIN_SECONDS):
+                break  # Keep what was found so far and leave time to answer
             try:
                 content = extract_page_content(page_url, config["selectors"], config["exclude"])
                 if content:
                     # Split content into chunks and find relevant ones
-                    chunks = [chunk.strip() for chunk in content.split('\n') if chunk.strip()]
+                    # One candidate per line, without the heading/list markers added for chunking
+                    chunks = [MARKUP_PREFIX_RE.sub('', chunk.strip()) for chunk in content.split('\n')
+                              if chunk.strip() and not chunk.strip().startswith('```')]
                     
                     for chunk in chunks:
                         # Better relevance scoring
@@ -250,7 +321,7 @@ def scrape_relevant_content(query, max_snippets=5):
                             all_content.append((relevance_score, page_url, chunk))
                             
             except Exception as e:
-                print(f"Error processing {page_url}: {e}")
+                crawl_log.warning("Error processing page", extra={'url': page_url, 'error': str(e)})
                 continue
     
     # Sort by relevance score and take top results
@@ -270,7 +341,7 @@ def scrape_relevant_content(query, max_snippets=5):
     context = "\n\n---\n\n".join(context_parts)
     sources_used = list(set(sources_used))
     
-    print(f"Found {len(top_content)} relevant content pieces from {len(sources_used)} sources")
+    log.info("Scraped relevant content", extra={'pieces': len(top_content), 'sources': len(sources_used)})
     return context, sources_used
 
 def clean_response_text(text):
@@ -329,7 +400,7 @@ def extract_json(text):
         return json.loads(text.strip())
         
     except json.JSONDecodeError as e:
-        print(f'JSON decode error: {e}')
+        log.debug("JSON decode error", extra={'error': str(e)})
         # Strategy 4: Try to fix common JSON issues
         try:
             # Fix common issues like trailing commas, unquoted keys, etc.
@@ -347,67 +418,148 @@ def extract_json(text):
                 return json.loads(json_part)
                 
         except Exception as e2:
-            print(f'JSON fix attempt failed: {e2}')
+            log.warning("JSON fix attempt failed", extra={'error': str(e2)})
     
     except Exception as e:
-        print(f'JSON extraction error: {e}')
+        log.warning("JSON extraction error", extra={'error': str(e)})
     
     return None
 
+def gemini_generate(prompt, operation='generate'):
+    """
+    Call Gemini and return the response text.
+
+    Concurrent calls with the same (whitespace-normalized) prompt share a single
+    upstream request and its result or error. Under a request deadline the call
+    (or the wait for a shared one) is bounded by the time left. Operations named
+    in HEDGE_OPERATIONS send a second request when the first is slow.
+    """
+    timeout = deadline.call_timeout()
+    def attempt():
+        model = genai.GenerativeModel(MODEL_NAME)
+        # A hedge starts later than the first attempt, so it gets what is left by then
+        attempt_timeout = deadline.call_timeout()
+        options = {'timeout': attempt_timeout} if attempt_timeout is not None else {}
+        return model.generate_content(prompt, request_options=options).text
+    def call():
+        return hedger.run(operation, attempt, timeout)
+    with span('gemini', model=MODEL_NAME, prompt_chars=len(prompt)):
+        return llm_flight.do(prompt_key(MODEL_NAME, prompt), call, timeout)
+
 def classify_ticket(text):
+    with stage('classify'):
+        return _classify_ticket(text)
+
+def _classify_ticket(text):
     if not GEMINI_API_KEY:
+        LLM_FALLBACKS.inc(operation='classify', reason='no_api_key')
+        # Placeholder, not a real classification: callers must not store it
         return {
             "topic": "How-to",
             "sentiment": "Curious",
-            "priority": "P1 (Medium)"
+            "priority": "P1 (Medium)",
+            "degraded": True
+        }
+    if not deadline.allows('classify', deadline.CLASSIFY_MIN_SECONDS):
+        LLM_FALLBACKS.inc(operation='classify', reason='deadline')
+        # Placeholder, not a real classification: callers must not store it
+        return {
+            "topic": "How-to",
+            "sentiment": "Curious",
+            "priority": "P1 (Medium)",
+            "degraded": True
         }
     prompt = CLASSIFY_PROMPT.format(ticket=text)
     try:
-        model = genai.GenerativeModel(MODEL_NAME)
-        response = model.generate_content(prompt)
-        result = extract_json(response.text)
+        result = extract_json(gemini_generate(prompt, operation='classify'))
         if result and all(k in result for k in ("topic", "sentiment", "priority")):
             return result
+        LLM_ERRORS.inc(operation='classify')
     except Exception as e:
-        print('Gemini classify error:', e)
+        LLM_ERRORS.inc(operation='classify')
+        log.warning("Gemini classify error", extra={'error': str(e)})
+    LLM_FALLBACKS.inc(operation='classify', reason='deadline' if deadline.timed_out('classify') else 'error')
     return {
         "topic": "How-to",
         "sentiment": "Curious",
-        "priority": "P1 (Medium)"
+        "priority": "P1 (Medium)",
+        "degraded": True
     }
 
-def generate_response(text, topics):
-    """Generate AI response using RAG with FAISS knowledge base"""
-    topic = topics[0] if isinstance(topics, list) and topics else topics if isinstance(topics, str) else "Other"
-    
-    print(f"Generating response for topic: {topic}")
-    
+def retrieve_context(text, topic):
+    """Retrieve documentation context for a ticket, returning (context, sources)"""
+    with stage('retrieve'):
+        return _retrieve_context(text, topic)
+
+def _retrieve_context(text, topic):
     # Try to use FAISS knowledge base, fallback to basic scraping
     try:
-        from knowledge_base import get_rag_context
+        from knowledge_base import kb, get_rag_context
+        if kb.index is None and deadline.current() is not None:
+            # Building the index inline takes minutes; a request with a deadline cannot wait for it
+            deadline.shortcut('retrieve_index')
+            raise RuntimeError('Knowledge base is still initializing')
         search_query = f"{topic} {text}"
         context, sources = get_rag_context(search_query)
-        print(f"Retrieved context from FAISS: {len(context)} characters from {len(sources)} sources")
+        log.debug("Retrieved context from FAISS", extra={'chars': len(context), 'sources': len(sources)})
     except Exception as e:
-        print(f"FAISS knowledge base error: {e}, falling back to basic scraping")
+        log.warning("FAISS knowledge base error, falling back to basic scraping", extra={'error': str(e)})
         try:
+            if not deadline.allows('scrape', deadline.SCRAPE_MIN_SECONDS):
+                raise RuntimeError('Not enough time left to scrape documentation')
             # Fallback to basic scraping
             search_query = f"{topic} {text}"
             context, sources = scrape_relevant_content(search_query)
-            print(f"Retrieved context from scraping: {len(context)} characters from {len(sources)} sources")
+            log.info("Retrieved context from scraping", extra={'chars': len(context), 'sources': len(sources)})
         except Exception as e2:
-            print(f"Basic scraping also failed: {e2}, using minimal fallback")
+            log.error("Basic scraping also failed, using minimal fallback", extra={'error': str(e2)})
             context = f"I understand you're asking about {topic}. While I don't have specific documentation available right now, I recommend checking the official Atlan documentation or contacting support for detailed assistance."
             sources = ["https://docs.atlan.com/", "https://developer.atlan.com/"]
+    return context, sources
+
+def generate_response(text, topics, context=None, sources=None, history=None):
+    """
+    Generate AI response using RAG with FAISS knowledge base.
+
+    Args:
+        text: Customer message
+        topics: Topic or list of topics from classification
+        context, sources: Previously retrieved documentation to reuse instead of searching again
+        history: Bounded conversation transcript placed ahead of the message in the prompt
+    """
+    topic = topics[0] if isinstance(topics, list) and topics else topics if isinstance(topics, str) else "Other"
     
-    prompt = RAG_PROMPT.format(ticket=text, topic=topic, context=context)
+    log.debug("Generating response", extra={'topic': topic})
+    
+    if context is None:
+        context, sources = retrieve_context(text, topic)
+    sources = sources or []
+    
+    ticket = f"{history}\n\nCURRENT MESSAGE:\n{text}" if history else text
+    prompt = RAG_PROMPT.format(ticket=ticket, topic=topic, context=context)
     
     # Define RAG-eligible topics as per requirements
     RAG_TOPICS = ["How-to", "Product", "Best practices", "API/SDK", "SSO"]
     
+    def fallback():
+        """
+        Extractive answer from the retrieved context for RAG topics, routing notice
+        otherwise; marked degraded so it is not kept for reuse.
+        """
+        if topic not in RAG_TOPICS:
+            fallback_response = f"This ticket has been classified as a '{topic}' issue and routed to the appropriate team."
+            return {"response": clean_response_text(fallback_response), "sources": [], "degraded": True}
+        if context and len(context) > 100:
+            # Use the retrieved content for a better fallback
+            fallback_response = f"Based on the available Atlan documentation for {topic}:\n\n{context[:800]}...\n\nFor the most up-to-date information, please check the official Atlan documentation."
+        else:
+            fallback_response = f"I found limited information for your {topic} question. Please refer to the official Atlan documentation for detailed guidance, or contact our support team for personalized assistance."
+        return {"response": clean_response_text(fallback_response), "sources": sources, "degraded": True}
+    
     # Fallback responses when no API key
     if not GEMINI_API_KEY:
-        print("No Gemini API key - using fallback response")
+        log.debug("No Gemini API key - using fallback response")
+        LLM_FALLBACKS.inc(operation='generate', reason='no_api_key')
         if topic in RAG_TOPICS:
             return {
                 "response": f"Based on the Atlan documentation, here's guidance for your {topic} question:\n\n{context[:500]}...\n\nFor complete details, please refer to the official documentation.",
@@ -419,14 +571,18 @@ def generate_response(text, topics):
                 "sources": []
             }
     
+    # Too little time left for Gemini: answer from the retrieved context now
+    if not deadline.allows('generate', deadline.GENERATE_MIN_SECONDS):
+        LLM_FALLBACKS.inc(operation='generate', reason='deadline')
+        return fallback()
+    
     try:
-        print("Calling Gemini API for response generation...")
-        model = genai.GenerativeModel(MODEL_NAME)
-        response = model.generate_content(prompt)
+        with stage('generate'):
+            response_text = gemini_generate(prompt)
         
-        print(f"Gemini response received: {len(response.text)} characters")
+        log.debug("Gemini response received", extra={'chars': len(response_text)})
         
-        result = extract_json(response.text)
+        result = extract_json(response_text)
         if result and "response" in result:
             # Clean the response text
             result['response'] = clean_response_text(result['response'])
@@ -434,34 +590,16 @@ def generate_response(text, topics):
             # Ensure sources are included
             if "sources" not in result or not result["sources"]:
                 result['sources'] = sources
-            print(f"Successfully generated response with {len(result.get('sources', []))} sources")
+            log.debug("Generated response", extra={'sources': len(result.get('sources', []))})
             return result
         else:
-            print("Failed to extract valid JSON from Gemini response")
-            print(f"Raw response: {response.text[:200]}...")
+            log.warning("Failed to extract valid JSON from Gemini response", extra={'raw': response_text[:200]})
             raise Exception('No valid JSON in Gemini response')
             
     except Exception as e:
-        print(f'Gemini RAG error: {e}')
+        log.warning("Gemini RAG error", extra={'error': str(e)})
+        LLM_ERRORS.inc(operation='generate')
+        LLM_FALLBACKS.inc(operation='generate', reason='deadline' if deadline.timed_out('generate') else 'error')
         
         # Enhanced fallback with actual context - only for RAG topics
-        if topic in RAG_TOPICS:
-            if context and len(context) > 100:
-                # Use the scraped content for a better fallback
-                fallback_response = f"Based on the available Atlan documentation for {topic}:\n\n{context[:800]}...\n\nFor the most up-to-date information, please check the official Atlan documentation."
-                return {
-                    "response": clean_response_text(fallback_response),
-                    "sources": sources
-                }
-            else:
-                fallback_response = f"I found limited information for your {topic} question. Please refer to the official Atlan documentation for detailed guidance, or contact our support team for personalized assistance."
-                return {
-                    "response": clean_response_text(fallback_response),
-                    "sources": sources
-                }
-        else:
-            fallback_response = f"This ticket has been classified as a '{topic}' issue and routed to the appropriate team."
-            return {
-                "response": clean_response_text(fallback_response),
-                "sources": []
-            } 
\ No newline at end of file
+        return fallback()
@@ -1,18 +1,76 @@
 import { motion } from 'framer-motion'
+import { useQuery } from '@tanstack/react-query'
 import { PieChart, Pie, Cell, BarChart, Bar, XAxis, YAxis, CartesianGrid, Tooltip, ResponsiveContainer } from 'recharts'
 import { Card, CardContent, CardHeader, CardTitle } from '@/components/ui/card'
 import { Skeleton } from '@/components/ui/skeleton'
-import type { Ticket } from '@/lib/api'
+import { useUIStore } from '@/store/ui'
 
-interface ChartsProps {
-  tickets: Ticket[]
-  isLoading: boolean
+// Aggregates maintained by the backend (GET /api/tickets/stats), so the charts
+// match the server's counts without downloading and re-counting every ticket.
+// The dashboard's topic/sentiment/priority/channel filters are applied by the
+// server; the free-text search only narrows the ticket table.
+export interface TicketStats {
+  total: number
+  unclassified: number
+  pending_classification: number
+  counts: {
+    topic: Record<string, number>
+    sentiment: Record<string, number>
+    priority: Record<string, number>
+    channel: Record<string, number>
+  }
+  seq: number
+}
+
+export const TICKET_STATS_QUERY_KEY = ['ticket-stats']
+
+interface StatsFilters {
+  topic: string[]
+  sentiment: string
+  priority: string
+  channel: string
+}
+
+async function fetchTicketStats(filters: StatsFilters): Promise<TicketStats> {
+  const params = new URLSearchParams()
+  if (filters.topic.length > 0) params.set('topic', filters.topic.join(','))
+  if (filters.sentiment) params.set('sentiment', filters.sentiment)
+  if (filters.priority) params.set('priority', filters.priority)
+  if (filters.channel) params.set('channel', filters.channel)
+  const query = params.toString()
+  const response = await fetch(query ? `/api/tickets/stats?${query}` : '/api/tickets/stats')
+  if (!response.ok) {
+    throw new Error(`Failed to load ticket stats: ${response.status}`)
+  }
+  return response.json()
 }
 
 const COLORS = ['#0088FE', '#00C49F', '#FFBB28', '#FF8042', '#8884D8', '#82CA9D', '#FFC658', '#FF7C7C', '#8DD1E1']
 
-export function Charts({ tickets, isLoading }: ChartsProps) {
-  if (isLoading) {
+export function Charts() {
+  const { filters } = useUIStore()
+  const statsFilters: StatsFilters = {
+    topic: filters.topics,
+    sentiment: filters.sentiment,
+    priority: filters.priority,
+    channel: filters.channel,
+  }
+  // Keyed under TICKET_STATS_QUERY_KEY so stream invalidation refreshes every filter combination
+  const { data: stats, isLoading, error } = useQuery({
+    queryKey: [...TICKET_STATS_QUERY_KEY, statsFilters],
+    queryFn: () => fetchTicketStats(statsFilters),
+  })
+
+  if (isLoading || !stats) {
+    if (error) {
+      return (
+        <Card>
+          <CardContent className="p-6 text-center text-red-600">
+            Error loading ticket stats: {(error as Error).message}
+          </CardContent>
+        </Card>
+      )
+    }
     return (
       <div className="space-y-6">
         <Card>
@@ -35,41 +93,20 @@ export function Charts({ tickets, isLoading }: ChartsProps) {
     )
   }
 
-  // Prepare topic distribution data - handle both array and string formats
-  const topicCounts = tickets.reduce((acc, ticket) => {
-    if (!ticket.classification) return acc
-    
-    // Handle both old format (topics array) and new format (topic string)
-    if (Array.isArray(ticket.classification.topics)) {
-      // Old format with topics array
-      ticket.classification.topics.forEach(topic => {
-        acc[topic] = (acc[topic] || 0) + 1
-      })
-    } else if (ticket.classification.topic) {
-      // New format with single topic string
-      const topic = ticket.classification.topic
-      acc[topic] = (acc[topic] || 0) + 1
-    }
-    
-    return acc
-  }, {} as Record<string, number>)
-
-  const topicData = Object.entries(topicCounts).map(([topic, count]) => ({
+  // Topic distribution across the classified tickets matching the filters
+  const topicData = Object.entries(stats.counts.topic).map(([topic, count]) => ({
     name: topic,
     value: count
   }))
 
-  // Prepare sentiment distribution data
-  const sentimentCounts = tickets.reduce((acc, ticket) => {
-    const sentiment = ticket.classification?.sentiment || 'Unknown'
-    acc[sentiment] = (acc[sentiment] || 0) + 1
-    return acc
-  }, {} as Record<string, number>)
-
-  const sentimentData = Object.entries(sentimentCounts).map(([sentiment, count]) => ({
+  // Sentiment distribution; tickets still waiting for classification are shown as Pending
+  const sentimentData = Object.entries(stats.counts.sentiment).map(([sentiment, count]) => ({
     name: sentiment,
     count
   }))
+  if (stats.unclassified > 0) {
+    sentimentData.push({ name: 'Pending', count: stats.unclassified })
+  }
 
   return (
     <div className="space-y-6">
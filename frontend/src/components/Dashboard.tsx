@@ -1,6 +1,7 @@
 import { useState } from 'react'
 import { motion } from 'framer-motion'
 import { useTickets } from '@/lib/api'
+import { useTicketStream } from '@/lib/ticketStream'
 import { useUIStore } from '@/store/ui'
 import { TicketTable } from './TicketTable'
 import { Filters } from './Filters'
@@ -11,11 +12,13 @@ import { Card, CardContent, CardHeader, CardTitle } from '@/components/ui/card'
 
 export function Dashboard() {
   const { data: tickets, isLoading, error } = useTickets()
+  useTicketStream()
   const { filters } = useUIStore()
 
   // Filter tickets based on current filters
   const filteredTickets = tickets?.filter(ticket => {
-    if (!ticket.classification) return false
+    // Unclassified tickets (still queued for the background classifier) only fail label filters
+    if (!ticket.classification && (filters.topics.length > 0 || filters.sentiment || filters.priority)) return false
     
     // Topic filter - handle both array and string formats
     if (filters.topics.length > 0) {
@@ -114,7 +117,7 @@ export function Dashboard() {
           animate={{ opacity: 1, x: 0 }}
           transition={{ duration: 0.3, delay: 0.2 }}
         >
-          <Charts tickets={filteredTickets} isLoading={isLoading} />
+          <Charts />
         </motion.div>
       </div>
 
@@ -0,0 +1,60 @@
+import { useEffect } from 'react'
+import { useQueryClient } from '@tanstack/react-query'
+import { TICKET_STATS_QUERY_KEY } from '@/components/Charts'
+
+// Live ticket updates from GET /api/tickets/stream (Server-Sent Events).
+// Instead of refetching on a timer, the ticket list and stats queries are
+// invalidated when the backend reports a created or classified ticket, or a
+// 'resync' after this client fell behind. EventSource reconnects by itself and
+// sends Last-Event-ID, so the server replays whatever was missed meanwhile.
+
+const TICKETS_QUERY_KEY = ['tickets']
+const STREAM_EVENTS = ['ticket.created', 'ticket.classified', 'resync']
+
+// Bursts (e.g. the classification backfill) are coalesced into one refetch
+const INVALIDATE_DELAY_MS = 500
+
+// The server answers 503 when it has no room for another live client; the
+// browser does not retry a failed EventSource, so reopen it after a while
+const REOPEN_DELAY_MS = 30_000
+
+export function useTicketStream() {
+  const queryClient = useQueryClient()
+
+  useEffect(() => {
+    let source: EventSource | null = null
+    let invalidateTimer: ReturnType<typeof setTimeout> | undefined
+    let reopenTimer: ReturnType<typeof setTimeout> | undefined
+
+    const invalidate = () => {
+      if (invalidateTimer) return
+      invalidateTimer = setTimeout(() => {
+        invalidateTimer = undefined
+        queryClient.invalidateQueries({ queryKey: TICKETS_QUERY_KEY })
+        queryClient.invalidateQueries({ queryKey: TICKET_STATS_QUERY_KEY })
+      }, INVALIDATE_DELAY_MS)
+    }
+
+    const open = () => {
+      source = new EventSource('/api/tickets/stream')
+      STREAM_EVENTS.forEach(event => source!.addEventListener(event, invalidate))
+      source.onerror = () => {
+        if (source?.readyState === EventSource.CLOSED) {
+          source = null
+          reopenTimer = setTimeout(() => {
+            // Catch up on anything missed while disconnected
+            invalidate()
+            open()
+          }, REOPEN_DELAY_MS)
+        }
+      }
+    }
+
+    open()
+    return () => {
+      clearTimeout(invalidateTimer)
+      clearTimeout(reopenTimer)
+      source?.close()
+    }
+  }, [queryClient])
+}